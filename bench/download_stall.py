@@ -0,0 +1,96 @@
+# bench/download_stall.py
+"""
+Event-loop stall benchmark for downloading a 4-image !flux result.
+
+Serves N fake outputs of a given size from a throttled local HTTP server and
+compares the old path (FileOutput.read() on the loop, one after another) with
+utils.downloads.download_all().
+
+    python -m bench.download_stall --outputs 4 --size-mb 2 --mbps 40
+"""
+import time
+import asyncio
+import argparse
+import threading
+import replicate
+from aiohttp import web
+from replicate.helpers import FileOutput
+from utils import downloads
+
+TICK = 0.01
+
+def start_server(size, mbps):
+    payload = b"\x89PNG" + b"\0" * (size - 4)
+    chunk = 64 * 1024
+    delay = chunk / (mbps * 1024 * 1024 / 8)
+    ready = threading.Event()
+    state = {}
+
+    async def output(request):
+        response = web.StreamResponse(headers={"Content-Length": str(size)})
+        await response.prepare(request)
+        for offset in range(0, size, chunk):
+            await response.write(payload[offset:offset + chunk])
+            await asyncio.sleep(delay)
+        return response
+
+    async def serve():
+        app = web.Application()
+        app.router.add_get("/out/{n}", output)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        state["port"] = site._server.sockets[0].getsockname()[1]
+        ready.set()
+        await asyncio.Event().wait()
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    ready.wait()
+    return state["port"]
+
+async def measure(fn):
+    loop = asyncio.get_running_loop()
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            expected = loop.time() + TICK
+            await asyncio.sleep(TICK)
+            lags.append(max(0.0, loop.time() - expected))
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(TICK * 2)
+    start = time.perf_counter()
+    await fn()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    return elapsed, sum(lags), max(lags)
+
+async def main(outputs, size_mb, mbps):
+    port = start_server(int(size_mb * 1024 * 1024), mbps)
+    urls = [f"http://127.0.0.1:{port}/out/{n}" for n in range(outputs)]
+    client = replicate.Client(api_token="unused")
+
+    async def old_path():
+        for url in urls:
+            FileOutput(url, client).read()
+
+    async def new_path():
+        await downloads.download_all(urls)
+
+    print(f"{outputs} outputs x {size_mb} MB at {mbps} Mbit/s each")
+    for name, fn in (("read() on loop", old_path), ("download_all", new_path)):
+        elapsed, stalled, worst = await measure(fn)
+        print(f"{name:16} wall {elapsed:6.2f}s  loop stalled {stalled:6.2f}s  worst stall {worst * 1000:7.1f} ms")
+    await downloads.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outputs", type=int, default=4)
+    parser.add_argument("--size-mb", type=float, default=2.0)
+    parser.add_argument("--mbps", type=float, default=40.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.outputs, args.size_mb, args.mbps))
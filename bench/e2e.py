@@ -0,0 +1,304 @@
+# bench/e2e.py
+"""
+End-to-end benchmark: the real bot and cogs against an in-process fake
+Replicate (bench/fake_replicate.py) and fake Discord channels
+(bench/fake_discord.py). Runs entirely offline.
+
+Each command runs as its own phase: --invocations calls spread over --users
+users, at most --concurrency at once, with unique prompts so the caches do
+not answer for the models. Reported per command:
+
+    cmd/s        throughput over the phase
+    p50/p95/p99  command latency (invocation to return)
+    ttfi         time to first image: invocation to the first message with a file
+    lag          event-loop lag of a 10 ms ticker (p99 and max)
+    rss          peak resident memory during the phase
+    calls        Discord API calls (send/edit/delete) per command
+
+    python -m bench.e2e
+    python -m bench.e2e --commands flux,multigen --invocations 100 --latency 2.0
+    python -m bench.e2e --json results.json
+    python -m bench.e2e --baseline results.json     # exit 1 if p95 or ttfi p95 regressed
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import resource
+
+# The store opens DATABASE_PATH at import time; never touch the real database.
+_tmp = tempfile.TemporaryDirectory(prefix="bench-e2e-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmp.name, "bench.db")
+os.environ.setdefault("REPLICATE_API_TOKEN", "fake")
+os.environ.pop("WEBHOOK_BASE_URL", None)
+
+from bench.fake_replicate import FakeReplicate
+from bench.fake_discord import FakeAttachment, FakeChannel, FakeContext, FakeGuild, bind
+from utils import downloads
+from utils.storage import store
+from utils.model_registry import registry, prewarm_models
+from utils.cancellation import tracker
+from utils.tracing import recorder
+from utils.journal import journal
+from bot import bot, initial_cogs
+
+TICK = 0.01
+
+# Command text per command; {n} makes every invocation's prompt unique.
+COMMANDS = {
+    "gpt": "a lighthouse in a storm {n}",
+    "refine": "prompt[1] make it dusk {n}",
+    "flux": "a fox in the snow {n} 2",
+    "fluxpro": "a glass city at noon {n}",
+    "sdxl": "a bowl of cherries {n}",
+    "stable35": "a paper boat {n}",
+    "imagen": "a red bicycle {n}",
+    "recraftv3": "a mountain cabin {n}",
+    "playground": "a koi pond {n}",
+    "multigen": "an owl at night {n}",
+    "video": "waves at dawn {n} image[1]",
+    "audio": "rain on a tin roof {n} video[1]",
+    "addprompt": "a quiet harbour {n}",
+    "uploadimage": "",
+    "uploadvideo": "",
+    "listimages": "",
+    "listprompts": "",
+    "listvideos": "",
+}
+DEFAULT_COMMANDS = "gpt,refine,flux,multigen,audio,uploadimage,listimages"
+
+# Content type of the attachment for commands that read ctx.message.attachments.
+ATTACHMENTS = {
+    "uploadimage": "image/png",
+    "uploadvideo": "video/mp4",
+}
+
+def rss():
+    """Current resident set size in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+class Probe:
+    """Samples event-loop lag every tick, and RSS (see sample) every tenth, in the background."""
+
+    def __init__(self):
+        self.lags = []
+        self.peak_rss = 0
+        self._task = None
+
+    def reset(self):
+        self.lags = []
+        self.peak_rss = rss()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        ticks = 0
+        while True:
+            expected = loop.time() + TICK
+            await asyncio.sleep(TICK)
+            self.lags.append(max(0.0, loop.time() - expected))
+            ticks += 1
+            if ticks % 10 == 0:
+                self.sample()
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, rss())
+
+    def start(self):
+        self.reset()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        self._task.cancel()
+
+class Sample:
+    def __init__(self, started, finished, first_file_at, failed, calls):
+        self.latency = finished - started
+        self.ttfi = first_file_at - started if first_file_at is not None else None
+        self.failed = failed
+        self.calls = calls
+
+def attachments_for(name, base, content_types=None):
+    """Attachments for an invocation: the given content types, or the command's usual upload."""
+    if content_types is None:
+        content_types = [ATTACHMENTS[name]] if name in ATTACHMENTS else []
+    return [
+        FakeAttachment(f"{base}/upload/{n}", f"upload{n}.{content_type.split('/')[-1]}", content_type)
+        for n, content_type in enumerate(content_types)
+    ]
+
+async def invoke(name, user_id, text, content_types=None, channel=None, **channel_options):
+    """
+    Run one command the way the bot would (with its invoke hooks) and time it.
+    Each invocation gets its own channel (unless given one), so its Discord
+    calls can be counted.
+    """
+    command = bot.get_command(name)
+    channel = channel or FakeChannel(**channel_options)
+    ctx = FakeContext(user_id, channel, name, f"!{name} {text}",
+                      attachments_for(name, channel.attachment_base, content_types), cog=command.cog)
+    args, kwargs = bind(command, ctx, text)
+    started = time.perf_counter()
+    tracker.start(ctx)
+    recorder.start(ctx)
+    failed = False
+    try:
+        await command.callback(*args, **kwargs)
+    except Exception as e:
+        logging.getLogger(__name__).warning("!%s failed: %r", name, e)
+        failed = True
+    finally:
+        ctx.command_failed = failed
+        await journal.forget(ctx)
+        recorder.finish(ctx)
+        tracker.finish(ctx)
+    finished = time.perf_counter()
+    # The cogs report their own errors in the channel rather than raising.
+    failed = failed or any(
+        m.content.startswith(("Error", "An error")) or "Error:" in m.content for m in ctx.sent
+    )
+    return Sample(started, finished, ctx.first_file_at, failed, sum(channel.calls.values()))
+
+async def seed(users, **channel_options):
+    """Give every user a stored prompt, image and video for the commands that need one."""
+    for user_id in range(1, users + 1):
+        for name, text in (("addprompt", "a quiet harbour"), ("uploadimage", ""), ("uploadvideo", "")):
+            await invoke(name, user_id, text, **channel_options)
+
+async def phase(name, invocations, users, concurrency, probe, run_id, **channel_options):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            text = COMMANDS[name].format(n=f"{run_id}-{i}")
+            return await invoke(name, 1 + i % users, text, **channel_options)
+
+    probe.reset()
+    started = time.perf_counter()
+    samples = await asyncio.gather(*(one(i) for i in range(invocations)))
+    elapsed = time.perf_counter() - started
+    latencies = [s.latency for s in samples]
+    ttfis = [s.ttfi for s in samples if s.ttfi is not None]
+    return {
+        "invocations": invocations,
+        "failed": sum(s.failed for s in samples),
+        "throughput": invocations / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "ttfi_p50": percentile(ttfis, 50) if ttfis else None,
+        "ttfi_p95": percentile(ttfis, 95) if ttfis else None,
+        "lag_p99": percentile(probe.lags, 99),
+        "lag_max": max(probe.lags, default=0.0),
+        "peak_rss": probe.peak_rss,
+        "calls": sum(s.calls for s in samples) / invocations,
+    }
+
+def report(results):
+    print(f"{'command':12} {'n':>5} {'fail':>5} {'cmd/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} "
+          f"{'ttfi50':>7} {'ttfi95':>7} {'lag99':>8} {'lagmax':>8} {'rss':>7} {'calls':>6}")
+
+    def seconds(value):
+        return f"{value:6.2f}s" if value is not None else "      -"
+
+    for name, r in results.items():
+        print(f"{name:12} {r['invocations']:5d} {r['failed']:5d} {r['throughput']:7.2f} "
+              f"{seconds(r['p50'])} {seconds(r['p95'])} {seconds(r['p99'])} "
+              f"{seconds(r['ttfi_p50'])} {seconds(r['ttfi_p95'])} "
+              f"{r['lag_p99'] * 1000:6.1f}ms {r['lag_max'] * 1000:6.1f}ms "
+              f"{r['peak_rss'] / 2**20:5.0f}MB {r['calls']:6.1f}")
+
+def regressions(results, baseline, tolerance):
+    """Commands whose p95 or time-to-first-image p95 is worse than baseline by more than tolerance."""
+    found = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("p95", "ttfi_p95"):
+            if r.get(key) is not None and base.get(key) and r[key] > base[key] * (1 + tolerance):
+                found.append(f"{name} {key}: {base[key]:.2f}s -> {r[key]:.2f}s")
+    return found
+
+async def main(args):
+    rng = random.Random(args.seed)
+
+    def latency(model):
+        return args.latency * rng.uniform(1 - args.jitter, 1 + args.jitter)
+
+    server = await FakeReplicate(latency=latency, output_size=args.output_size).start()
+    # The replicate client reads this when it first connects.
+    os.environ["REPLICATE_BASE_URL"] = server.url
+    channel_options = {"guild": FakeGuild(), "latency": args.discord_latency,
+                       "attachment_base": f"{server.url}/files"}
+    probe = Probe()
+    try:
+        for cog in initial_cogs:
+            await bot.load_extension(cog)
+        await registry.warm(prewarm_models)
+        await seed(args.users, **channel_options)
+        probe.start()
+        results = {}
+        run_id = time.time_ns()
+        for name in args.commands.split(","):
+            if name not in COMMANDS:
+                raise SystemExit(f"Unknown command {name!r}; choose from {', '.join(COMMANDS)}")
+            results[name] = await phase(name, args.invocations, args.users, args.concurrency,
+                                        probe, run_id, **channel_options)
+        probe.stop()
+    finally:
+        await recorder.close()
+        await registry.close()
+        await downloads.close()
+        await store.close()
+        await server.stop()
+
+    print(f"fake model latency {args.latency:.2f}s ±{args.jitter:.0%}, outputs {args.output_size} bytes, "
+          f"Discord latency {args.discord_latency * 1000:.0f} ms, "
+          f"{args.users} users, concurrency {args.concurrency}")
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print("REGRESSION", line)
+        return 1 if found else 0
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", default=DEFAULT_COMMANDS)
+    parser.add_argument("--invocations", type=int, default=50)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=1.0, help="fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="fraction of random latency variation")
+    parser.add_argument("--output-size", type=int, default=256 * 1024, help="bytes per output file")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="seconds per Discord API call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare with results written by --json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression over the baseline")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, force=True)
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        _tmp.cleanup()
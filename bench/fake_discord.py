@@ -0,0 +1,183 @@
+# bench/fake_discord.py
+"""
+Just enough of discord.py's Context, Message and channel for the cogs to run
+offline. Every send, edit and delete takes a configurable latency (the round
+trip to Discord) and is recorded, so benchmarks can see when a command
+posted its first file and how much it talked to Discord.
+
+Attachment URLs point at attachment_base (e.g. a FakeReplicate server's
+/files route) so anything that downloads them gets a real response.
+"""
+import time
+import asyncio
+import inspect
+import itertools
+
+DEFAULT_FILESIZE_LIMIT = 25 * 1024 * 1024
+UPLOAD_CHUNK = 64 * 1024
+
+_ids = itertools.count(1)
+
+class FakeAttachment:
+    def __init__(self, url, filename, content_type):
+        self.url = url
+        self.filename = filename
+        self.content_type = content_type
+
+class FakeAuthor:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.bot = False
+
+class FakeGuild:
+    def __init__(self, filesize_limit=DEFAULT_FILESIZE_LIMIT):
+        self.id = next(_ids)
+        self.filesize_limit = filesize_limit
+
+class FakeCommand:
+    def __init__(self, name):
+        self.name = name
+        self.qualified_name = name
+
+class RateLimit:
+    """
+    Calls allowed per second across every channel that shares it, like
+    Discord's global rate limit (50 requests per second per bot). Records how
+    long each call waited for a slot.
+    """
+
+    def __init__(self, rate=50):
+        self.rate = rate
+        self.waits = []
+        self._next = 0.0
+
+    async def acquire(self):
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next)
+        self._next = slot + 1 / self.rate
+        self.waits.append(slot - now)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+class FakeMessage:
+    def __init__(self, channel, content="", files=(), attachments=None, author=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.author = author
+        self.content = content or ""
+        if attachments is None:
+            attachments = [
+                FakeAttachment(f"{channel.attachment_base}/{self.id}/{n}", f.filename, "image/png")
+                for n, f in enumerate(files)
+            ]
+        self.attachments = attachments
+        self.deleted = False
+
+    async def edit(self, **kwargs):
+        await self.channel._call("edit")
+        if "content" in kwargs:
+            self.content = kwargs["content"] or ""
+
+    async def delete(self):
+        await self.channel._call("delete")
+        self.deleted = True
+
+class FakeChannel:
+    """
+    latency:         seconds per Discord API call
+    attachment_base: URL prefix for the attachments of messages sent here
+    limit:           a RateLimit shared with other channels, or None
+    """
+
+    def __init__(self, guild=None, latency=0.05, attachment_base="https://cdn.discordapp.invalid/attachments",
+                 limit=None):
+        self.id = next(_ids)
+        self.guild = guild
+        self.latency = latency
+        self.limit = limit
+        self.attachment_base = attachment_base.rstrip("/")
+        self.messages = []
+        self.calls = {"send": 0, "edit": 0, "delete": 0}
+        self.bytes_sent = 0
+
+    async def _call(self, kind):
+        self.calls[kind] += 1
+        if self.limit is not None:
+            await self.limit.acquire()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send(self, content=None, *, file=None, files=None, author=None, **kwargs):
+        files = list(files or ([file] if file is not None else []))
+        await self._call("send")
+        # Read every file through, chunk by chunk, as the upload would.
+        for f in files:
+            while chunk := f.fp.read(UPLOAD_CHUNK):
+                self.bytes_sent += len(chunk)
+                await asyncio.sleep(0)
+            f.close()
+        message = FakeMessage(self, content, files, author=author)
+        self.messages.append(message)
+        return message
+
+class FakeClient:
+    """The parts of the bot (a discord.Client) that look channels up by id."""
+
+    def __init__(self, channels=()):
+        self.channels = {channel.id: channel for channel in channels}
+
+    async def wait_until_ready(self):
+        pass
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id):
+        raise LookupError(f"Unknown channel {channel_id}")
+
+class FakeContext:
+    """
+    A command invocation: ctx.author, ctx.message (with optional attachments),
+    ctx.guild, ctx.channel, ctx.command, ctx.cog and ctx.send. Records when it
+    first posted a file (first_file_at) and how many messages it sent.
+    """
+
+    def __init__(self, user_id, channel, command_name, content="", attachments=(), cog=None):
+        self.author = FakeAuthor(user_id)
+        self.cog = cog
+        self.channel = channel
+        self.guild = channel.guild
+        self.command = FakeCommand(command_name)
+        self.message = FakeMessage(channel, content, attachments=list(attachments), author=self.author)
+        self.sent = []
+        self.first_file_at = None
+
+    async def send(self, content=None, **kwargs):
+        message = await self.channel.send(content, **kwargs)
+        self.sent.append(message)
+        if self.first_file_at is None and (kwargs.get("files") or kwargs.get("file")):
+            self.first_file_at = time.perf_counter()
+        return message
+
+def bind(command, ctx, text):
+    """
+    Turn a command's text (what follows "!name ") into callback arguments the
+    way discord.py does for this repo's signatures: a word per positional
+    parameter, the remaining words for *args, the remaining text for a
+    keyword-only parameter.
+    """
+    args, kwargs = [], {}
+    rest = text.strip()
+    for name, param in command.clean_params.items():
+        if param.kind == inspect.Parameter.KEYWORD_ONLY:
+            kwargs[name] = rest
+            rest = ""
+        elif param.kind == inspect.Parameter.VAR_POSITIONAL:
+            args.extend(rest.split())
+            rest = ""
+        elif rest:
+            word, _, rest = rest.partition(" ")
+            args.append(word)
+            rest = rest.strip()
+    return (command.cog, ctx, *args), kwargs
@@ -0,0 +1,254 @@
+# bench/fake_replicate.py
+"""
+A local stand-in for the parts of the Replicate HTTP API the bot uses.
+
+Predictions "run" for a configurable latency, logging tqdm-style progress
+while they do, and then succeed with output files served by the same server.
+When a prediction is created with a webhook, the completed prediction is
+POSTed to it, signed like Replicate signs them.
+
+    python -m bench.fake_replicate --port 5001 --latency 2.0
+
+then run the bot (or a benchmark) with
+
+    REPLICATE_BASE_URL=http://127.0.0.1:5001 REPLICATE_API_TOKEN=fake
+    REPLICATE_WEBHOOK_SECRET=whsec_ZmFrZQ==       # when using WEBHOOK_BASE_URL
+
+In-process use: `server = FakeReplicate(latency=1.0); await server.start()`.
+"""
+import hmac
+import json
+import time
+import uuid
+import base64
+import asyncio
+import argparse
+import datetime
+from hashlib import sha256
+from aiohttp import web, ClientSession
+
+SECRET = "whsec_" + base64.b64encode(b"fake").decode()
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 1024
+TEXT = "A vivid, cinematic scene lit by a low golden sun, rich in texture and detail."
+TEXT_MODELS = ("llama", "claude", "gpt")
+SINGLE_FILE_MODELS = ("mmaudio", "kling", "imagen", "recraft", "ultra")
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+def sign(secret, webhook_id, timestamp, body):
+    """Signature header value for a webhook body, in Replicate's scheme."""
+    key = base64.b64decode(secret.split("_", 1)[1])
+    digest = hmac.new(key, f"{webhook_id}.{timestamp}.{body}".encode(), sha256).digest()
+    return "v1," + base64.b64encode(digest).decode()
+
+class FakeReplicate:
+    """
+    latency:     seconds (or a callable(model) -> seconds) before a prediction completes
+    startup:     fraction of that spent "starting" (or a callable(model, latency) -> seconds)
+    outputs:     output files per prediction (or the input's num_outputs, if given)
+    output_size: bytes per output file
+    fail_rate:   fraction of predictions that fail
+
+    Language models (names containing one of TEXT_MODELS) output streamed
+    text tokens instead of files, and SINGLE_FILE_MODELS output one file URL
+    rather than a list, like the real ones.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=1.0, startup=0.1, outputs=1,
+                 output_size=len(PNG), fail_rate=0.0, secret=SECRET):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.startup = startup
+        self.outputs = outputs
+        self.payload = PNG[:output_size].ljust(output_size, b"\0")
+        self.fail_rate = fail_rate
+        self.secret = secret
+        self.predictions = {}
+        self._version_models = {}    # version id -> model, learned from version lookups
+        self.created = 0
+        self.canceled = 0
+        self.webhooks_sent = 0
+        self._timers = {}
+        self._start_timers = {}
+        self._started = {}
+        self._runner = None
+        self._session = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/predictions", self.create_prediction)
+        app.router.add_post("/v1/models/{owner}/{name}/predictions", self.create_prediction)
+        app.router.add_get("/v1/predictions/{id}", self.get_prediction)
+        app.router.add_post("/v1/predictions/{id}/cancel", self.cancel_prediction)
+        app.router.add_get("/v1/models/{owner}/{name}", self.get_model)
+        app.router.add_get("/v1/models/{owner}/{name}/versions/{version}", self.get_version)
+        app.router.add_get("/v1/webhooks/default/secret", self.get_secret)
+        app.router.add_get("/files/{id}/{n}", self.get_file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._session = ClientSession()
+        return self
+
+    async def stop(self):
+        for timer in [*self._timers.values(), *self._start_timers.values()]:
+            timer.cancel()
+        if self._session is not None:
+            await self._session.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _latency(self, model):
+        return self.latency(model) if callable(self.latency) else self.latency
+
+    def _startup(self, model, latency):
+        return self.startup(model, latency) if callable(self.startup) else self.startup * latency
+
+    async def create_prediction(self, request):
+        body = await request.json()
+        if "owner" in request.match_info:
+            model = f"{request.match_info['owner']}/{request.match_info['name']}"
+            version = "latest"
+        else:
+            version = body["version"]
+            model = self._version_models.get(version, f"fake/{version[:8]}")
+        prediction_id = uuid.uuid4().hex
+        count = int(body.get("input", {}).get("num_outputs", self.outputs))
+        latency = self._latency(model)
+        prediction = {
+            "id": prediction_id, "model": model, "version": version,
+            "status": "starting", "input": body.get("input", {}), "output": None,
+            "logs": "", "error": None, "metrics": {},
+            "created_at": _now(), "started_at": None, "completed_at": None,
+            "urls": {
+                "get": f"{self.url}/v1/predictions/{prediction_id}",
+                "cancel": f"{self.url}/v1/predictions/{prediction_id}/cancel",
+            },
+        }
+        self.predictions[prediction_id] = prediction
+        self._started[prediction_id] = (time.monotonic(), latency)
+        self.created += 1
+        loop = asyncio.get_running_loop()
+        self._start_timers[prediction_id] = loop.call_later(
+            min(latency, self._startup(model, latency)), self._start, prediction_id
+        )
+        self._timers[prediction_id] = loop.call_later(
+            latency, self._complete, prediction_id, count, body.get("webhook")
+        )
+        return web.json_response(prediction, status=201)
+
+    def _start(self, prediction_id):
+        self._start_timers.pop(prediction_id, None)
+        prediction = self.predictions[prediction_id]
+        if prediction["status"] == "starting":
+            prediction["status"] = "processing"
+            prediction["started_at"] = _now()
+
+    def _complete(self, prediction_id, count, webhook):
+        self._timers.pop(prediction_id, None)
+        prediction = self.predictions[prediction_id]
+        prediction["started_at"] = prediction["started_at"] or _now()
+        prediction["completed_at"] = _now()
+        if self.fail_rate and (hash(prediction_id) % 1000) < self.fail_rate * 1000:
+            prediction["status"] = "failed"
+            prediction["error"] = "Fake model failure"
+        else:
+            prediction["status"] = "succeeded"
+            if any(name in prediction["model"] for name in TEXT_MODELS):
+                prediction["output"] = [word + " " for word in TEXT.split()]
+            elif any(name in prediction["model"] for name in SINGLE_FILE_MODELS):
+                prediction["output"] = f"{self.url}/files/{prediction_id}/0"
+            else:
+                prediction["output"] = [f"{self.url}/files/{prediction_id}/{n}" for n in range(count)]
+        if webhook:
+            asyncio.create_task(self._send_webhook(webhook, prediction))
+
+    async def _send_webhook(self, url, prediction):
+        body = json.dumps(prediction)
+        webhook_id = f"msg_{uuid.uuid4().hex}"
+        timestamp = str(int(time.time()))
+        headers = {
+            "content-type": "application/json",
+            "webhook-id": webhook_id,
+            "webhook-timestamp": timestamp,
+            "webhook-signature": sign(self.secret, webhook_id, timestamp, body),
+        }
+        try:
+            async with self._session.post(url, data=body, headers=headers) as response:
+                response.raise_for_status()
+            self.webhooks_sent += 1
+        except Exception as e:
+            print(f"fake replicate: webhook to {url} failed: {e}")
+
+    async def get_prediction(self, request):
+        prediction = self.predictions.get(request.match_info["id"])
+        if prediction is None:
+            return web.json_response({"detail": "Not found"}, status=404)
+        if prediction["status"] == "processing":
+            started, latency = self._started[prediction["id"]]
+            done = min(1.0, (time.monotonic() - started) / latency) if latency else 1.0
+            steps = int(done * 28)
+            prediction["logs"] = f"{int(done * 100)}%|{'#' * (steps // 3):<10}| {steps}/28 [00:01<00:01]\n"
+        return web.json_response(prediction)
+
+    async def cancel_prediction(self, request):
+        prediction = self.predictions.get(request.match_info["id"])
+        if prediction is None:
+            return web.json_response({"detail": "Not found"}, status=404)
+        start_timer = self._start_timers.pop(prediction["id"], None)
+        if start_timer is not None:
+            start_timer.cancel()
+        timer = self._timers.pop(prediction["id"], None)
+        if timer is not None:
+            timer.cancel()
+            prediction["status"] = "canceled"
+            prediction["completed_at"] = _now()
+            self.canceled += 1
+        return web.json_response(prediction)
+
+    def _version(self, version_id):
+        return {"id": version_id, "created_at": _now(), "cog_version": "0.9.0", "openapi_schema": {}}
+
+    async def get_model(self, request):
+        owner, name = request.match_info["owner"], request.match_info["name"]
+        return web.json_response({
+            "url": f"{self.url}/{owner}/{name}", "owner": owner, "name": name,
+            "description": None, "visibility": "public", "github_url": None,
+            "paper_url": None, "license_url": None, "run_count": 0,
+            "cover_image_url": None, "default_example": None,
+            "latest_version": self._version("latest"),
+        })
+
+    async def get_version(self, request):
+        version = request.match_info["version"]
+        self._version_models[version] = f"{request.match_info['owner']}/{request.match_info['name']}"
+        return web.json_response(self._version(version))
+
+    async def get_secret(self, request):
+        return web.json_response({"key": self.secret})
+
+    async def get_file(self, request):
+        return web.Response(body=self.payload, content_type="image/png")
+
+async def main(port, latency):
+    server = await FakeReplicate(port=port, latency=latency).start()
+    print(f"fake replicate listening on {server.url} (webhook secret {server.secret})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.port, args.latency))
@@ -0,0 +1,109 @@
+# bench/hedging.py
+"""
+Hedged predictions (utils/hedging.py) against the fake backends. !flux runs
+on a fake flux-schnell with a cold-start tail: --tail-rate of predictions
+take --tail seconds instead of --latency, most of it "starting". A first
+phase runs with no hedge budget (and gives the policy its latency samples),
+a second with the given budget. Reported per phase: the e2e.py columns, predictions created
+per command, hedges launched and won, and losers cancelled.
+
+    python -m bench.hedging
+    python -m bench.hedging --invocations 200 --tail-rate 0.05 --budget 0.05
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+from bench import e2e
+from bench.e2e import bot, initial_cogs, seed, phase, report, Probe
+from bench.fake_replicate import FakeReplicate
+from bench.fake_discord import FakeGuild
+from utils import downloads, postprocess, hedging
+from utils.storage import store
+from utils.model_registry import registry, prewarm_models
+
+MODEL = "black-forest-labs/flux-schnell"
+
+def _count(counter):
+    return sum(counter._values.values())
+
+async def main(args):
+    rng = random.Random(args.seed)
+
+    def latency(model):
+        if model == MODEL and rng.random() < args.tail_rate:
+            return args.tail
+        return args.latency * rng.uniform(0.8, 1.2)
+
+    def startup(model, seconds):
+        # A cold start spends its extra time starting.
+        return seconds - args.latency if seconds >= args.tail else 0.1 * seconds
+
+    server = await FakeReplicate(latency=latency, startup=startup).start()
+    os.environ["REPLICATE_BASE_URL"] = server.url
+    channel_options = {"guild": FakeGuild(), "latency": args.discord_latency,
+                       "attachment_base": f"{server.url}/files"}
+    policy = hedging.policy
+    policy.models = {MODEL: args.quantile}
+    probe = Probe()
+    results, extra = {}, {}
+    try:
+        for cog in initial_cogs:
+            await bot.load_extension(cog)
+        await registry.warm(prewarm_models)
+        await seed(args.users, **channel_options)
+        probe.start()
+        run_id = time.time_ns()
+        for label, budget, burst in (("unhedged", 0, 0), ("hedged", args.budget, args.burst)):
+            # The unhedged phase's latencies are the hedged phase's samples.
+            policy.budget, policy.burst = budget, burst
+            policy._tokens.clear()
+            created, hedges, wins = server.created, _count(hedging.HEDGES), _count(hedging.HEDGE_WINS)
+            canceled = server.canceled
+            results[label] = await phase("flux", args.invocations, args.users, args.concurrency,
+                                         probe, f"{run_id}-{label}", **channel_options)
+            await asyncio.sleep(0.5)    # let the losers' cancel requests land
+            extra[label] = (
+                (server.created - created) / args.invocations,
+                _count(hedging.HEDGES) - hedges, _count(hedging.HEDGE_WINS) - wins,
+                server.canceled - canceled, policy.start_delay(MODEL), policy.delay(MODEL),
+            )
+        probe.stop()
+    finally:
+        await registry.close()
+        await downloads.close()
+        postprocess.close()
+        await store.close()
+        await server.stop()
+
+    print(f"fake flux-schnell latency {args.latency:.2f}s, {args.tail_rate:.0%} of predictions {args.tail:.1f}s; "
+          f"hedging at p{args.quantile * 100:g}, budget {args.budget:g}/prediction (burst {args.burst:g})")
+    report(results)
+    print(f"{'phase':12} {'pred/cmd':>8} {'hedges':>7} {'wins':>5} {'cancelled':>9} {'start by':>9} {'finish by':>9}")
+    for label, (per_command, hedges, wins, canceled, start_after, after) in extra.items():
+        start_after, after = (f"{d:8.2f}s" if d is not None else "        -" for d in (start_after, after))
+        print(f"{label:12} {per_command:8.2f} {hedges:7d} {wins:5d} {canceled:9d} {start_after} {after}")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invocations", type=int, default=100)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=1.0, help="usual fake model latency in seconds")
+    parser.add_argument("--tail", type=float, default=8.0, help="cold-start latency in seconds")
+    parser.add_argument("--tail-rate", type=float, default=0.05, help="fraction of cold starts")
+    parser.add_argument("--quantile", type=float, default=hedging.HEDGE_QUANTILE)
+    parser.add_argument("--budget", type=float, default=hedging.HEDGE_BUDGET)
+    parser.add_argument("--burst", type=float, default=hedging.HEDGE_BURST)
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="seconds per Discord API call")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, force=True)
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        e2e._tmp.cleanup()
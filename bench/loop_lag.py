@@ -0,0 +1,118 @@
+# bench/loop_lag.py
+"""
+Loop-lag benchmark for !gpt.
+
+Runs N concurrent PromptCog.gpt invocations against a simulated Replicate
+latency and measures how late a 50 ms "heartbeat" ticker fires and how long a
+trivial command takes to respond while they are in flight.
+
+    python -m bench.loop_lag --calls 20 --latency 2.0
+    python -m bench.loop_lag --calls 20 --latency 2.0 --blocking
+
+--blocking reproduces the old behaviour (replicate.run called directly on the
+event loop) for comparison. Exits 1 if any !gpt call failed.
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from utils import predictions
+import cogs.prompt_gen as prompt_gen
+from cogs.prompt_gen import PromptCog
+
+TICK = 0.05
+
+class FakeMessage:
+    def __init__(self, content=""):
+        self.content = content or ""
+
+    async def edit(self, **kwargs):
+        if "content" in kwargs:
+            self.content = kwargs["content"] or ""
+
+    async def delete(self):
+        pass
+
+class FakeAuthor:
+    def __init__(self, user_id):
+        self.id = user_id
+
+class FakeContext:
+    def __init__(self, user_id):
+        self.author = FakeAuthor(user_id)
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        message = FakeMessage(content)
+        self.sent.append(message)
+        return message
+
+    def failed(self):
+        # !gpt reports errors by editing its status message.
+        return any("failed" in message.content for message in self.sent)
+
+async def heartbeat(lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, loop.time() - expected))
+
+async def other_command(latencies, stop):
+    # Stand-in for an unrelated command (e.g. !listprompts) that should answer instantly.
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.1)
+
+async def main(calls, latency, blocking):
+    # Accept whatever else predictions.run() takes (on_create, hedge, ...).
+    async def fake_run(target, model_input, on_update=None, **kwargs):
+        await asyncio.sleep(latency)
+        return ["a vivid scene"]
+
+    async def blocking_run_llm(ref, model_input):
+        time.sleep(latency)
+        return "a vivid scene"
+
+    predictions.run = fake_run
+    if blocking:
+        prompt_gen.run_llm = blocking_run_llm
+
+    cog = PromptCog(bot=None)
+    lags, latencies = [], []
+    stop = asyncio.Event()
+    probes = [asyncio.create_task(heartbeat(lags, stop)), asyncio.create_task(other_command(latencies, stop))]
+
+    start = time.perf_counter()
+    # Distinct concepts, so the LLM memo and single-flight don't collapse the calls.
+    run_id = time.time_ns()
+    contexts = [FakeContext(i) for i in range(calls)]
+    results = await asyncio.gather(
+        *(PromptCog.gpt.callback(cog, ctx, concept=f"a cyberpunk city {run_id}-{i}") for i, ctx in enumerate(contexts)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    failed = sum(isinstance(result, Exception) or ctx.failed() for ctx, result in zip(contexts, results))
+    stop.set()
+    await asyncio.gather(*probes)
+
+    lags.sort()
+    print(f"mode: {'blocking' if blocking else 'async'}  calls: {calls}  simulated latency: {latency:.2f}s")
+    print(f"wall time:            {elapsed:.2f}s")
+    print(f"heartbeat ticks:      {len(lags)}")
+    print(f"heartbeat lag p50:    {statistics.median(lags) * 1000:.1f} ms")
+    print(f"heartbeat lag max:    {lags[-1] * 1000:.1f} ms")
+    print(f"other command max:    {max(latencies) * 1000:.1f} ms")
+    print(f"failed calls:         {failed}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--blocking", action="store_true")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.calls, args.latency, args.blocking)))
@@ -0,0 +1,98 @@
+# bench/output_memory.py
+"""
+Peak-RSS benchmark for model outputs: --multigens concurrent !multigen runs
+(six models each) with --output-size byte outputs, against the fake backends.
+
+Reports resident memory before and at its peak, the most output bytes held at
+once (utils/buffers.py budget) and how many downloads had to wait for room.
+
+    python -m bench.output_memory --multigens 10 --output-size 8000000
+    python -m bench.output_memory --spool 0 --budget 0       # everything in memory, no budget
+
+--spool and --budget override SPOOL_MAX_MEMORY and OUTPUT_BYTES_BUDGET (0 =
+unlimited).
+"""
+import os
+import gc
+import sys
+import time
+import asyncio
+import logging
+import argparse
+
+def configure(args):
+    # utils/buffers.py reads these at import time.
+    unlimited = str(2 ** 62)
+    os.environ["SPOOL_MAX_MEMORY"] = str(args.spool) if args.spool else unlimited
+    os.environ["OUTPUT_BYTES_BUDGET"] = str(args.budget) if args.budget else unlimited
+
+async def main(args):
+    from bench import e2e
+    from bench.fake_replicate import FakeReplicate
+    from bench.fake_discord import FakeGuild
+    from utils import downloads
+    from utils.storage import store
+    from utils.buffers import budget
+    from utils.model_registry import registry, prewarm_models
+
+    server = await FakeReplicate(latency=args.latency, output_size=args.output_size).start()
+    os.environ["REPLICATE_BASE_URL"] = server.url
+    channel_options = {"guild": FakeGuild(filesize_limit=100 * 1024 * 1024), "latency": args.discord_latency,
+                       "attachment_base": f"{server.url}/files"}
+    probe = e2e.Probe()
+    waits = 0
+    try:
+        for cog in e2e.initial_cogs:
+            await e2e.bot.load_extension(cog)
+        await registry.warm(prewarm_models)
+        gc.collect()
+        baseline = e2e.rss()
+        probe.start()
+
+        async def count_waits():
+            nonlocal waits
+            while True:
+                waits = max(waits, budget.waiting)
+                await asyncio.sleep(0.01)
+
+        counter = asyncio.create_task(count_waits())
+        started = time.perf_counter()
+        run_id = time.time_ns()
+        samples = await asyncio.gather(*(
+            e2e.invoke("multigen", n + 1, f"an owl at night {run_id} {n}", **channel_options)
+            for n in range(args.multigens)
+        ))
+        elapsed = time.perf_counter() - started
+        counter.cancel()
+        probe.stop()
+    finally:
+        await registry.close()
+        await downloads.close()
+        await store.close()
+        await server.stop()
+
+    outputs = args.multigens * 6
+    print(f"{args.multigens} concurrent multigens, {outputs} outputs of {args.output_size / 2**20:.1f} MiB "
+          f"({outputs * args.output_size / 2**20:.0f} MiB total), spool "
+          f"{'off' if not args.spool else f'{args.spool / 2**20:g} MiB'}, budget "
+          f"{'off' if not args.budget else f'{args.budget / 2**20:g} MiB'}")
+    print(f"  wall time          {elapsed:8.2f} s   ({sum(s.failed for s in samples)} failed)")
+    print(f"  RSS before         {baseline / 2**20:8.1f} MiB")
+    print(f"  RSS peak           {probe.peak_rss / 2**20:8.1f} MiB   (+{(probe.peak_rss - baseline) / 2**20:.1f})")
+    print(f"  output bytes peak  {budget.peak / 2**20:8.1f} MiB")
+    print(f"  downloads waiting  {waits:8d}       (most at once)")
+    print(f"  bytes still held   {budget.in_use:8d}")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--multigens", type=int, default=10)
+    parser.add_argument("--output-size", type=int, default=8 * 1000 * 1000, help="bytes per output file")
+    parser.add_argument("--latency", type=float, default=1.0, help="fake model latency in seconds")
+    parser.add_argument("--discord-latency", type=float, default=0.2, help="seconds per Discord API call")
+    parser.add_argument("--spool", type=int, default=1024 * 1024, help="bytes kept in memory per output")
+    parser.add_argument("--budget", type=int, default=64 * 1024 * 1024, help="output bytes in flight")
+    args = parser.parse_args()
+    configure(args)
+    logging.basicConfig(level=logging.WARNING, force=True)
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,87 @@
+# bench/postprocess.py
+"""
+Throughput benchmark for output post-processing (utils/postprocess.py):
+--images synthetic --size-pixel PNGs, all over --limit bytes, pushed through
+postprocess.process() at once, as full outputs and as !multigen previews.
+
+Reports images per second overall and per worker process, and how long the
+event loop stalled meanwhile (it should not: the work runs in the pool).
+
+    python -m bench.postprocess --images 48 --size 1024 --limit 1000000
+    POSTPROCESS_FORMAT=webp python -m bench.postprocess
+    POSTPROCESS_WORKERS=1 python -m bench.postprocess    # one core
+"""
+import io
+import sys
+import time
+import asyncio
+import argparse
+
+def synthetic(size, seed):
+    # Noise over a gradient: compresses about as badly as a generated image.
+    from PIL import Image
+    noise = Image.effect_noise((size, size), 40 + seed % 20).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    out = io.BytesIO()
+    Image.blend(noise, gradient, 0.5).save(out, "PNG")
+    return out.getvalue()
+
+async def run(mode, images, limit):
+    from utils import postprocess
+    from utils.buffers import OutputBuffer
+
+    buffers = []
+    for data in images:
+        buffer = await OutputBuffer.reserve()
+        buffer.write(data)
+        buffer.fit()
+        buffer.seek(0)
+        buffers.append((f"bench_{len(buffers)}.png", buffer))
+
+    lags = []
+
+    async def watch_loop():
+        loop = asyncio.get_running_loop()
+        while True:
+            before = loop.time()
+            await asyncio.sleep(0.01)
+            lags.append(loop.time() - before - 0.01)
+
+    watcher = asyncio.create_task(watch_loop())
+    started = time.perf_counter()
+    files = await postprocess.process_all(buffers, limit, preview=(mode == "preview"))
+    elapsed = time.perf_counter() - started
+    watcher.cancel()
+    sizes = [buffer.size for _, buffer in files]
+    for _, buffer in files:
+        buffer.release()
+    return elapsed, sizes, max(lags, default=0.0)
+
+async def main(args):
+    from utils import postprocess
+
+    images = [synthetic(args.size, n) for n in range(args.images)]
+    print(f"{args.images} images of {args.size}x{args.size} "
+          f"({sum(map(len, images)) / len(images) / 2**20:.1f} MiB PNG each), limit {args.limit / 2**20:.2f} MiB, "
+          f"{postprocess.POSTPROCESS_WORKERS} workers, format {postprocess._target or 'unchanged'}")
+    try:
+        # Start the workers before timing anything.
+        await run("full", images[:postprocess.POSTPROCESS_WORKERS], args.limit)
+        for mode in ("full", "preview"):
+            elapsed, sizes, lag = await run(mode, images, args.limit)
+            rate = len(images) / elapsed
+            over = sum(size > args.limit for size in sizes)
+            print(f"  {mode:8} {rate:7.2f} images/s  {rate / postprocess.POSTPROCESS_WORKERS:6.2f} per worker  "
+                  f"mean {sum(sizes) / len(sizes) / 2**10:7.0f} KiB  {over} over limit  "
+                  f"loop stall max {lag * 1000:5.1f} ms")
+    finally:
+        postprocess.close()
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--size", type=int, default=1024, help="pixels per side")
+    parser.add_argument("--limit", type=int, default=1000 * 1000, help="upload limit in bytes")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,263 @@
+# bench/replay.py
+"""
+Replays a recorded trace (TRACE_PATH, see utils/tracing.py) against the fake
+backends at several speeds and reports where the bot saturates.
+
+Commands are started at their recorded offsets divided by the speed, by the
+same (anonymous) users, with the same argument shapes and attachments. Fake
+model latencies are drawn from the latencies recorded for each model
+(--latency for models the trace has none for). Discord calls share one
+--discord-rate limit, like the bot's global rate limit.
+
+For each speed it reports command latency and, per component, the signal
+that shows it saturating:
+
+    scheduler  share of generation workers busy, and the deepest queue
+    storage    p95 of a small probe query, and the most calls waiting on the executor
+    discord    p95 wait for a rate-limit slot
+
+    TRACE_PATH=trace.jsonl python bot.py                   # record real traffic
+    python -m bench.replay trace.jsonl --speeds 1,5,10,25,50
+    python -m bench.replay --synthesize 200 --out trace.jsonl   # a made-up !gpt -> !refine -> !flux/!multigen mix
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import statistics
+from bench import e2e
+from bench.e2e import percentile, invoke, seed, bot, initial_cogs
+from bench.fake_replicate import FakeReplicate
+from bench.fake_discord import FakeGuild, RateLimit
+from utils import downloads
+from utils.storage import store
+from utils.scheduler import scheduler
+from utils.model_registry import registry, prewarm_models
+from utils.tracing import recorder
+
+STORAGE_PROBE_INTERVAL = 0.05
+
+# Thresholds for calling a component saturated at a speed.
+SCHEDULER_BUSY = 0.9          # mean share of workers busy
+STORAGE_SLOWDOWN = 3.0        # probe p95 relative to the first speed's
+STORAGE_FLOOR = 0.005         # ...and at least this many seconds
+DISCORD_WAIT = 0.1            # seconds, p95 wait for a rate-limit slot
+LATENCY_SLOWDOWN = 2.0        # command p95 relative to the first speed's
+
+class ReplayProbe(e2e.Probe):
+    """Also samples the scheduler and the storage executor."""
+
+    def reset(self):
+        super().reset()
+        self.busy = []
+        self.peak_queue = 0
+        self.peak_pending = 0
+
+    def sample(self):
+        super().sample()
+        self.busy.append(scheduler.running / scheduler.workers)
+        self.peak_queue = max(self.peak_queue, scheduler.depth)
+        self.peak_pending = max(self.peak_pending, store.pending)
+
+async def storage_probe(durations):
+    while True:
+        start = time.perf_counter()
+        await store.count(0, "prompt")
+        durations.append(time.perf_counter() - start)
+        await asyncio.sleep(STORAGE_PROBE_INTERVAL)
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda r: r["at"])
+
+def command_text(tokens, tag):
+    """Rebuild a command's arguments from their recorded shape, with fresh words."""
+    parts = []
+    for token in tokens:
+        if token.startswith("<words:"):
+            count = int(token[len("<words:"):-1])
+            parts.extend(f"w{tag}x{n}" for n in range(count))
+        elif token in ("prompt[]", "image[]", "video[]"):
+            parts.append(token[:-1] + "1]")
+        else:
+            parts.append(token)
+    return " ".join(parts)
+
+def synthesize(sessions, seed_value=1):
+    """
+    A made-up trace of user sessions arriving over about a minute and a half:
+    !gpt, often a !refine, then a generation (usually !flux, sometimes
+    !multigen, occasionally !video or !audio), a few seconds apart.
+    """
+    rng = random.Random(seed_value)
+    records = []
+    for session in range(sessions):
+        at = rng.uniform(0, 90)
+        user = f"synthetic{rng.randrange(sessions // 3 + 1)}"
+        chain = [("gpt", ["<words:6>"])]
+        if rng.random() < 0.5:
+            chain.append(("refine", ["prompt[]", "<words:5>"]))
+        roll = rng.random()
+        if roll < 0.6:
+            chain.append(("flux", ["prompt[]", str(rng.choice([1, 2, 4]))]))
+        elif roll < 0.85:
+            chain.append(("multigen", ["prompt[]"]))
+        elif roll < 0.95:
+            chain.append(("video", ["prompt[]", "image[]"]))
+        else:
+            chain.append(("audio", ["prompt[]", "video[]"]))
+        for command, args in chain:
+            records.append({"at": round(at, 3), "user": user, "command": command, "args": args,
+                            "attachments": [], "predictions": []})
+            at += rng.uniform(3, 15)
+    return sorted(records, key=lambda r: r["at"])
+
+def model_latencies(records):
+    latencies = {}
+    for record in records:
+        for prediction in record.get("predictions", ()):
+            if prediction.get("outcome") == "ok":
+                latencies.setdefault(prediction["model"], []).append(prediction["seconds"])
+    return latencies
+
+async def replay(records, users, speed, tag, **channel_options):
+    """Start every record's command at its offset / speed; returns (samples, elapsed)."""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    tasks = []
+    for n, record in enumerate(records):
+        delay = start + record["at"] / speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        text = command_text(record["args"], f"{tag}x{n}")
+        tasks.append(asyncio.create_task(invoke(
+            record["command"], users[record["user"]], text,
+            content_types=record.get("attachments") or None, **channel_options
+        )))
+    samples = await asyncio.gather(*tasks)
+    return samples, loop.time() - start
+
+def saturation(rows):
+    """The first speed at which each component looks saturated (compared with the first speed), or None."""
+    base = rows[0]
+    found = {}
+    checks = {
+        "latency": lambda r: r["p95"] > base["p95"] * LATENCY_SLOWDOWN,
+        "scheduler": lambda r: r["busy"] >= SCHEDULER_BUSY,
+        "storage": lambda r: r["storage_p95"] > max(base["storage_p95"] * STORAGE_SLOWDOWN, STORAGE_FLOOR),
+        "discord": lambda r: r["discord_p95"] > DISCORD_WAIT,
+    }
+    for name, check in checks.items():
+        found[name] = next((r["speed"] for r in rows if check(r)), None)
+    return found
+
+async def main(args):
+    if args.synthesize:
+        records = synthesize(args.synthesize, args.seed)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(r) + "\n" for r in records)
+            print(f"wrote {len(records)} records to {args.out}")
+            return 0
+    elif args.trace:
+        records = load(args.trace)
+    else:
+        raise SystemExit("Give a trace file or --synthesize N")
+    if args.window:
+        records = [r for r in records if r["at"] <= args.window]
+    if not records:
+        raise SystemExit("Nothing to replay")
+
+    latencies = model_latencies(records)
+    rng = random.Random(args.seed)
+
+    def latency(model):
+        samples = latencies.get(model)
+        return rng.choice(samples) if samples else args.latency
+
+    users = {user: n for n, user in enumerate(sorted({r["user"] for r in records}), start=1)}
+    server = await FakeReplicate(latency=latency, output_size=args.output_size).start()
+    os.environ["REPLICATE_BASE_URL"] = server.url
+    limit = RateLimit(args.discord_rate)
+    channel_options = {"guild": FakeGuild(), "latency": args.discord_latency,
+                       "attachment_base": f"{server.url}/files", "limit": limit}
+    probe = ReplayProbe()
+    rows = []
+    try:
+        for cog in initial_cogs:
+            await bot.load_extension(cog)
+        skipped = {r["command"] for r in records if bot.get_command(r["command"]) is None}
+        if skipped:
+            print(f"skipping commands this bot does not have: {', '.join(sorted(skipped))}")
+            records = [r for r in records if r["command"] not in skipped]
+        await registry.warm(prewarm_models)
+        await seed(len(users), **channel_options)
+        probe.start()
+        for speed in [float(s) for s in args.speeds.split(",")]:
+            probe.reset()
+            limit.waits = []
+            storage = []
+            storage_task = asyncio.create_task(storage_probe(storage))
+            samples, elapsed = await replay(records, users, speed, f"{time.time_ns()}s{speed:g}",
+                                            **channel_options)
+            storage_task.cancel()
+            latencies_s = [s.latency for s in samples]
+            rows.append({
+                "speed": speed,
+                "commands": len(samples),
+                "failed": sum(s.failed for s in samples),
+                "throughput": len(samples) / elapsed,
+                "p50": percentile(latencies_s, 50),
+                "p95": percentile(latencies_s, 95),
+                "busy": statistics.fmean(probe.busy) if probe.busy else 0.0,
+                "queue_peak": probe.peak_queue,
+                "storage_p95": percentile(storage, 95),
+                "pending_peak": probe.peak_pending,
+                "discord_p95": percentile(limit.waits, 95) if limit.waits else 0.0,
+                "lag_p99": percentile(probe.lags, 99),
+            })
+            r = rows[-1]
+            print(f"{speed:5g}x {r['commands']:5d} cmds {r['failed']:4d} failed {r['throughput']:6.2f} cmd/s  "
+                  f"p50 {r['p50']:6.2f}s p95 {r['p95']:6.2f}s | scheduler {r['busy']:4.0%} busy, "
+                  f"queue {r['queue_peak']:3d} | storage p95 {r['storage_p95'] * 1000:6.1f}ms, "
+                  f"pending {r['pending_peak']:3d} | discord wait p95 {r['discord_p95'] * 1000:6.1f}ms | "
+                  f"lag p99 {r['lag_p99'] * 1000:5.1f}ms", flush=True)
+        probe.stop()
+    finally:
+        await recorder.close()
+        await registry.close()
+        await downloads.close()
+        await store.close()
+        await server.stop()
+
+    for name, speed in saturation(rows).items():
+        print(f"{name:10} " + (f"saturates at {speed:g}x" if speed else f"not saturated up to {rows[-1]['speed']:g}x"))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", nargs="?", help="trace recorded with TRACE_PATH")
+    parser.add_argument("--synthesize", type=int, metavar="SESSIONS", help="replay (or --out) a synthetic trace")
+    parser.add_argument("--out", help="with --synthesize, write the trace here instead of replaying it")
+    parser.add_argument("--speeds", default="1,5,10,25,50")
+    parser.add_argument("--window", type=float, help="only replay the first WINDOW seconds of the trace")
+    parser.add_argument("--latency", type=float, default=3.0, help="latency for models without recorded latencies")
+    parser.add_argument("--output-size", type=int, default=256 * 1024, help="bytes per output file")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="seconds per Discord API call")
+    parser.add_argument("--discord-rate", type=float, default=50, help="Discord API calls per second")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write per-speed results to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, force=True)
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        e2e._tmp.cleanup()
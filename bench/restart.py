@@ -0,0 +1,135 @@
+# bench/restart.py
+"""
+Restart check for the job journal (utils/journal.py), against the fake
+backends: starts --commands (one per user) on models that take --latency
+seconds, shuts the bot down --restart-after seconds in, while they are all
+still waiting, then starts it again and resumes from the journal.
+
+Checks that every prediction was journaled, none was cancelled on Replicate
+by the shutdown or run again, and every interrupted command with a
+prediction in flight had its outputs posted to its channel and saved where
+the command saves them (its cog's output_kind). (Commands still
+queued in the scheduler had no prediction yet, so there is nothing to resume
+for them.) Exits 1 if any check fails.
+
+    python -m bench.restart
+    python -m bench.restart --commands multigen,stable35,audio,gpt --latency 3 --restart-after 1
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from bench import e2e
+from bench.e2e import bot, initial_cogs, invoke, seed
+from bench.fake_replicate import FakeReplicate
+from bench.fake_discord import FakeChannel, FakeClient, FakeGuild
+from utils import downloads
+from utils.storage import store
+from utils.journal import journal
+from utils.model_registry import registry, prewarm_models
+
+def _count_jobs(conn):
+    return conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+def _saved(conn, user_id, kind):
+    return conn.execute("SELECT COUNT(*) FROM items WHERE user_id = ? AND kind = ?", (user_id, kind)).fetchone()[0]
+
+def _jobs_by_channel(conn):
+    return dict(conn.execute("SELECT channel_id, COUNT(*) FROM jobs GROUP BY channel_id").fetchall())
+
+async def main(args):
+    server = await FakeReplicate(latency=args.latency).start()
+    os.environ["REPLICATE_BASE_URL"] = server.url
+    channel_options = {"guild": FakeGuild(), "latency": args.discord_latency,
+                       "attachment_base": f"{server.url}/files"}
+    names = args.commands.split(",")
+    try:
+        for cog in initial_cogs:
+            await bot.load_extension(cog)
+        await registry.warm(prewarm_models)
+        await seed(len(names), **channel_options)
+
+        # First run: start the commands, then shut down while they wait.
+        channels = [FakeChannel(**channel_options) for _ in names]
+        run_id = time.time_ns()
+        tasks = [
+            asyncio.create_task(invoke(name, n, e2e.COMMANDS[name].format(n=f"{run_id}-{n}"), channel=channel))
+            for n, (name, channel) in enumerate(zip(names, channels), start=1)
+        ]
+        await asyncio.sleep(args.restart_after)
+        created = server.created
+        journal.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0.5)     # let any (wrong) cancel requests land
+        journaled = await store.call(_count_jobs)
+        by_channel = await store.call(_jobs_by_channel)
+        posted_before = [len(channel.messages) for channel in channels]
+        kinds = [getattr(bot.get_command(name).cog, "output_kind", None) for name in names]
+        saved_before = [
+            await store.call(_saved, n, kind) if kind else 0 for n, kind in enumerate(kinds, start=1)
+        ]
+
+        # Second run: resume from the journal.
+        started = time.perf_counter()
+        resumed = await journal.resume(FakeClient(channels))
+        elapsed = time.perf_counter() - started
+        left = await store.call(_count_jobs)
+        saved = [
+            (await store.call(_saved, n, kind) if kind else 0) - before
+            for n, (kind, before) in enumerate(zip(kinds, saved_before), start=1)
+        ]
+    finally:
+        await registry.close()
+        await downloads.close()
+        await store.close()
+        await server.stop()
+
+    recovered = [
+        sum(1 for m in channel.messages[before:] if "interrupted by a restart" in m.content)
+        for channel, before in zip(channels, posted_before)
+    ]
+    print(f"{len(names)} commands interrupted {args.restart_after:g}s into {args.latency:g}s predictions")
+    print(f"  predictions created     {created:4d}")
+    print(f"  journaled at shutdown   {journaled:4d}")
+    print(f"  cancelled on Replicate  {server.canceled:4d}")
+    print(f"  resumed                 {resumed:4d}   in {elapsed:.2f}s")
+    print(f"  created again           {server.created - created:4d}")
+    print(f"  left in the journal     {left:4d}")
+    for name, channel, count, kind, added in zip(names, channels, recovered, kinds, saved):
+        journaled_here = by_channel.get(channel.id, 0)
+        print(f"  !{name:14} {journaled_here} journaled, {count} output message(s) posted after the restart, "
+              f"{added} {kind or 'output'}(s) saved")
+
+    failures = []
+    if journaled != created:
+        failures.append("not every prediction was journaled")
+    if server.canceled:
+        failures.append("the shutdown cancelled predictions")
+    if server.created != created:
+        failures.append("predictions were run again")
+    if left:
+        failures.append("the journal was not emptied")
+    if any(count != by_channel.get(channel.id, 0) for channel, count in zip(channels, recovered)):
+        failures.append("some journaled predictions got no output")
+    if any(kind and count and not added for count, kind, added in zip(recovered, kinds, saved)):
+        failures.append("some resumed outputs were not saved")
+    for failure in failures:
+        print("FAIL", failure)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", default="multigen,fluxpro,stable35,audio,video,gpt")
+    parser.add_argument("--latency", type=float, default=3.0, help="fake model latency in seconds")
+    parser.add_argument("--restart-after", type=float, default=1.0, help="seconds before the shutdown")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="seconds per Discord API call")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, force=True)
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        e2e._tmp.cleanup()
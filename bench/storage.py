@@ -0,0 +1,75 @@
+# bench/storage.py
+"""
+Storage benchmark for utils.storage.
+
+Fills a fresh database with --users x --items prompts using batched inserts,
+then times random get-by-index lookups and per-user listings through the
+async facade.
+
+    python -m bench.storage --users 1000 --items 1000
+    python -m bench.storage --users 100000 --items 1000 --db /tmp/big.db   # 100M rows
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from utils.storage import Store
+
+BATCH = 1000
+
+def fill(conn, users, items):
+    # Bulk load straight through the connection (items plus their counter);
+    # one transaction per user.
+    for user_id in range(1, users + 1):
+        conn.execute("BEGIN")
+        for start in range(1, items + 1, BATCH):
+            conn.executemany(
+                "INSERT INTO items (user_id, kind, idx, value) VALUES (?, 'prompt', ?, ?)",
+                [(user_id, i, f"prompt {i} for user {user_id}") for i in range(start, min(start + BATCH, items + 1))]
+            )
+        conn.execute(
+            "INSERT INTO counters (user_id, kind, last_idx) VALUES (?, 'prompt', ?)",
+            (user_id, items)
+        )
+        conn.execute("COMMIT")
+
+async def timed(samples, coro_fn):
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        await coro_fn()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    return durations
+
+def report(name, durations):
+    p50 = statistics.median(durations) * 1e6
+    p99 = durations[int(len(durations) * 0.99) - 1] * 1e6
+    print(f"{name:24} p50 {p50:9.1f} us   p99 {p99:9.1f} us")
+
+async def main(users, items, samples, path):
+    if os.path.exists(path):
+        os.remove(path)
+    store = Store(path)
+
+    start = time.perf_counter()
+    await store.call(fill, users, items)
+    elapsed = time.perf_counter() - start
+    rows = users * items
+    print(f"loaded {rows:,} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+
+    report("get by index", await timed(samples, lambda: store.get(random.randint(1, users), "prompt", random.randint(1, items))))
+    report("save (returns index)", await timed(samples, lambda: store.append(random.randint(1, users), "prompt", ["new prompt"])))
+    report("list one user", await timed(min(samples, 200), lambda: store.list(random.randint(1, users), "prompt")))
+    await store.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--db", default="bench_storage.db")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.items, args.samples, args.db))
@@ -0,0 +1,112 @@
+# bench/workers.py
+"""
+Throughput of the gateway/worker split (utils/workers.py) against the fake
+backends: the bot runs as the gateway (BOT_MODE=gateway) on the SQLite
+broker, and `python worker.py` runs --processes worker processes on the
+same database. Workers spool their outputs (WORKER_POST=gateway) so the
+gateway posts them to the fake channels, where they can be counted.
+--processes 0 runs the bot standalone instead, for comparison.
+
+Same columns as bench/e2e.py; run it once per configuration:
+
+    python -m bench.workers --processes 0
+    python -m bench.workers --processes 4 --commands flux,multigen
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+
+def configure(args):
+    # Read by utils/workers.py and utils/broker.py at import time.
+    if args.processes:
+        os.environ["BOT_MODE"] = "gateway"
+        os.environ["BROKER"] = "sqlite"
+        os.environ["WORKER_POST"] = "gateway"
+        os.environ["WORKER_PROCESSES"] = str(args.processes)
+        os.environ["WORKER_CONCURRENCY"] = str(args.worker_concurrency)
+    else:
+        os.environ["BOT_MODE"] = "standalone"
+    os.environ["GEN_WORKERS"] = str(args.gen_workers)
+    # Measure throughput, not the scheduler's backpressure (!multigen queues 7 jobs).
+    os.environ["GEN_QUEUE_LIMIT"] = "10000"
+
+async def start_workers():
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "worker.py", env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+
+async def main(args):
+    from bench import e2e
+    from bench.e2e import bot, initial_cogs, seed, phase, report, Probe
+    from bench.fake_replicate import FakeReplicate
+    from bench.fake_discord import FakeGuild
+    from utils import downloads, postprocess
+    from utils.broker import broker
+    from utils.storage import store
+    from utils.model_registry import registry, prewarm_models
+
+    server = await FakeReplicate(latency=args.latency, output_size=args.output_size).start()
+    os.environ["REPLICATE_BASE_URL"] = server.url
+    channel_options = {"guild": FakeGuild(), "latency": args.discord_latency,
+                       "attachment_base": f"{server.url}/files"}
+    probe = Probe()
+    workers = None
+    try:
+        for cog in initial_cogs:
+            await bot.load_extension(cog)
+        await registry.warm(prewarm_models)
+        await seed(args.users, **channel_options)
+        if args.processes:
+            workers = await start_workers()
+        probe.start()
+        results = {}
+        run_id = time.time_ns()
+        for name in args.commands.split(","):
+            if name not in e2e.COMMANDS:
+                raise SystemExit(f"Unknown command {name!r}; choose from {', '.join(e2e.COMMANDS)}")
+            results[name] = await phase(name, args.invocations, args.users, args.concurrency,
+                                        probe, run_id, **channel_options)
+        probe.stop()
+    finally:
+        if workers is not None:
+            workers.terminate()
+            await workers.wait()
+        await broker.close()
+        await registry.close()
+        await downloads.close()
+        postprocess.close()
+        await store.close()
+        await server.stop()
+
+    mode = (f"gateway + {args.processes} worker process(es) x {args.worker_concurrency} jobs"
+            if args.processes else "standalone")
+    print(f"{mode}, {os.cpu_count()} CPU(s), fake model latency {args.latency:.2f}s, "
+          f"outputs {args.output_size} bytes, concurrency {args.concurrency}")
+    report(results)
+    return 1 if any(r["failed"] for r in results.values()) else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=2, help="worker processes (0: standalone bot)")
+    parser.add_argument("--worker-concurrency", type=int, default=8, help="jobs per worker process")
+    parser.add_argument("--gen-workers", type=int, default=32, help="GEN_WORKERS on the bot")
+    parser.add_argument("--commands", default="flux,multigen")
+    parser.add_argument("--invocations", type=int, default=50)
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=1.0, help="fake model latency in seconds")
+    parser.add_argument("--output-size", type=int, default=256 * 1024, help="bytes per output file")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="seconds per Discord API call")
+    args = parser.parse_args()
+    configure(args)
+    logging.basicConfig(level=logging.WARNING, force=True)
+    from bench import e2e
+    try:
+        sys.exit(asyncio.run(main(args)))
+    finally:
+        e2e._tmp.cleanup()
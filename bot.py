@@ -1,28 +1,70 @@
 import os
 import asyncio
-import threading
 import logging
 from dotenv import load_dotenv
 import discord
-from discord.ext import commands
-from flask import Flask
+from utils import downloads, postprocess, web, metrics, sharding
+from utils.storage import store
+from utils.model_registry import registry, prewarm_models
+from utils.cancellation import tracker
+from utils.tracing import recorder
+from utils.watchdog import watchdog
+from utils.journal import journal
+from utils.broker import broker
+from utils.workers import Worker, in_process
 
 # Load environment variables
 load_dotenv()
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
 
-# Setup Discord bot
+# Setup Discord bot (one gateway connection, or shards: see utils/sharding.py)
 intents = discord.Intents.default()
 intents.message_content = True
 
-bot = commands.Bot(
+bot = sharding.create_bot(
     command_prefix="!",
     description="Runs models on Replicate!",
     intents=intents
 )
 
+COMMANDS = metrics.counter("bot_commands_total", "Commands invoked.", labels=("command", "outcome"))
+metrics.gauge("bot_gateway_latency_seconds", "Discord gateway heartbeat latency.", fn=lambda: bot.latency)
+metrics.gauge("bot_shard_latency_seconds", "Discord gateway heartbeat latency, per shard.",
+              labels=("shard",), fn=lambda: sharding.latencies(bot))
+
+# Track running commands so they can be cancelled (cogs/cancel.py), record
+# them when tracing is on (utils/tracing.py) and profile them when profiling
+# is on (utils/watchdog.py). A finished command's predictions leave the job
+# journal (utils/journal.py).
+@bot.before_invoke
+async def track_command(ctx):
+    tracker.start(ctx)
+    recorder.start(ctx)
+    watchdog.begin(ctx)
+
+@bot.after_invoke
+async def untrack_command(ctx):
+    await watchdog.end(ctx)
+    await journal.forget(ctx)
+    recorder.finish(ctx)
+    tracker.finish(ctx)
+
+@bot.listen()
+async def on_command_completion(ctx):
+    COMMANDS.inc(command=ctx.command.qualified_name, outcome="ok")
+
+@bot.listen()
+async def on_command_error(ctx, error):
+    command = ctx.command.qualified_name if ctx.command else "unknown"
+    COMMANDS.inc(command=command, outcome="error")
+    # A listener replaces discord.py's default handler, so keep its logging.
+    if ctx.command and ctx.command.has_error_handler():
+        return
+    log.error("Ignoring exception in command %s", command, exc_info=error)
+
 # List of cogs to load
 initial_cogs = [
     "cogs.image_gen",
@@ -32,31 +74,47 @@ initial_cogs = [
     "cogs.add_prompt",
     "cogs.video_upload",
     "cogs.audio_gen",
+    "cogs.cancel",
+    "cogs.profile",
 ]
 
 async def main():
     async with bot:
-        # Load each cog
-        for cog in initial_cogs:
-            await bot.load_extension(cog)
-        # Start the bot
-        await bot.start(os.environ["DISCORD_TOKEN"])
-
-# Flask server to keep Render from shutting down
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    return "Bot is running!"
-
-def run_flask():
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port)
+        # Serve keep-alive checks, health, metrics and Replicate webhooks from this event loop
+        await web.start(bot)
+        loop_lag = asyncio.create_task(metrics.watch_loop_lag())
+        shard_events = asyncio.create_task(sharding.watch_events(bot))
+        # Log the stack of anything that blocks the event loop
+        watchdog.start()
+        # Post the outputs of predictions a previous run was waiting on, once connected
+        resume = asyncio.create_task(journal.resume(bot))
+        # BOT_MODE=gateway with BROKER=memory: the workers run here (utils/workers.py)
+        local_workers = asyncio.create_task(Worker(bot, "gateway").run()) if in_process else None
+        try:
+            # Resolve model versions, and keep them fresh, in the background
+            registry.start(prewarm_models)
+            # Load each cog
+            for cog in initial_cogs:
+                await bot.load_extension(cog)
+            # Start the bot
+            await bot.start(os.environ["DISCORD_TOKEN"])
+        finally:
+            # Leave in-flight predictions running for the next start to resume
+            journal.close()
+            resume.cancel()
+            if local_workers is not None:
+                local_workers.cancel()
+            loop_lag.cancel()
+            shard_events.cancel()
+            await watchdog.stop()
+            await recorder.close()
+            await web.stop()
+            await broker.close()
+            await registry.close()
+            await downloads.close()
+            postprocess.close()
+            await store.close()
 
 if __name__ == "__main__":
-    # Start Flask in a separate thread
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-
     # Run the bot
     asyncio.run(main())
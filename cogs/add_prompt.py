@@ -1,7 +1,7 @@
 # cogs/prompt_gen.py
 import discord
 from discord.ext import commands
-from utils.prompt_manager import save_prompt, list_prompts
+from utils.prompt_manager import save_prompt
 
 class AddPromptCog(commands.Cog):
     def __init__(self, bot):
@@ -24,9 +24,7 @@ class AddPromptCog(commands.Cog):
             return
 
         # Save the custom prompt
-        save_prompt(ctx.author.id, prompt_text)
-        # Retrieve the new index (1-based) from the stored prompts
-        new_index = list_prompts(ctx.author.id)[-1][0]
+        new_index = await save_prompt(ctx.author.id, prompt_text)
 
         await ctx.send(f"Your custom prompt has been added as prompt[{new_index}].")
     
@@ -1,11 +1,16 @@
 # cogs/audio_gen.py
-import io
-import asyncio
-import replicate
 import discord
 from discord.ext import commands
 from utils.prompt_manager import get_prompt_by_index
+from utils.inference import run_model
+from utils.scheduler import submit
+from utils.status import send_status
+from utils.downloads import download, DownloadError
+from utils.output_cache import output_cache, cache_key
 from utils.video_manager import get_video_by_index
+from utils import workers
+
+AUDIO_MODEL = "zsxkib/mmaudio:4b9f801a167b1f6cc2db6ba7ffdeb307630bf411841d4e8300e63ca992de0be9"
 
 class AudioCog(commands.Cog):
     def __init__(self, bot):
@@ -29,10 +34,13 @@ class AudioCog(commands.Cog):
         
         Other parameters use defaults:
           seed: -1, duration: 8, num_steps: 25, cfg_strength: 4.5, negative_prompt: "music"
+
+        Add `nocache` to run a fresh prediction instead of reusing an earlier identical result.
         """
         stored_prompt = None
         video_url = None
         direct_prompt_parts = []
+        use_cache = True
 
         # Set default parameters from the schema.
         seed = -1
@@ -46,7 +54,7 @@ class AudioCog(commands.Cog):
             if arg.startswith("prompt[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("prompt["):-1])
-                    stored_prompt = get_prompt_by_index(ctx.author.id, idx)
+                    stored_prompt = await get_prompt_by_index(ctx.author.id, idx)
                     if not stored_prompt:
                         await ctx.send(f"No stored prompt found at index {idx}.")
                         return
@@ -56,13 +64,15 @@ class AudioCog(commands.Cog):
             elif arg.startswith("video[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("video["):-1])
-                    video_url = get_video_by_index(ctx.author.id, idx)
+                    video_url = await get_video_by_index(ctx.author.id, idx)
                     if not video_url:
                         await ctx.send(f"No stored video found at index {idx}.")
                         return
                 except ValueError:
                     await ctx.send("Invalid video index format.")
                     return
+            elif arg == "nocache":
+                use_cache = False
             else:
                 direct_prompt_parts.append(arg)
 
@@ -88,30 +98,63 @@ class AudioCog(commands.Cog):
             "video": video_url
         }
 
-        msg = await ctx.send(
+        msg = await send_status(
+            ctx,
             f"Generating audio with prompt: `{prompt}` using your stored video."
         )
 
+        # Identical requests reuse the audio posted the first time.
+        key = cache_key(AUDIO_MODEL, audio_input)
+        cached = output_cache.get(key) if use_cache else None
+        if cached:
+            await ctx.send(content=f"Audio generated:\n*(cached result)* {cached[0]}")
+            await msg.delete()
+            return
+
+        # In gateway mode a worker process runs the prediction and posts the audio
+        # (utils/workers.py).
+        if workers.remote:
+            try:
+                audio_urls = await submit(
+                    ctx.author.id,
+                    lambda: workers.generate(ctx, AUDIO_MODEL, audio_input, "Audio generated:", lambda i: "output.mp4"),
+                    status=msg
+                )
+            except Exception as e:
+                await msg.edit(content=f"Audio generation failed: {e}")
+                return
+            if audio_urls:
+                output_cache.put(key, audio_urls[:1])
+            await msg.delete()
+            return
+
         try:
-            # Run the blocking replicate.run in a separate thread.
-            output = await asyncio.to_thread(
-                replicate.run,
-                "zsxkib/mmaudio:4b9f801a167b1f6cc2db6ba7ffdeb307630bf411841d4e8300e63ca992de0be9",
-                input=audio_input
+            output = await submit(
+                ctx.author.id,
+                lambda: run_model(AUDIO_MODEL, audio_input, on_update=msg.tracker()),
+                status=msg
             )
         except Exception as e:
             await msg.edit(content=f"Audio generation failed: {e}")
             return
 
-        # Read the file-like output.
-        audio_bytes = output.read()
-        audio_file = io.BytesIO(audio_bytes)
+        # Stream the file-like output into an upload buffer.
+        try:
+            audio_file = await download(output)
+        except DownloadError as e:
+            await msg.edit(content=f"Error reading audio output: {e}")
+            return
 
-        # Send the audio file as an attachment.
-        await ctx.send(
-            content="Audio generated:",
-            file=discord.File(audio_file, "output.mp4")
-        )
+        # Send the audio file as an attachment, straight from the download buffer.
+        try:
+            sent = await ctx.send(
+                content="Audio generated:",
+                file=discord.File(audio_file, "output.mp4")
+            )
+        finally:
+            audio_file.release()
+        if sent.attachments:
+            output_cache.put(key, [sent.attachments[0].url])
 
         await msg.delete()
 
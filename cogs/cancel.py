@@ -0,0 +1,38 @@
+# cogs/cancel.py
+from discord.ext import commands
+from utils.cancellation import tracker
+
+class CancelCog(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.command()
+    async def cancel(self, ctx):
+        """
+        Cancel all of your commands that are still running. Their predictions
+        are cancelled on Replicate too.
+
+        Usage:
+          !cancel
+
+        You can also press Cancel on a command's status message, or delete
+        the message that ran the command.
+        """
+        count = await tracker.cancel(tracker.for_user(ctx.author.id), reason="command")
+        if count:
+            await ctx.send(f"Cancelled {count} running command(s).")
+        else:
+            await ctx.send("You have no running commands.")
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        # Nobody is left to see the result of a command whose message was deleted.
+        await tracker.cancel(tracker.for_message(payload.message_id), reason="deleted")
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        entries = [e for message_id in payload.message_ids for e in tracker.for_message(message_id)]
+        await tracker.cancel(entries, reason="deleted")
+
+async def setup(bot):
+    await bot.add_cog(CancelCog(bot))
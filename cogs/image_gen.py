@@ -1,18 +1,154 @@
 # cogs/image_gen.py
-import io
+import os
+import time
+import uuid
 import asyncio
-import replicate
+import logging
 import discord
 from discord.ext import commands
-from discord import File
-from state import user_generated_images  
 from utils.prompt_manager import get_prompt_by_index
-from utils.image_manager import add_images, get_image_by_index, list_images
+from utils.inference import run_model
+from utils.scheduler import submit
+from utils.status import send_status, SharedStatus, DeadlineStatus
+from utils.downloads import download_all
+from utils.output_cache import output_cache, cache_key
+from utils.singleflight import SingleFlight
+from utils.publisher import publish
+from utils.image_manager import add_images, get_image_by_index, list_images, count_images
+from utils.paginator import send_paginated
+from utils.cancellation import tracker
+from utils.journal import journal
+from utils import workers
+
+log = logging.getLogger(__name__)
+
+# Per-model deadline for !multigen (prediction, download and upload), counted
+# from when the scheduler starts the model's job.
+MULTIGEN_MODEL_TIMEOUT = float(os.environ.get("MULTIGEN_MODEL_TIMEOUT", "180"))
+
+# Thumbnails per !listimages page (Discord allows up to 10 embeds per message).
+IMAGES_PER_PAGE = 5
+
+# Identical predictions already in flight (same model and canonical input, as
+# keyed by the output cache) are shared instead of started again. The shared
+# run shows its queue position and progress on every waiting command's status
+# message, and journals its prediction under a key of its own until it ends
+# (utils/journal.py), so the first command finishing or being cancelled does
+# not drop it from the journal while the others still wait on it.
+inflight = SingleFlight()
+_shared = {}    # key -> SharedStatus of the run in flight
+
+async def share(key, status, label, factory):
+    """
+    Return the result of factory(progress), run once for every concurrent
+    call with the same key. progress is a utils.status.SharedStatus that
+    reaches status (under label) and the status of every other caller.
+    """
+    progress = _shared.get(key)
+    if progress is None:
+        progress = _shared[key] = SharedStatus()
+    if status is not None:
+        progress.join(status, label)
+
+    async def run():
+        job = uuid.uuid4().hex
+        tracker.share(job)
+        try:
+            return await factory(progress)
+        finally:
+            if _shared.get(key) is progress:
+                del _shared[key]
+            await journal.forget_job(job)
+
+    return await inflight.do(key, run)
+
+async def predict(user_id, model, model_input, status, label=None):
+    """
+    Run model on model_input through the scheduler and download its outputs
+    as a list of OutputBuffers, reporting queue position and progress (under
+    label) on status. Concurrent calls with the same canonical input attach to
+    the one prediction already running; each caller downloads its own copy.
+    """
+    key = cache_key(model, model_input)
+    if key in inflight:
+        log.info("Joining in-flight %s prediction", model)
+
+    async def run(progress):
+        return await submit(
+            user_id,
+            lambda: run_model(model, model_input, on_update=progress.update),
+            status=progress
+        )
+
+    return await download_all(await share(key, status, label, run))
+
+async def predict_and_publish(ctx, model, model_input, status, caption, filename, label=None, preview=False):
+    """
+    Run model on model_input and post its outputs under caption (output i as
+    filename(i)); returns the attachment URLs. In gateway mode the whole job
+    runs on a worker process (utils/workers.py), still admitted through the
+    scheduler here; otherwise it runs in this process. Either way identical
+    concurrent calls share one prediction: in gateway mode the worker posts
+    once, and the other callers link its attachments as a cached result does.
+    """
+    if workers.remote:
+        key = cache_key(model, model_input)
+        if key in inflight:
+            log.info("Joining in-flight %s job", model)
+
+        async def run(progress):
+            return ctx, await submit(
+                ctx.author.id,
+                lambda: workers.generate(ctx, model, model_input, caption, filename, preview),
+                status=progress
+            )
+
+        poster, urls = await share(key, status, label, run)
+        if poster is not ctx and urls:
+            await ctx.send(content=cached_caption(caption, urls))
+        return urls
+    outputs = await predict(ctx.author.id, model, model_input, status, label)
+    return await publish(
+        ctx, caption,
+        [(filename(i), data) for i, data in enumerate(outputs, start=1)],
+        preview=preview
+    )
 
 class GenerationCog(commands.Cog):
+    # What outputs are saved as (utils/journal.py saves resumed ones the same way)
+    output_kind = "image"
+
     def __init__(self, bot):
         self.bot = bot
 
+    async def _generate(self, ctx, msg, label, model, model_input, caption, filename, use_cache=True):
+        """
+        Shared tail of the single-model commands: reuse a cached result or run the
+        prediction through the scheduler, post all outputs under caption (output i
+        as filename(i)), record the attachment URLs and remove the status message.
+        """
+        key = cache_key(model, model_input)
+        cached = output_cache.get(key) if use_cache else None
+        if cached:
+            await ctx.send(content=cached_caption(caption, cached))
+            await add_images(ctx.author.id, cached)
+            await msg.delete()
+            return
+
+        try:
+            generated_urls = await predict_and_publish(ctx, model, model_input, msg, caption, filename)
+        except Exception as e:
+            await msg.edit(content=f"{label} generation failed: {e}")
+            return
+
+        if not generated_urls:
+            await msg.edit(content=f"Error reading {label} output.")
+            return
+
+        output_cache.put(key, generated_urls)
+        await add_images(ctx.author.id, generated_urls)
+        await msg.delete()
+
     @commands.command()
     async def flux(self, ctx, *args):
         """
@@ -24,9 +160,11 @@ class GenerationCog(commands.Cog):
           - Using a direct prompt: !flux an astronaut riding a horse 3
           - Optionally override aspect ratio: aspect_ratio[<value>]
         (The number indicates the number of outputs.)
+        Add `nocache` to run a fresh prediction instead of reusing an earlier identical result.
         """
         stored_prompt = None
         direct_prompt_parts = []
+        use_cache = True
         num_outputs = 1
         aspect_ratio = "9:16"
 
@@ -35,7 +173,7 @@ class GenerationCog(commands.Cog):
             if arg.startswith("prompt[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("prompt["):-1])
-                    stored_prompt = get_prompt_by_index(ctx.author.id, idx)
+                    stored_prompt = await get_prompt_by_index(ctx.author.id, idx)
                     if not stored_prompt:
                         await ctx.send(f"No stored prompt found at index {idx}.")
                         return
@@ -46,6 +184,8 @@ class GenerationCog(commands.Cog):
                 aspect_ratio = arg[len("aspect_ratio["):-1]
             elif arg.isdigit():
                 num_outputs = int(arg)
+            elif arg == "nocache":
+                use_cache = False
             else:
                 direct_prompt_parts.append(arg)
         
@@ -55,7 +195,7 @@ class GenerationCog(commands.Cog):
             return
         
         num_outputs = max(1, min(num_outputs, 4))
-        msg = await ctx.send(f"Generating {num_outputs} image(s) for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
+        msg = await send_status(ctx, f"Generating {num_outputs} image(s) for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
 
         model_input = {
             "prompt": prompt,
@@ -63,101 +203,63 @@ class GenerationCog(commands.Cog):
             "aspect_ratio": aspect_ratio
         }
 
-        try:
-            output = await asyncio.to_thread(
-                replicate.run,
-                "black-forest-labs/flux-schnell",
-                input=model_input
-            )
-        except Exception as e:
-            await msg.edit(content=f"Flux generation failed: {e}")
-            return
-
-        generated_urls = []
-        for idx, img_file in enumerate(output, start=1):
-            try:
-                image_bytes = img_file.read()
-            except Exception:
-                continue
-            file_data = io.BytesIO(image_bytes)
-            sent = await ctx.send(
-                content=f"> **Image {idx}** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
-                file=File(file_data, f"flux_{idx}.png")
-            )
-            if sent.attachments:
-                generated_urls.append(sent.attachments[0].url)
-
-        add_images(ctx.author.id, generated_urls)
-        await msg.delete()
+        await self._generate(
+            ctx, msg, "Flux",
+            "black-forest-labs/flux-schnell", model_input,
+            caption=f"> **Flux Images** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
+            filename=lambda idx: f"flux_{idx}.png",
+            use_cache=use_cache
+        )
 
     @commands.command()
     async def listimages(self, ctx):
         """
-        List all stored images (with their indexes) for the user.
+        List your stored images (with their indexes and thumbnails), a page at a time.
         Usage: !listimages
         """
-        images = list_images(ctx.author.id)
-        if not images:
+        total = await count_images(ctx.author.id)
+        if not total:
             await ctx.send("You have no stored images.")
             return
-
-        message = "**Your Stored Images:**\n"
-        for idx, url in images:
-            message += f"**{idx}**: {url}\n"
-        await ctx.send(message)
+        await send_paginated(ctx, "image", total, IMAGES_PER_PAGE, list_images, render_image_page)
 
     @commands.command()
-    async def redux(self, ctx, index_str: str = "1", aspect_ratio: str = "9:16"):
+    async def redux(self, ctx, index_str: str = "1", aspect_ratio: str = "9:16", *flags):
         """
         Take a previously generated image and run it through the Flux Redux model.
         Default aspect ratio: 9:16.
         Usage: !redux <image_index> [aspect_ratio]
         Example: !redux 2 9:16
+        Add `nocache` to run a fresh prediction instead of reusing an earlier identical result.
         """
+        use_cache = "nocache" not in (aspect_ratio, *flags)
+        if aspect_ratio == "nocache":
+            aspect_ratio = "9:16"
         try:
             index = int(index_str)
         except ValueError:
             await ctx.send("Invalid image index. Please provide a number.")
             return
     
-        redux_image_url = get_image_by_index(ctx.author.id, index)
+        redux_image_url = await get_image_by_index(ctx.author.id, index)
         if not redux_image_url:
             await ctx.send(f"Invalid image index {index}. Use `!listimages` to see your stored images.")
             return
     
-        msg = await ctx.send(f"Running Redux on image #{index} with aspect_ratio={aspect_ratio}...")
+        msg = await send_status(ctx, f"Running Redux on image #{index} with aspect_ratio={aspect_ratio}...")
     
         redux_input = {
             "redux_image": redux_image_url,
             "aspect_ratio": aspect_ratio,
         }
     
-        try:
-            redux_output = await asyncio.to_thread(
-                replicate.run,
-                "black-forest-labs/flux-redux-dev",
-                input=redux_input
-            )
-        except Exception as e:
-            await msg.edit(content=f"Flux Redux generation failed: {e}")
-            return
-    
-        generated_urls = []
-        for i, file_like in enumerate(redux_output, start=1):
-            try:
-                redux_bytes = file_like.read()
-            except Exception:
-                continue
-            redux_data = io.BytesIO(redux_bytes)
-            sent = await ctx.send(
-                content=f"Redux output {i} from image #{index} with aspect_ratio={aspect_ratio}",
-                file=File(redux_data, f"redux_output_{i}.webp")
-            )
-            if sent.attachments:
-                generated_urls.append(sent.attachments[0].url)
-    
-        add_images(ctx.author.id, generated_urls)
-        await msg.delete()
+        await self._generate(
+            ctx, msg, "Flux Redux",
+            "black-forest-labs/flux-redux-dev", redux_input,
+            caption=f"Redux output from image #{index} with aspect_ratio={aspect_ratio}",
+            filename=lambda i: f"redux_output_{i}.webp",
+            use_cache=use_cache
+        )
 
     @commands.command()
     async def stable35(self, ctx, *args):
@@ -170,9 +272,11 @@ class GenerationCog(commands.Cog):
           - Using a stored prompt only: !stable35 prompt[1] aspect_ratio[9:16]
           - Using a direct prompt with a stored image: !stable35 A landscape at sunset image[2] aspect_ratio[9:16]
           - Using a direct prompt only: !stable35 A landscape at sunset aspect_ratio[9:16]
+        Add `nocache` to run a fresh prediction instead of reusing an earlier identical result.
         """
         stored_prompt = None
         direct_prompt_parts = []
+        use_cache = True
         input_image_url = None
         aspect_ratio = "9:16"
 
@@ -180,7 +284,7 @@ class GenerationCog(commands.Cog):
             if arg.startswith("prompt[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("prompt["):-1])
-                    stored_prompt = get_prompt_by_index(ctx.author.id, idx)
+                    stored_prompt = await get_prompt_by_index(ctx.author.id, idx)
                     if not stored_prompt:
                         await ctx.send(f"No stored prompt found at index {idx}.")
                         return
@@ -190,7 +294,7 @@ class GenerationCog(commands.Cog):
             elif arg.startswith("image[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("image["):-1])
-                    input_image_url = get_image_by_index(ctx.author.id, idx)
+                    input_image_url = await get_image_by_index(ctx.author.id, idx)
                     if not input_image_url:
                         await ctx.send(f"No stored image found at index {idx}.")
                         return
@@ -199,6 +303,8 @@ class GenerationCog(commands.Cog):
                     return
             elif arg.startswith("aspect_ratio[") and arg.endswith("]"):
                 aspect_ratio = arg[len("aspect_ratio["):-1]
+            elif arg == "nocache":
+                use_cache = False
             else:
                 direct_prompt_parts.append(arg)
 
@@ -216,7 +322,7 @@ class GenerationCog(commands.Cog):
         msg_text = f"**Stable Diffusion 3.5** generation in progress...\nPrompt: `{prompt}`\nAspect Ratio: {aspect_ratio}"
         if input_image_url:
             msg_text += "\nUsing image as a starting point."
-        msg = await ctx.send(msg_text)
+        msg = await send_status(ctx, msg_text)
 
         sd_input = {
             "prompt": prompt,
@@ -230,32 +336,13 @@ class GenerationCog(commands.Cog):
             sd_input["image"] = input_image_url
             sd_input["prompt_strength"] = prompt_strength
 
-        try:
-            output_files = await asyncio.to_thread(
-                replicate.run,
-                "stability-ai/stable-diffusion-3.5-large",
-                input=sd_input
-            )
-        except Exception as e:
-            await msg.edit(content=f"Stable Diffusion 3.5 generation failed: {e}")
-            return
-
-        generated_urls = []
-        for i, file_like in enumerate(output_files, start=1):
-            try:
-                image_bytes = file_like.read()
-            except Exception:
-                continue
-            image_data = io.BytesIO(image_bytes)
-            sent = await ctx.send(
-                content=f"**Stable Diffusion 3.5 Output {i}** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
-                file=File(image_data, f"sd35_output_{i}.{output_format}")
-            )
-            if sent.attachments:
-                generated_urls.append(sent.attachments[0].url)
-
-        add_images(ctx.author.id, generated_urls)
-        await msg.delete()
+        await self._generate(
+            ctx, msg, "Stable Diffusion 3.5",
+            "stability-ai/stable-diffusion-3.5-large", sd_input,
+            caption=f"**Stable Diffusion 3.5 Output** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
+            filename=lambda i: f"sd35_output_{i}.{output_format}",
+            use_cache=use_cache
+        )
 
     @commands.command()
     async def fluxpro(self, ctx, *args):
@@ -270,9 +357,11 @@ class GenerationCog(commands.Cog):
         Example:
           !fluxpro prompt[1] image[2] image_strength[0.5] aspect_ratio[9:16]
           !fluxpro an astronaut riding a horse image_strength[0.2] aspect_ratio[9:16]
+        Add `nocache` to run a fresh prediction instead of reusing an earlier identical result.
         """
         stored_prompt = None
         direct_prompt_parts = []
+        use_cache = True
         input_image_url = None
         image_strength = 0.1  # Default image_prompt_strength
         aspect_ratio = "9:16"
@@ -281,7 +370,7 @@ class GenerationCog(commands.Cog):
             if arg.startswith("prompt[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("prompt["):-1])
-                    stored_prompt = get_prompt_by_index(ctx.author.id, idx)
+                    stored_prompt = await get_prompt_by_index(ctx.author.id, idx)
                     if not stored_prompt:
                         await ctx.send(f"No stored prompt found at index {idx}.")
                         return
@@ -291,7 +380,7 @@ class GenerationCog(commands.Cog):
             elif arg.startswith("image[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("image["):-1])
-                    input_image_url = get_image_by_index(ctx.author.id, idx)
+                    input_image_url = await get_image_by_index(ctx.author.id, idx)
                     if not input_image_url:
                         await ctx.send(f"No stored image found at index {idx}.")
                         return
@@ -310,6 +399,8 @@ class GenerationCog(commands.Cog):
                     return
             elif arg.startswith("aspect_ratio[") and arg.endswith("]"):
                 aspect_ratio = arg[len("aspect_ratio["):-1]
+            elif arg == "nocache":
+                use_cache = False
             else:
                 direct_prompt_parts.append(arg)
         
@@ -318,7 +409,7 @@ class GenerationCog(commands.Cog):
             await ctx.send("Please provide a prompt either as a stored prompt (prompt[<index>]) or as direct text.")
             return
         
-        msg = await ctx.send(f"Generating image using Flux 1.1 Pro Ultra for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
+        msg = await send_status(ctx, f"Generating image using Flux 1.1 Pro Ultra for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
         
         model_input = {
             "prompt": prompt,
@@ -328,30 +419,13 @@ class GenerationCog(commands.Cog):
         if input_image_url:
             model_input["image_prompt"] = input_image_url
         
-        try:
-            output = await asyncio.to_thread(
-                replicate.run,
-                "black-forest-labs/flux-1.1-pro-ultra",
-                input=model_input
-            )
-        except Exception as e:
-            await msg.edit(content=f"Flux Pro generation failed: {e}")
-            return
-        
-        try:
-            image_bytes = output.read()
-        except Exception as e:
-            await msg.edit(content=f"Error reading output: {e}")
-            return
-        
-        file_data = io.BytesIO(image_bytes)
-        sent = await ctx.send(
-            content=f"> **Flux Pro Output** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
-            file=File(file_data, "fluxpro_output.jpg")
+        await self._generate(
+            ctx, msg, "Flux Pro",
+            "black-forest-labs/flux-1.1-pro-ultra", model_input,
+            caption=f"> **Flux Pro Output** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
+            filename=lambda i: "fluxpro_output.jpg",
+            use_cache=use_cache
         )
-        if sent.attachments:
-            add_images(ctx.author.id, [sent.attachments[0].url])
-        await msg.delete()
     
     @commands.command()
     async def sdxl(self, ctx, *args):
@@ -360,9 +434,11 @@ class GenerationCog(commands.Cog):
         Default aspect ratio: 9:16.
         Usage: !sdxl prompt[<index>] (or direct prompt) [aspect_ratio[<value>]]
         Note: SDXL in this example uses pixel dimensions; default for 9:16 is 576x1024.
+        Add `nocache` to run a fresh prediction instead of reusing an earlier identical result.
         """
         stored_prompt = None
         direct_prompt_parts = []
+        use_cache = True
         aspect_ratio = "9:16"
         width, height = 576, 1024  # Default dimensions for 9:16
 
@@ -370,7 +446,7 @@ class GenerationCog(commands.Cog):
             if arg.startswith("prompt[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("prompt["):-1])
-                    stored_prompt = get_prompt_by_index(ctx.author.id, idx)
+                    stored_prompt = await get_prompt_by_index(ctx.author.id, idx)
                     if not stored_prompt:
                         await ctx.send(f"No stored prompt found at index {idx}.")
                         return
@@ -382,6 +458,8 @@ class GenerationCog(commands.Cog):
                 if aspect_ratio == "9:16":
                     width, height = 576, 1024
                 # Add logic here for other aspect ratios if desired.
+            elif arg == "nocache":
+                use_cache = False
             else:
                 direct_prompt_parts.append(arg)
         
@@ -390,7 +468,7 @@ class GenerationCog(commands.Cog):
             await ctx.send("Please provide a prompt.")
             return
 
-        msg = await ctx.send(f"Generating image using SDXL for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
+        msg = await send_status(ctx, f"Generating image using SDXL for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
 
         model_input = {
             "width": width,
@@ -400,31 +478,13 @@ class GenerationCog(commands.Cog):
             "apply_watermark": False,
             "num_inference_steps": 25
         }
-        try:
-            output = await asyncio.to_thread(
-                replicate.run,
-                "stability-ai/sdxl:7762fd07cf82c948538e41f63f77d685e02b063e37e496e96eefd46c929f9bdc",
-                input=model_input
-            )
-        except Exception as e:
-            await msg.edit(content=f"SDXL generation failed: {e}")
-            return
-
-        generated_urls = []
-        for i, file_like in enumerate(output, start=1):
-            try:
-                image_bytes = file_like.read()
-            except Exception:
-                continue
-            image_data = io.BytesIO(image_bytes)
-            sent = await ctx.send(
-                content=f"**SDXL Output {i}** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
-                file=File(image_data, f"sdxl_output_{i}.png")
-            )
-            if sent.attachments:
-                generated_urls.append(sent.attachments[0].url)
-        add_images(ctx.author.id, generated_urls)
-        await msg.delete()
+        await self._generate(
+            ctx, msg, "SDXL",
+            "stability-ai/sdxl:7762fd07cf82c948538e41f63f77d685e02b063e37e496e96eefd46c929f9bdc", model_input,
+            caption=f"**SDXL Output** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
+            filename=lambda i: f"sdxl_output_{i}.png",
+            use_cache=use_cache
+        )
 
     @commands.command()
     async def imagen(self, ctx, *args):
@@ -432,15 +492,17 @@ class GenerationCog(commands.Cog):
         Generate an image using Google Imagen 3.
         Default aspect ratio: 9:16.
         Usage: !imagen prompt[<index>] (or direct prompt) [aspect_ratio[<value>]]
+        Add `nocache` to run a fresh prediction instead of reusing an earlier identical result.
         """
         stored_prompt = None
         direct_prompt_parts = []
+        use_cache = True
         aspect_ratio = "9:16"
         for arg in args:
             if arg.startswith("prompt[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("prompt["):-1])
-                    stored_prompt = get_prompt_by_index(ctx.author.id, idx)
+                    stored_prompt = await get_prompt_by_index(ctx.author.id, idx)
                     if not stored_prompt:
                         await ctx.send(f"No stored prompt found at index {idx}.")
                         return
@@ -449,6 +511,8 @@ class GenerationCog(commands.Cog):
                     return
             elif arg.startswith("aspect_ratio[") and arg.endswith("]"):
                 aspect_ratio = arg[len("aspect_ratio["):-1]
+            elif arg == "nocache":
+                use_cache = False
             else:
                 direct_prompt_parts.append(arg)
         prompt = stored_prompt if stored_prompt else " ".join(direct_prompt_parts).strip()
@@ -456,7 +520,7 @@ class GenerationCog(commands.Cog):
             await ctx.send("Please provide a prompt.")
             return
 
-        msg = await ctx.send(f"Generating image using Imagen 3 for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
+        msg = await send_status(ctx, f"Generating image using Imagen 3 for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
 
         model_input = {
             "prompt": prompt,
@@ -464,30 +528,13 @@ class GenerationCog(commands.Cog):
             "negative_prompt": "",
             "safety_filter_level": "block_medium_and_above"
         }
-        try:
-            output = await asyncio.to_thread(
-                replicate.run,
-                "google/imagen-3",
-                input=model_input
-            )
-        except Exception as e:
-            await msg.edit(content=f"Imagen generation failed: {e}")
-            return
-
-        try:
-            image_bytes = output.read()
-        except Exception as e:
-            await msg.edit(content=f"Error reading Imagen output: {e}")
-            return
-
-        file_data = io.BytesIO(image_bytes)
-        sent = await ctx.send(
-            content=f"**Imagen 3 Output** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
-            file=File(file_data, "imagen_output.png")
+        await self._generate(
+            ctx, msg, "Imagen",
+            "google/imagen-3", model_input,
+            caption=f"**Imagen 3 Output** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
+            filename=lambda i: "imagen_output.png",
+            use_cache=use_cache
         )
-        if sent.attachments:
-            add_images(ctx.author.id, [sent.attachments[0].url])
-        await msg.delete()
 
     @commands.command()
     async def recraftv3(self, ctx, *args):
@@ -495,15 +542,17 @@ class GenerationCog(commands.Cog):
         Generate an image using Recraft V3.
         Default aspect ratio: 9:16.
         Usage: !recraftv3 prompt[<index>] (or direct prompt) [aspect_ratio[<value>]]
+        Add `nocache` to run a fresh prediction instead of reusing an earlier identical result.
         """
         stored_prompt = None
         direct_prompt_parts = []
+        use_cache = True
         aspect_ratio = "9:16"
         for arg in args:
             if arg.startswith("prompt[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("prompt["):-1])
-                    stored_prompt = get_prompt_by_index(ctx.author.id, idx)
+                    stored_prompt = await get_prompt_by_index(ctx.author.id, idx)
                     if not stored_prompt:
                         await ctx.send(f"No stored prompt found at index {idx}.")
                         return
@@ -512,6 +561,8 @@ class GenerationCog(commands.Cog):
                     return
             elif arg.startswith("aspect_ratio[") and arg.endswith("]"):
                 aspect_ratio = arg[len("aspect_ratio["):-1]
+            elif arg == "nocache":
+                use_cache = False
             else:
                 direct_prompt_parts.append(arg)
         prompt = stored_prompt if stored_prompt else " ".join(direct_prompt_parts).strip()
@@ -519,37 +570,20 @@ class GenerationCog(commands.Cog):
             await ctx.send("Please provide a prompt.")
             return
 
-        msg = await ctx.send(f"Generating image using Recraft V3 for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
+        msg = await send_status(ctx, f"Generating image using Recraft V3 for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
 
         # For Recraft V3, update the size to a 9:16 dimension. Here we use "576x1024".
         model_input = {
             "prompt": prompt,
             "size": "576x1024"
         }
-        try:
-            output = await asyncio.to_thread(
-                replicate.run,
-                "recraft-ai/recraft-v3",
-                input=model_input
-            )
-        except Exception as e:
-            await msg.edit(content=f"Recraft V3 generation failed: {e}")
-            return
-
-        try:
-            image_bytes = output.read()
-        except Exception as e:
-            await msg.edit(content=f"Error reading Recraft V3 output: {e}")
-            return
-
-        file_data = io.BytesIO(image_bytes)
-        sent = await ctx.send(
-            content=f"**Recraft V3 Output** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
-            file=File(file_data, "recraftv3_output.webp")
+        await self._generate(
+            ctx, msg, "Recraft V3",
+            "recraft-ai/recraft-v3", model_input,
+            caption=f"**Recraft V3 Output** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
+            filename=lambda i: "recraftv3_output.webp",
+            use_cache=use_cache
         )
-        if sent.attachments:
-            add_images(ctx.author.id, [sent.attachments[0].url])
-        await msg.delete()
 
     @commands.command()
     async def playground(self, ctx, *args):
@@ -557,9 +591,11 @@ class GenerationCog(commands.Cog):
         Generate images using Playground V2.5 Aesthetic.
         Default aspect ratio: 9:16.
         Usage: !playground prompt[<index>] (or direct prompt) and optionally image[<index>] [aspect_ratio[<value>]]
+        Add `nocache` to run a fresh prediction instead of reusing an earlier identical result.
         """
         stored_prompt = None
         direct_prompt_parts = []
+        use_cache = True
         input_image_url = None
         aspect_ratio = "9:16"
 
@@ -567,7 +603,7 @@ class GenerationCog(commands.Cog):
             if arg.startswith("prompt[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("prompt["):-1])
-                    stored_prompt = get_prompt_by_index(ctx.author.id, idx)
+                    stored_prompt = await get_prompt_by_index(ctx.author.id, idx)
                     if not stored_prompt:
                         await ctx.send(f"No stored prompt found at index {idx}.")
                         return
@@ -577,7 +613,7 @@ class GenerationCog(commands.Cog):
             elif arg.startswith("image[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("image["):-1])
-                    input_image_url = get_image_by_index(ctx.author.id, idx)
+                    input_image_url = await get_image_by_index(ctx.author.id, idx)
                     if not input_image_url:
                         await ctx.send(f"No stored image found at index {idx}.")
                         return
@@ -586,6 +622,8 @@ class GenerationCog(commands.Cog):
                     return
             elif arg.startswith("aspect_ratio[") and arg.endswith("]"):
                 aspect_ratio = arg[len("aspect_ratio["):-1]
+            elif arg == "nocache":
+                use_cache = False
             else:
                 direct_prompt_parts.append(arg)
 
@@ -594,7 +632,7 @@ class GenerationCog(commands.Cog):
             await ctx.send("Please provide a prompt.")
             return
 
-        msg = await ctx.send(f"Generating image using Playground V2.5 Aesthetic for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
+        msg = await send_status(ctx, f"Generating image using Playground V2.5 Aesthetic for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
 
         # For Playground, update dimensions for 9:16. We'll use 576x1024.
         model_input = {
@@ -613,31 +651,13 @@ class GenerationCog(commands.Cog):
         if input_image_url:
             model_input["image"] = input_image_url
 
-        try:
-            output = await asyncio.to_thread(
-                replicate.run,
-                "playgroundai/playground-v2.5-1024px-aesthetic:a45f82a1382bed5c7aeb861dac7c7d191b0fdf74d8d57c4a0e6ed7d4d0bf7d24",
-                input=model_input
-            )
-        except Exception as e:
-            await msg.edit(content=f"Playground generation failed: {e}")
-            return
-
-        generated_urls = []
-        for i, file_like in enumerate(output, start=1):
-            try:
-                image_bytes = file_like.read()
-            except Exception:
-                continue
-            image_data = io.BytesIO(image_bytes)
-            sent = await ctx.send(
-                content=f"**Playground V2.5 Aesthetic Output {i}** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
-                file=File(image_data, f"playground_output_{i}.png")
-            )
-            if sent.attachments:
-                generated_urls.append(sent.attachments[0].url)
-        add_images(ctx.author.id, generated_urls)
-        await msg.delete()
+        await self._generate(
+            ctx, msg, "Playground",
+            "playgroundai/playground-v2.5-1024px-aesthetic:a45f82a1382bed5c7aeb861dac7c7d191b0fdf74d8d57c4a0e6ed7d4d0bf7d24", model_input,
+            caption=f"**Playground V2.5 Aesthetic Output** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
+            filename=lambda i: f"playground_output_{i}.png",
+            use_cache=use_cache
+        )
         
     @commands.command()
     async def multigen(self, ctx, *args):
@@ -651,9 +671,11 @@ class GenerationCog(commands.Cog):
           - Optionally, include an image: !multigen prompt[1] image[2] [aspect_ratio[9:16]]
         
         This command calls a set of predefined models and returns all outputs.
+        Add `nocache` to run a fresh prediction instead of reusing an earlier identical result.
         """
         stored_prompt = None
         direct_prompt_parts = []
+        use_cache = True
         input_image_url = None
         aspect_ratio = "9:16"
 
@@ -668,7 +690,7 @@ class GenerationCog(commands.Cog):
             if arg.startswith("prompt[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("prompt["):-1])
-                    stored_prompt = get_prompt_by_index(ctx.author.id, idx)
+                    stored_prompt = await get_prompt_by_index(ctx.author.id, idx)
                     if not stored_prompt:
                         await ctx.send(f"No stored prompt found at index {idx}.")
                         return
@@ -678,7 +700,7 @@ class GenerationCog(commands.Cog):
             elif arg.startswith("image[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("image["):-1])
-                    input_image_url = get_image_by_index(ctx.author.id, idx)
+                    input_image_url = await get_image_by_index(ctx.author.id, idx)
                     if not input_image_url:
                         await ctx.send(f"No stored image found at index {idx}.")
                         return
@@ -687,6 +709,8 @@ class GenerationCog(commands.Cog):
                     return
             elif arg.startswith("aspect_ratio[") and arg.endswith("]"):
                 continue  # Already processed.
+            elif arg == "nocache":
+                use_cache = False
             else:
                 direct_prompt_parts.append(arg)
         
@@ -695,7 +719,7 @@ class GenerationCog(commands.Cog):
             await ctx.send("Please provide a prompt either as a stored prompt (prompt[<index>]) or as direct text.")
             return
 
-        msg = await ctx.send(f"Generating images concurrently for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
+        msg = await send_status(ctx, f"Generating images concurrently for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}")
 
         # Define the models to use and their input generation lambdas.
         models = {
@@ -765,53 +789,76 @@ class GenerationCog(commands.Cog):
             }
         }
 
-        async def run_model(model_key, model_info):
+        # All six predictions share the status message: one queue-position line
+        # and a progress line per model. Each model's images are posted as soon
+        # as that model finishes, fastest first.
+        async def generate(model_key, model_info, status):
             input_dict = model_info["input"](prompt, input_image_url)
+            key = cache_key(model_info["replicate_id"], input_dict)
+            caption = f"**{model_key.capitalize()} Output** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}"
+            cached = output_cache.get(key) if use_cache else None
+            if cached:
+                await ctx.send(content=cached_caption(caption, cached))
+                return cached
+            model_urls = await predict_and_publish(
+                ctx, model_info["replicate_id"], input_dict, status, caption,
+                lambda idx: f"{model_key}_output_{idx}.png", label=model_key, preview=True
+            )
+            if model_urls:
+                output_cache.put(key, model_urls)
+            return model_urls
+
+        async def run_one(model_key, model_info):
+            # Each model gets its own deadline so one slow model cannot hold back the rest.
+            # It starts when the scheduler starts the model's job, not while it is queued.
             try:
-                result = await asyncio.to_thread(
-                    replicate.run,
-                    model_info["replicate_id"],
-                    input=input_dict
-                )
+                async with asyncio.timeout(None) as scope:
+                    status = DeadlineStatus(msg, scope, MULTIGEN_MODEL_TIMEOUT)
+                    model_urls = await generate(model_key, model_info, status)
+            except asyncio.TimeoutError:
+                return model_key, f"Timed out after {MULTIGEN_MODEL_TIMEOUT:.0f}s.", None
             except Exception as e:
                 return model_key, f"Error: {e}", None
+            return model_key, None, model_urls
 
-            outputs = []
-            if isinstance(result, list):
-                for item in result:
-                    try:
-                        outputs.append(item.read())
-                    except Exception:
-                        continue
-            else:
-                try:
-                    outputs.append(result.read())
-                except Exception:
-                    pass
-            return model_key, None, outputs
-
-        tasks = [run_model(key, info) for key, info in models.items()]
-        results = await asyncio.gather(*tasks)
-
+        started = time.perf_counter()
+        first_image_logged = False
         all_generated_urls = []
-        for model_key, error, outputs in results:
-            if error:
-                await ctx.send(f"**{model_key}**: {error}")
-                continue
-            if not outputs:
-                await ctx.send(f"**{model_key}**: No output generated.")
-                continue
-            for idx, output_bytes in enumerate(outputs, start=1):
-                file_data = io.BytesIO(output_bytes)
-                filename = f"{model_key}_output_{idx}.png"
-                sent = await ctx.send(
-                    content=f"**{model_key.capitalize()} Output {idx}** for prompt:\n> {prompt}\nAspect Ratio: {aspect_ratio}",
-                    file=File(file_data, filename)
-                )
-                if sent.attachments:
-                    all_generated_urls.append(sent.attachments[0].url)
-        add_images(ctx.author.id, all_generated_urls)
+        # Explicit tasks so that a cancelled !multigen cancels the models still running.
+        tasks = [asyncio.create_task(run_one(key, info)) for key, info in models.items()]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                model_key, error, model_urls = await next_result
+                msg.set_progress(model_key, "failed" if error or not model_urls else "done")
+                if error:
+                    await ctx.send(f"**{model_key}**: {error}")
+                    continue
+                if not model_urls:
+                    await ctx.send(f"**{model_key}**: No output generated.")
+                    continue
+                all_generated_urls.extend(model_urls)
+                if model_urls and not first_image_logged:
+                    first_image_logged = True
+                    log.info("multigen: time to first image %.2fs (%s)", time.perf_counter() - started, model_key)
+        finally:
+            for task in tasks:
+                task.cancel()
+        log.info("multigen: all %d models done in %.2fs", len(models), time.perf_counter() - started)
+        await add_images(ctx.author.id, all_generated_urls)
         await msg.delete()
 
+def cached_caption(caption, urls):
+    """Caption for a cached result, linking the earlier attachments."""
+    return "\n".join([caption, "*(cached result)*", *urls])
+
+def render_image_page(rows, page, pages):
+    """Render one page of (index, url) rows for !listimages as thumbnail embeds."""
+    embeds = []
+    for idx, url in rows:
+        embed = discord.Embed(title=f"Image {idx}", description=f"`image[{idx}]`")
+        embed.set_thumbnail(url=url)
+        embeds.append(embed)
+    return {"content": f"**Your Stored Images** (page {page}/{pages}):", "embeds": embeds}
+
 async def setup(bot):
     await bot.add_cog(GenerationCog(bot))
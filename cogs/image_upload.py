@@ -29,7 +29,7 @@ class ImageUploadCog(commands.Cog):
                 await ctx.send(f"Attachment `{attachment.filename}` is not recognized as an image.")
 
         if image_urls:
-            add_images(ctx.author.id, image_urls)
+            await add_images(ctx.author.id, image_urls)
             await ctx.send(f"Uploaded {len(image_urls)} image(s). Use `!listimages` to view your saved images.")
         else:
             await ctx.send("No valid image attachments were found.")
@@ -0,0 +1,43 @@
+# cogs/profile.py
+from discord.ext import commands
+from utils.watchdog import watchdog
+
+class ProfileCog(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.command()
+    @commands.is_owner()
+    async def profile(self, ctx, state: str = "", *command_names):
+        """
+        Profile commands as they run (bot owner only). Each profiled command's
+        event-loop time is sampled and written to the bot's PROFILE_DIR as a
+        .folded file (open it with speedscope or flamegraph.pl).
+
+        Usage:
+          !profile on             profile every command
+          !profile on flux gpt    profile only !flux and !gpt
+          !profile off
+          !profile                show whether profiling is on
+        """
+        state = state.lower()
+        if state == "on":
+            names = [name.lstrip("!") for name in command_names]
+            unknown = [name for name in names if self.bot.get_command(name) is None]
+            if unknown:
+                await ctx.send(f"Unknown command(s): {', '.join(unknown)}")
+                return
+            watchdog.profile(names)
+            which = ", ".join(f"!{name}" for name in names) if names else "all commands"
+            await ctx.send(f"Profiling {which}; profiles go to `{watchdog.profile_dir}`.")
+        elif state == "off":
+            watchdog.stop_profiling()
+            await ctx.send("Profiling is off.")
+        elif watchdog.profiling is None:
+            await ctx.send("Profiling is off.")
+        else:
+            which = ", ".join(f"!{name}" for name in sorted(watchdog.profiling)) or "all commands"
+            await ctx.send(f"Profiling {which}; profiles go to `{watchdog.profile_dir}`.")
+
+async def setup(bot):
+    await bot.add_cog(ProfileCog(bot))
@@ -1,10 +1,20 @@
 
 # cogs/prompt_gen.py
-import replicate
 from discord.ext import commands
-from utils.prompt_manager import save_prompt, list_prompts, get_prompt_by_index
+from utils.prompt_manager import save_prompt, list_prompts, count_prompts, get_prompt_by_index
+from utils.inference import run_llm
+from utils.scheduler import submit
+from utils.status import send_status
+from utils.llm_memo import llm_memo
+from utils.paginator import send_paginated
+
+# Eight 200-character previews keep a page under Discord's 2000-character limit.
+PROMPTS_PER_PAGE = 8
 
 class PromptCog(commands.Cog):
+    # What outputs are saved as (utils/journal.py saves resumed ones the same way)
+    output_kind = "prompt"
+
     def __init__(self, bot):
         self.bot = bot
 
@@ -23,7 +33,7 @@ class PromptCog(commands.Cog):
             return
 
         # Let the user know we're working
-        msg = await ctx.send(f"**Generating a text-to-image prompt** from your concept:\n> {concept}")
+        msg = await send_status(ctx, f"**Generating a text-to-image prompt** from your concept:\n> {concept}")
 
                 # Prepare your Llama 3 70B Instruct inputs
         # Example updated system_prompt for Llama 3 70B Instruct
@@ -57,20 +67,21 @@ class PromptCog(commands.Cog):
         try:
             # Use the 70B Instruct model on Replicate
             # Name: "meta/meta-llama-3-70b-instruct"
-            llm_output = replicate.run("meta/meta-llama-3-70b-instruct", input=llm_input)
-            # llm_output can be a string or list of strings
-            if isinstance(llm_output, list):
-                final_prompt = "\n".join(llm_output).strip()
-            else:
-                final_prompt = llm_output.strip()
+            # Identical concepts are answered from the memo (utils/llm_memo.py).
+            final_prompt = await llm_memo.run(
+                "meta/meta-llama-3-70b-instruct", llm_input,
+                lambda: submit(
+                    ctx.author.id,
+                    lambda: run_llm("meta/meta-llama-3-70b-instruct", llm_input),
+                    status=msg
+                )
+            )
         except Exception as e:
             await msg.edit(content=f"LLM generation failed: {e}")
             return
 
         # Save the prompt
-        save_prompt(ctx.author.id, final_prompt)
-        # Get the index of the newly added prompt
-        new_index = list_prompts(ctx.author.id)[-1][0]
+        new_index = await save_prompt(ctx.author.id, final_prompt)
 
         await msg.edit(content=(
             f"**LLM-Generated Prompt (Index {new_index}):**\n"
@@ -98,7 +109,7 @@ class PromptCog(commands.Cog):
             if arg.startswith("prompt[") and arg.endswith("]"):
                 try:
                     idx = int(arg[len("prompt["):-1])
-                    stored_prompt = get_prompt_by_index(ctx.author.id, idx)
+                    stored_prompt = await get_prompt_by_index(ctx.author.id, idx)
                     if not stored_prompt:
                         await ctx.send(f"No stored prompt found at index {idx}.")
                         return
@@ -117,7 +128,8 @@ class PromptCog(commands.Cog):
             return
     
         # Let the user know we're refining
-        msg = await ctx.send(
+        msg = await send_status(
+            ctx,
             f"Refining prompt (from stored prompt) with your instructions:\n> {instructions}"
         )
     
@@ -138,18 +150,20 @@ class PromptCog(commands.Cog):
     
         try:
             # Use Claude 3.5 Sonnet model (Name: "anthropic/claude-3.5-sonnet")
-            llm_output = replicate.run("anthropic/claude-3.5-sonnet", input=claude_input)
-            if isinstance(llm_output, list):
-                refined_prompt = "\n".join(llm_output).strip()
-            else:
-                refined_prompt = llm_output.strip()
+            refined_prompt = await llm_memo.run(
+                "anthropic/claude-3.5-sonnet", claude_input,
+                lambda: submit(
+                    ctx.author.id,
+                    lambda: run_llm("anthropic/claude-3.5-sonnet", claude_input),
+                    status=msg
+                )
+            )
         except Exception as e:
             await msg.edit(content=f"Refinement failed: {e}")
             return
     
         # Save the refined prompt as a new entry
-        save_prompt(ctx.author.id, refined_prompt)
-        new_index = list_prompts(ctx.author.id)[-1][0]
+        new_index = await save_prompt(ctx.author.id, refined_prompt)
     
         await msg.edit(content=(
             f"**Refined Prompt Saved (Index {new_index}):**\n"
@@ -161,19 +175,22 @@ class PromptCog(commands.Cog):
     @commands.command()
     async def listprompts(self, ctx):
         """
-        Lists your stored prompts.
+        Lists your stored prompts, a page at a time.
         Usage: !listprompts
         """
-        prompts = list_prompts(ctx.author.id)
-        if not prompts:
+        total = await count_prompts(ctx.author.id)
+        if not total:
             await ctx.send("You have no stored prompts. Generate one using `!gpt <concept>`.")
             return
-
-        message = "**Your Stored Prompts:**\n"
-        for idx, prompt in prompts:
-            preview = prompt[:200] + ("..." if len(prompt) > 200 else "")
-            message += f"**{idx}**: {preview}\n"
-        await ctx.send(message)
+        await send_paginated(ctx, "prompt", total, PROMPTS_PER_PAGE, list_prompts, render_prompt_page)
+
+def render_prompt_page(rows, page, pages):
+    """Render one page of (index, prompt) rows for !listprompts."""
+    lines = [f"**Your Stored Prompts** (page {page}/{pages}):"]
+    for idx, prompt in rows:
+        preview = prompt[:200] + ("..." if len(prompt) > 200 else "")
+        lines.append(f"**{idx}**: {preview}")
+    return {"content": "\n".join(lines)}
 
 async def setup(bot):
     await bot.add_cog(PromptCog(bot))
@@ -29,7 +29,7 @@ class VideoUploadCog(commands.Cog):
                 await ctx.send(f"Attachment `{attachment.filename}` is not recognized as a video.")
 
         if video_urls:
-            add_videos(ctx.author.id, video_urls)
+            await add_videos(ctx.author.id, video_urls)
             await ctx.send(f"Uploaded {len(video_urls)} video(s). Use `!listvideos` to view your saved videos.")
         else:
             await ctx.send("No valid video attachments were found.")
@@ -1,4 +0,0 @@
-# state.py
-user_generated_images = {}
-pending_prompts = {}
-
@@ -0,0 +1,257 @@
+# utils/broker.py
+import os
+import json
+import time
+import asyncio
+import itertools
+from utils import metrics
+from utils.storage import store
+
+# Jobs go from the gateway process to the worker processes (BOT_MODE=gateway,
+# see utils/workers.py) through a broker. A job is a kind and a JSON payload;
+# its result is JSON too. Two implementations, picked with BROKER:
+#
+#   sqlite  the broker_jobs table of the SQLite store (DATABASE_PATH), which
+#           every process on the machine shares; run workers with worker.py
+#   memory  an in-process queue; the workers run as tasks in the gateway
+#           process (for development and tests)
+#
+# A claimed job is leased to its worker for BROKER_LEASE seconds and the
+# worker renews the lease while it runs, so a job whose worker died is handed
+# out again once the lease runs out. Cancelling a job drops it if it is still
+# queued; a running one is stopped at its next renewal.
+BROKER = os.environ.get("BROKER", "sqlite")
+BROKER_LEASE = float(os.environ.get("BROKER_LEASE", "60"))
+BROKER_POLL_INTERVAL = 0.02
+BROKER_POLL_MAX = 0.25
+BROKER_RESULT_TTL = 3600
+
+BROKER_JOBS = metrics.counter("bot_broker_jobs_total", "Jobs put on the broker.", labels=("kind",))
+
+class JobFailed(Exception):
+    """Raised by result() when the worker running a job raised an error."""
+
+class JobLost(Exception):
+    """Raised by result() when a job was cancelled or disappeared from the broker."""
+
+class MemoryBroker:
+    """Broker for workers in the same process: an asyncio queue of job ids."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._queue = None
+        self._jobs = {}       # id -> {"kind", "payload", "status", "future"}
+
+    def _get_queue(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def put(self, kind, payload):
+        job_id = next(self._ids)
+        self._jobs[job_id] = {
+            "kind": kind, "payload": json.dumps(payload), "status": "queued",
+            "future": asyncio.get_running_loop().create_future(),
+        }
+        self._get_queue().put_nowait(job_id)
+        BROKER_JOBS.inc(kind=kind)
+        return job_id
+
+    async def claim(self, worker, timeout):
+        """The next queued job as (id, kind, payload), or None after timeout seconds."""
+        queue = self._get_queue()
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                job_id = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] == "queued":
+                job["status"] = "running"
+                return job_id, job["kind"], json.loads(job["payload"])
+        return None
+
+    async def renew(self, job_id, worker):
+        """Extend a running job's lease; False if it should stop (it was cancelled)."""
+        job = self._jobs.get(job_id)
+        return job is not None and job["status"] == "running"
+
+    async def complete(self, job_id, result=None, error=None):
+        job = self._jobs.get(job_id)
+        if job is None or job["future"].done():
+            return
+        if error is not None:
+            job["future"].set_exception(JobFailed(error))
+        else:
+            job["future"].set_result(json.loads(json.dumps(result)))
+
+    async def result(self, job_id):
+        """Wait for a job to finish and return its result (raises JobFailed)."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise JobLost(f"Unknown job {job_id}")
+        try:
+            return await asyncio.shield(job["future"])
+        finally:
+            if job["future"].done():
+                self._jobs.pop(job_id, None)
+
+    async def cancel(self, job_id):
+        job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job["status"] = "cancelled"
+            job["future"].cancel()
+
+    async def close(self):
+        pass
+
+class SQLiteBroker:
+    """
+    Broker over the shared SQLite store. Workers poll for queued jobs (backing
+    off to BROKER_POLL_MAX when idle); the gateway polls once for the results
+    of all the jobs it is waiting on.
+    """
+
+    def __init__(self, store=store):
+        self.store = store
+        self._waiting = {}    # job id -> future for its result
+        self._poller = None
+
+    async def put(self, kind, payload):
+        job_id = await self.store.call(_broker_put, kind, json.dumps(payload))
+        BROKER_JOBS.inc(kind=kind)
+        return job_id
+
+    async def claim(self, worker, timeout):
+        deadline = time.monotonic() + timeout
+        interval = BROKER_POLL_INTERVAL
+        while True:
+            row = await self.store.call(_broker_claim, worker, time.time(), BROKER_LEASE)
+            if row is not None:
+                job_id, kind, payload = row
+                return job_id, kind, json.loads(payload)
+            if time.monotonic() + interval > deadline:
+                return None
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, BROKER_POLL_MAX)
+
+    async def renew(self, job_id, worker):
+        return await self.store.call(_broker_renew, job_id, worker, time.time() + BROKER_LEASE)
+
+    async def complete(self, job_id, result=None, error=None):
+        await self.store.call(
+            _broker_complete, job_id, None if error is not None else json.dumps(result), error, time.time()
+        )
+
+    async def result(self, job_id):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[job_id] = future
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        try:
+            return await future
+        finally:
+            self._waiting.pop(job_id, None)
+
+    async def _poll(self):
+        interval = BROKER_POLL_INTERVAL
+        while self._waiting:
+            await asyncio.sleep(interval)
+            ids = list(self._waiting)
+            rows = await self.store.call(_broker_finished, ids, time.time() - BROKER_RESULT_TTL)
+            interval = BROKER_POLL_INTERVAL if rows else min(interval * 2, BROKER_POLL_MAX)
+            for job_id, status, result, error in rows:
+                future = self._waiting.get(job_id)
+                if future is None or future.done():
+                    continue
+                if status == "done":
+                    future.set_result(json.loads(result))
+                elif status == "failed":
+                    future.set_exception(JobFailed(error))
+                else:
+                    future.set_exception(JobLost(f"Job {job_id} is gone"))
+
+    async def cancel(self, job_id):
+        await self.store.call(_broker_cancel, job_id)
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+
+def _broker_put(conn, kind, payload):
+    return conn.execute(
+        "INSERT INTO broker_jobs (kind, payload, status) VALUES (?, ?, 'queued') RETURNING id",
+        (kind, payload)
+    ).fetchone()[0]
+
+def _broker_claim(conn, worker, now, lease):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Jobs whose worker stopped renewing go back on the queue.
+        conn.execute(
+            "UPDATE broker_jobs SET status = 'queued', claimed_by = NULL "
+            "WHERE status = 'running' AND lease_until < ?", (now,)
+        )
+        row = conn.execute(
+            "UPDATE broker_jobs SET status = 'running', claimed_by = ?, lease_until = ? "
+            "WHERE id = (SELECT id FROM broker_jobs WHERE status = 'queued' ORDER BY id LIMIT 1) "
+            "RETURNING id, kind, payload",
+            (worker, now + lease)
+        ).fetchone()
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+def _broker_renew(conn, job_id, worker, lease_until):
+    cursor = conn.execute(
+        "UPDATE broker_jobs SET lease_until = ? WHERE id = ? AND claimed_by = ? AND status = 'running'",
+        (lease_until, job_id, worker)
+    )
+    return cursor.rowcount > 0
+
+def _broker_complete(conn, job_id, result, error, now):
+    conn.execute("DELETE FROM broker_jobs WHERE id = ? AND status = 'cancelled'", (job_id,))
+    conn.execute(
+        "UPDATE broker_jobs SET status = ?, result = ?, error = ?, finished = ?, claimed_by = NULL "
+        "WHERE id = ? AND status = 'running'",
+        ("failed" if error is not None else "done", result, error, now, job_id)
+    )
+
+def _broker_finished(conn, ids, oldest):
+    # Results nobody collected (their gateway restarted) are pruned after a
+    # while, as are cancelled jobs whose worker died before noticing.
+    conn.execute(
+        "DELETE FROM broker_jobs WHERE (status IN ('done', 'failed') AND finished < ?) "
+        "OR (status = 'cancelled' AND lease_until < ?)", (oldest, time.time())
+    )
+    rows = []
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        marks = ",".join("?" * len(chunk))
+        found = conn.execute(
+            f"DELETE FROM broker_jobs WHERE id IN ({marks}) AND status IN ('done', 'failed') "
+            "RETURNING id, status, result, error",
+            chunk
+        ).fetchall()
+        # Ids neither finished nor still queued or running were cancelled or pruned.
+        known = {row[0] for row in found}
+        known.update(row[0] for row in conn.execute(f"SELECT id FROM broker_jobs WHERE id IN ({marks})", chunk))
+        rows.extend(found)
+        rows.extend((job_id, "lost", None, None) for job_id in chunk if job_id not in known)
+    return rows
+
+def _broker_cancel(conn, job_id):
+    conn.execute("DELETE FROM broker_jobs WHERE id = ? AND status = 'queued'", (job_id,))
+    conn.execute("UPDATE broker_jobs SET status = 'cancelled' WHERE id = ? AND status = 'running'", (job_id,))
+
+def create_broker(kind=BROKER):
+    if kind == "memory":
+        return MemoryBroker()
+    if kind == "sqlite":
+        return SQLiteBroker()
+    raise ValueError(f"Unknown BROKER {kind!r} (use sqlite or memory)")
+
+broker = create_broker()
@@ -0,0 +1,210 @@
+# utils/buffers.py
+import os
+import shutil
+import asyncio
+import tempfile
+from collections import deque
+from utils import metrics
+
+# Model outputs are held in spooled buffers from download until they have
+# been posted: in memory up to SPOOL_MAX_MEMORY bytes each, in a temporary
+# file beyond that. The buffer itself is passed to discord.File, so an output
+# is never copied on its way to Discord. Downloads write with awrite(), which
+# moves the spill to disk and every write after it to a thread, so a large
+# output never stalls the event loop on disk I/O.
+#
+# All outputs held at once share a budget of OUTPUT_BYTES_BUDGET bytes. A
+# download reserves OUTPUT_RESERVE_BYTES before it starts and waits while the
+# budget is spent, so a burst of !multigens queues here instead of running the
+# instance out of memory. Outputs larger than their reservation take the rest
+# without waiting (a half-finished download never waits on another), and give
+# back what they did not use once complete.
+SPOOL_MAX_MEMORY = int(os.environ.get("SPOOL_MAX_MEMORY", str(1024 * 1024)))
+OUTPUT_BYTES_BUDGET = int(os.environ.get("OUTPUT_BYTES_BUDGET", str(256 * 1024 * 1024)))
+OUTPUT_RESERVE_BYTES = int(os.environ.get("OUTPUT_RESERVE_BYTES", str(2 * 1024 * 1024)))
+COPY_CHUNK = 64 * 1024
+
+class ByteBudget:
+    """
+    A process-wide count of bytes in flight. acquire() waits (first come,
+    first served) until the bytes fit; a request larger than the whole budget
+    is let through once nothing else holds any.
+    """
+
+    def __init__(self, limit=OUTPUT_BYTES_BUDGET):
+        self.limit = limit
+        self.in_use = 0
+        self.peak = 0
+        self._waiters = deque()    # (nbytes, future)
+
+    @property
+    def waiting(self):
+        return sum(1 for _, future in self._waiters if not future.done())
+
+    def _fits(self, nbytes):
+        return self.in_use + nbytes <= self.limit or self.in_use == 0
+
+    def take(self, nbytes):
+        """Take nbytes without waiting, even over the limit."""
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+
+    async def acquire(self, nbytes):
+        if not self._waiters and self._fits(nbytes):
+            self.take(nbytes)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((nbytes, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(nbytes)
+            else:
+                self._wake()
+            raise
+
+    def release(self, nbytes):
+        self.in_use -= nbytes
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            nbytes, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                return
+            self._waiters.popleft()
+            self.take(nbytes)
+            future.set_result(None)
+
+budget = ByteBudget()
+
+metrics.gauge("bot_output_bytes_in_flight", "Bytes of model output held until posted.", fn=lambda: budget.in_use)
+metrics.gauge("bot_output_budget_waiting", "Downloads waiting for room in the output byte budget.",
+              fn=lambda: budget.waiting)
+
+class OutputBuffer(tempfile.SpooledTemporaryFile):
+    """
+    A model output on its way to Discord. Holds its size against the byte
+    budget until released; create it with `await OutputBuffer.reserve()`.
+    Use release() rather than close() once it has been posted: discord.File
+    stubs out close() on the buffers it is given until it is done with them.
+    """
+
+    def __init__(self, reserved=0, budget=budget):
+        self.budget = budget
+        self.reserved = reserved
+        super().__init__(max_size=SPOOL_MAX_MEMORY, prefix="bot-output-")
+
+    @classmethod
+    async def reserve(cls, nbytes=OUTPUT_RESERVE_BYTES, budget=budget):
+        """Wait for nbytes of budget and return an empty buffer holding them."""
+        await budget.acquire(nbytes)
+        return cls(nbytes, budget)
+
+    @classmethod
+    async def load(cls, path, budget=budget):
+        """A buffer holding the contents of the file at path, read in a thread."""
+        size = os.path.getsize(path)
+        buffer = await cls.reserve(size, budget)
+
+        def _load():
+            # Through SpooledTemporaryFile.write, so it spills to disk as usual.
+            with open(path, "rb") as f:
+                while chunk := f.read(COPY_CHUNK):
+                    tempfile.SpooledTemporaryFile.write(buffer, chunk)
+            tempfile.SpooledTemporaryFile.seek(buffer, 0)
+
+        try:
+            await asyncio.to_thread(_load)
+        except BaseException:
+            buffer.release()
+            raise
+        buffer._account(buffer.size)
+        buffer.fit()
+        return buffer
+
+    async def save(self, path):
+        """Write the contents to a file at path, in a thread, and rewind."""
+        def _save():
+            tempfile.SpooledTemporaryFile.seek(self, 0)
+            with open(path, "wb") as f:
+                shutil.copyfileobj(self, f, COPY_CHUNK)
+            tempfile.SpooledTemporaryFile.seek(self, 0)
+
+        await asyncio.to_thread(_save)
+
+    @property
+    def size(self):
+        position = self.tell()
+        end = self.seek(0, os.SEEK_END)
+        self.seek(position)
+        return end
+
+    def write(self, data):
+        written = super().write(data)
+        self._account(self.tell())
+        return written
+
+    async def awrite(self, data):
+        """
+        write() without blocking the event loop: in memory while the output
+        fits, in a thread once it spills (or has spilled) to a temporary file.
+        """
+        if not self._rolled and self.tell() + len(data) <= SPOOL_MAX_MEMORY:
+            return self.write(data)
+        written = await asyncio.to_thread(tempfile.SpooledTemporaryFile.write, self, data)
+        self._account(self.tell())
+        return written
+
+    def _account(self, size):
+        over = size - self.reserved
+        if over > 0:
+            self.budget.take(over)
+            self.reserved += over
+
+    async def read_all(self):
+        """The whole output as bytes, read in a thread (it may be on disk)."""
+        self.seek(0)
+        data = await asyncio.to_thread(super().read)
+        self.seek(0)
+        return data
+
+    async def rewrite(self, data):
+        """Replace the contents with data (written in a thread) and rewind."""
+        def _rewrite():
+            tempfile.SpooledTemporaryFile.seek(self, 0)
+            tempfile.SpooledTemporaryFile.truncate(self, 0)
+            tempfile.SpooledTemporaryFile.write(self, data)
+            tempfile.SpooledTemporaryFile.seek(self, 0)
+
+        await asyncio.to_thread(_rewrite)
+        self._account(len(data))
+        self.fit()
+
+    def fit(self):
+        """Give back the part of the reservation the output did not use."""
+        unused = self.reserved - self.size
+        if unused > 0:
+            self.reserved -= unused
+            self.budget.release(unused)
+
+    def release(self):
+        """Close the buffer and return its bytes to the budget."""
+        if self.reserved:
+            self.budget.release(self.reserved)
+            self.reserved = 0
+        tempfile.SpooledTemporaryFile.close(self)
+
+    def close(self):
+        self.release()
+
+    def __del__(self):
+        self.release()
+
+def nbytes(data):
+    """Size of an output: bytes or an OutputBuffer."""
+    return data.size if isinstance(data, OutputBuffer) else len(data)
@@ -0,0 +1,144 @@
+# utils/cancellation.py
+import copy
+import asyncio
+import logging
+import contextvars
+from utils import metrics
+from utils.tracing import arguments, shape
+
+log = logging.getLogger(__name__)
+
+# Every running command is tracked by the user who ran it and by the message
+# that invoked it (bot.py registers it in a before_invoke hook), so it can be
+# cancelled with !cancel, the Cancel button on its status message, or by
+# deleting the invoking message. Cancelling the command's task unwinds it
+# through the scheduler (queued jobs are dropped) and utils/predictions.py
+# (running predictions are cancelled on Replicate).
+#
+# The tracked command is also kept in a context variable, so work it hands to
+# other tasks (scheduler jobs) can be traced back to it: utils/watchdog.py uses
+# this to name the command that stalled the event loop, utils/journal.py to
+# record where a prediction's output should be posted. Worker processes
+# (utils/workers.py) get the command's fields in each job's payload.
+CANCEL_WAIT = 10
+
+COMMANDS_CANCELED = metrics.counter(
+    "bot_commands_canceled_total", "Commands cancelled before finishing.", labels=("reason",)
+)
+
+_current = contextvars.ContextVar("tracked_command", default=None)
+
+class TrackedCommand:
+    def __init__(self, task, user_id, message_id, name, cog=None, args=(), channel_id=None, guild_id=None,
+                 kind=None, job=None):
+        self.task = task
+        self.user_id = user_id
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.kind = kind    # what the command's outputs are saved as (its cog's output_kind)
+        self.job = job      # the broker job a worker runs for the command (utils/workers.py)
+        self.name = name
+        self.cog = cog
+        self.args = args
+        self.status = None
+
+    def describe(self):
+        return f"!{self.name} ({self.cog or 'no cog'}) args {' '.join(self.args) or '-'}"
+
+class CommandTracker:
+    def __init__(self):
+        self._by_task = {}
+
+    def start(self, ctx):
+        """Track the command running in the current task."""
+        task = asyncio.current_task()
+        message = getattr(ctx, "message", None)
+        cog = getattr(ctx, "cog", None)
+        channel = getattr(ctx, "channel", None)
+        guild = getattr(ctx, "guild", None)
+        entry = TrackedCommand(
+            task, ctx.author.id, message.id if message is not None else None,
+            ctx.command.qualified_name if getattr(ctx, "command", None) else None,
+            cog.qualified_name if cog is not None else None, shape(arguments(ctx)),
+            channel.id if channel is not None else None, guild.id if guild is not None else None,
+            getattr(cog, "output_kind", None)
+        )
+        self._by_task[task] = entry
+        _current.set(entry)
+
+    def act_for(self, command, job):
+        """
+        Run the current task on behalf of command (the fields of a TrackedCommand,
+        from a job's payload) tracked by another process: a worker running its
+        broker job. Only the context variable is set; !cancel goes through the
+        gateway.
+        """
+        _current.set(TrackedCommand(asyncio.current_task(), job=job, **command))
+
+    def share(self, job):
+        """
+        Keep tracking the current task as the command that started it, but
+        as work shared with other commands (cogs/image_gen.py): what it
+        journals is keyed by job, not by that command's message, so it is
+        kept until the shared work ends rather than until the command does.
+        """
+        entry = _current.get()
+        if entry is not None:
+            shared = copy.copy(entry)
+            shared.task, shared.message_id, shared.job = asyncio.current_task(), None, job
+            _current.set(shared)
+
+    def finish(self, ctx):
+        self._by_task.pop(asyncio.current_task(), None)
+
+    def attach_status(self, status):
+        """Record status as the status message of the command running in the current task."""
+        entry = self._by_task.get(asyncio.current_task())
+        if entry is not None:
+            entry.status = status
+
+    def for_user(self, user_id):
+        current = asyncio.current_task()
+        return [e for e in self._by_task.values() if e.user_id == user_id and e.task is not current]
+
+    def current(self):
+        """The command the current task is running for, or None."""
+        return _current.get()
+
+    def for_task(self, task):
+        """
+        The command task is running for (its own task or one it started), or
+        None. Safe to call from another thread.
+        """
+        return task.get_context().get(_current)
+
+    def for_message(self, message_id):
+        return [e for e in self._by_task.values() if e.message_id == message_id]
+
+    def running(self):
+        """Names of the commands currently running, for diagnostics."""
+        return [e.name for e in self._by_task.values()]
+
+    async def cancel(self, entries, reason):
+        """
+        Cancel the given commands and wait (briefly) for them to unwind, then
+        mark their status messages as cancelled. Returns how many were cancelled.
+        """
+        entries = [e for e in entries if not e.task.done()]
+        if not entries:
+            return 0
+        for entry in entries:
+            entry.task.cancel()
+            COMMANDS_CANCELED.inc(reason=reason)
+        await asyncio.wait([e.task for e in entries], timeout=CANCEL_WAIT)
+        for entry in entries:
+            if entry.status is None:
+                continue
+            try:
+                await entry.status.edit(content=f"{entry.status.text}\n*Cancelled.*")
+            except Exception as e:
+                log.debug("Could not mark status as cancelled: %s", e)
+        return len(entries)
+
+tracker = CommandTracker()
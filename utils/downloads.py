@@ -0,0 +1,129 @@
+# utils/downloads.py
+import os
+import time
+import base64
+import asyncio
+import logging
+import httpx
+from utils import metrics
+from utils.buffers import OutputBuffer
+
+log = logging.getLogger(__name__)
+
+# Model outputs are streamed from Replicate's file URLs over a pooled HTTP
+# client, chunk by chunk, straight into the buffer handed to discord.File (an
+# OutputBuffer, which spills to disk and counts against the process-wide
+# output byte budget, see utils/buffers.py). Each output is capped in size and
+# in total download time; waiting for room in the budget does not count
+# against the time limit.
+MAX_OUTPUT_BYTES = int(os.environ.get("MAX_OUTPUT_BYTES", str(50 * 1024 * 1024)))
+DOWNLOAD_TIMEOUT = float(os.environ.get("DOWNLOAD_TIMEOUT", "60"))
+CHUNK_SIZE = 64 * 1024
+
+DOWNLOAD_SECONDS = metrics.histogram(
+    "bot_download_seconds", "Time to download one model output.", labels=("outcome",)
+)
+DOWNLOAD_BYTES = metrics.counter("bot_download_bytes_total", "Bytes of model output downloaded.")
+
+class DownloadError(Exception):
+    """Raised when a model output cannot be downloaded within its size or time limit."""
+
+_client = None
+
+def _get_client():
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(DOWNLOAD_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        )
+    return _client
+
+async def close():
+    """Close the pooled HTTP client (called on bot shutdown)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def as_list(output):
+    """Model outputs are either a single file or a list of files; always return a list."""
+    if output is None:
+        return []
+    return output if isinstance(output, list) else [output]
+
+def output_url(output):
+    """Return the URL of a model output (a replicate FileOutput or a plain URL string)."""
+    return getattr(output, "url", None) or str(output)
+
+async def _stream_into(buffer, url, max_bytes):
+    async with _get_client().stream("GET", url) as response:
+        response.raise_for_status()
+        length = response.headers.get("content-length")
+        if length and int(length) > max_bytes:
+            raise DownloadError(f"Output is {int(length)} bytes, over the {max_bytes} byte limit.")
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            if buffer.tell() + len(chunk) > max_bytes:
+                raise DownloadError(f"Output exceeded the {max_bytes} byte limit.")
+            await buffer.awrite(chunk)
+
+async def download(output, max_bytes=MAX_OUTPUT_BYTES, timeout=DOWNLOAD_TIMEOUT):
+    """
+    Download a single model output without blocking the event loop.
+    Returns an OutputBuffer positioned at the start, ready to pass to
+    discord.File; release() it once posted.
+    Raises DownloadError if the output is too large, too slow, or unreachable.
+    """
+    start = time.perf_counter()
+    try:
+        buffer = await _download(output, max_bytes, timeout)
+    except Exception:
+        DOWNLOAD_SECONDS.observe(time.perf_counter() - start, outcome="error")
+        raise
+    DOWNLOAD_SECONDS.observe(time.perf_counter() - start, outcome="ok")
+    DOWNLOAD_BYTES.inc(buffer.size)
+    return buffer
+
+async def _download(output, max_bytes, timeout):
+    url = output_url(output)
+    buffer = await OutputBuffer.reserve()
+    try:
+        if url.startswith("data:"):
+            _, encoded = url.split(",", 1)
+            await buffer.awrite(base64.b64decode(encoded))
+        else:
+            try:
+                await asyncio.wait_for(_stream_into(buffer, url, max_bytes), timeout)
+            except asyncio.TimeoutError:
+                raise DownloadError(f"Download timed out after {timeout:.0f}s.") from None
+            except httpx.HTTPError as e:
+                raise DownloadError(f"Download failed: {e}") from e
+    except BaseException:
+        buffer.release()
+        raise
+    buffer.fit()
+    buffer.seek(0)
+    return buffer
+
+async def download_all(outputs, max_bytes=MAX_OUTPUT_BYTES, timeout=DOWNLOAD_TIMEOUT):
+    """
+    Download several model outputs concurrently.
+    Returns the buffers in output order; outputs that fail are logged and skipped.
+    If the caller is cancelled, the buffers already downloaded are closed.
+    """
+    tasks = [asyncio.ensure_future(download(output, max_bytes, timeout)) for output in as_list(outputs)]
+    try:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    except asyncio.CancelledError:
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                task.result().release()
+        raise
+    buffers = []
+    for result in results:
+        if isinstance(result, Exception):
+            log.warning("Skipping model output: %s", result)
+            continue
+        buffers.append(result)
+    return buffers
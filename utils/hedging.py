@@ -0,0 +1,145 @@
+# utils/hedging.py
+import os
+import logging
+from collections import deque
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+# Hedged predictions for models whose tail latency (cold starts, queueing on
+# Replicate) is many times their median. For a model listed in HEDGE_MODELS, a
+# prediction that has not started by the model's observed p90 time to start,
+# or not finished by its p90 latency (both counted from its creation), gets a
+# second, identical prediction; whichever succeeds first is used and the other
+# is cancelled (utils/predictions.py).
+#
+#   HEDGE_MODELS="black-forest-labs/flux-schnell,google/imagen-3=0.95"
+#
+# hedges at p90, or at the given quantile. Samples are the first prediction's
+# own times in the model's last HEDGE_WINDOW runs (a first prediction that lost
+# to its hedge counts the time it ran, so the slow tail is kept), and nothing
+# is hedged before HEDGE_MIN_SAMPLES of them. Extra predictions are capped two
+# ways: each model earns HEDGE_BUDGET hedges per prediction (banking up to
+# HEDGE_BURST), and at most HEDGE_MAX_IN_FLIGHT hedges run at once across all
+# models. Hedges are not journaled (utils/journal.py): after a restart only the
+# first prediction is resumed.
+HEDGE_QUANTILE = 0.9
+HEDGE_WINDOW = int(os.environ.get("HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_BUDGET = float(os.environ.get("HEDGE_BUDGET", "0.1"))
+HEDGE_BURST = float(os.environ.get("HEDGE_BURST", "5"))
+HEDGE_MAX_IN_FLIGHT = int(os.environ.get("HEDGE_MAX_IN_FLIGHT", "4"))
+
+def _parse_models(spec):
+    models = {}
+    for item in spec.split(","):
+        name, _, quantile = item.partition("=")
+        name = name.strip()
+        if not name:
+            continue
+        try:
+            models[name] = float(quantile) if quantile.strip() else HEDGE_QUANTILE
+        except ValueError:
+            log.warning("Ignoring invalid HEDGE_MODELS entry: %s", item)
+    return models
+
+HEDGES = metrics.counter("bot_hedges_total", "Hedge predictions launched.", labels=("model",))
+HEDGE_WINS = metrics.counter(
+    "bot_hedge_wins_total", "Hedged predictions where the hedge succeeded first.", labels=("model",)
+)
+HEDGES_SKIPPED = metrics.counter(
+    "bot_hedges_skipped_total", "Hedges not launched because of a budget cap.", labels=("model", "reason")
+)
+
+class Hedge:
+    """The hedging plan for one prediction, from HedgePolicy.plan()."""
+
+    def __init__(self, policy, model, start_after, after):
+        self.policy = policy
+        self.model = model
+        self.start_after = start_after  # seconds from creation to hedge if not started, or None
+        self.after = after              # seconds from creation to hedge if not finished, or None
+
+    def start(self):
+        """True if a hedge may be launched now (and counts it against the budget)."""
+        return self.policy._start(self.model)
+
+    def finish(self, won):
+        """The hedge launched by start() is over; won if it succeeded first."""
+        self.policy._finish(self.model, won)
+
+    def observe(self, seconds, started=None):
+        """Record the first prediction's time to finish (and to start)."""
+        self.policy.observe(self.model, seconds, started)
+
+class HedgePolicy:
+    def __init__(self, models, window=HEDGE_WINDOW, min_samples=HEDGE_MIN_SAMPLES,
+                 budget=HEDGE_BUDGET, burst=HEDGE_BURST, max_in_flight=HEDGE_MAX_IN_FLIGHT):
+        self.models = models          # model name -> quantile to hedge at
+        self.window = window
+        self.min_samples = min_samples
+        self.budget = budget
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._latencies = {}          # model name -> recent latencies
+        self._starts = {}             # model name -> recent times to start
+        self._tokens = {}             # model name -> hedges it may still launch
+
+    def observe(self, model, seconds, started=None):
+        """Record how long a prediction of model took to finish (and to start)."""
+        self._latencies.setdefault(model, deque(maxlen=self.window)).append(seconds)
+        if started is not None:
+            self._starts.setdefault(model, deque(maxlen=self.window)).append(started)
+
+    def _quantile(self, model, samples):
+        quantile = self.models.get(model)
+        samples = samples.get(model)
+        if quantile is None or samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def delay(self, model):
+        """Seconds after which model's unfinished predictions are hedged, or None."""
+        return self._quantile(model, self._latencies)
+
+    def start_delay(self, model):
+        """Seconds after which model's predictions that have not started are hedged, or None."""
+        return self._quantile(model, self._starts)
+
+    def plan(self, model):
+        """
+        A Hedge for one prediction of model, or None if model is not listed.
+        The Hedge collects latency samples even before it may hedge (after None).
+        """
+        if model not in self.models:
+            return None
+        after = self.delay(model)
+        if after is not None:
+            self._tokens[model] = min(self.burst, self._tokens.get(model, self.burst) + self.budget)
+        return Hedge(self, model, self.start_delay(model), after)
+
+    def _start(self, model):
+        if self.in_flight >= self.max_in_flight:
+            HEDGES_SKIPPED.inc(model=model, reason="in_flight")
+            return False
+        if self._tokens.get(model, 0) < 1:
+            HEDGES_SKIPPED.inc(model=model, reason="budget")
+            return False
+        self._tokens[model] -= 1
+        self.in_flight += 1
+        HEDGES.inc(model=model)
+        return True
+
+    def _finish(self, model, won):
+        self.in_flight -= 1
+        if won:
+            HEDGE_WINS.inc(model=model)
+
+policy = HedgePolicy(_parse_models(os.environ.get("HEDGE_MODELS", "")))
+
+metrics.gauge(
+    "bot_hedge_delay_seconds", "Latency after which a model's predictions are hedged.",
+    labels=("model",), fn=lambda: {(model,): policy.delay(model) for model in policy.models if policy.delay(model)}
+)
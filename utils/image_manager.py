@@ -1 +1 @@
-# utils/image_manager.py# In-memory storage for images per user.# For now, each user has a list of image URLs.user_images = {}def add_images(user_id, images):    """    Adds a list of image URLs to the user's stored images.    If the user already has stored images, we append the new ones.    """    if user_id in user_images:        user_images[user_id].extend(images)    else:        user_images[user_id] = imagesdef get_images(user_id):    """Return the list of stored image URLs for a given user."""    return user_images.get(user_id, [])def get_image_by_index(user_id, index):    """    Retrieve an image URL by its 1-based index.    Returns None if index is invalid.    """    images = get_images(user_id)    if index < 1 or index > len(images):        return None    return images[index - 1]def list_images(user_id):    """    Return a list of tuples (index, image_url) for the user's stored images.    """    images = get_images(user_id)    return [(i + 1, img) for i, img in enumerate(images)]
\ No newline at end of file
+# utils/image_manager.pyfrom utils.storage import storefrom utils.paginator import page_cache# Image URLs are kept per user in the shared SQLite store (utils/storage.py).KIND = "image"async def add_images(user_id, images):    """    Adds a list of image URLs to the user's stored images.    The whole list is inserted in a single transaction.    Returns the 1-based indexes assigned to the new images.    """    indexes = await store.append(user_id, KIND, images)    page_cache.invalidate(user_id, KIND)    return indexesasync def get_images(user_id):    """Return the list of stored image URLs for a given user."""    return [url for _, url in await store.list(user_id, KIND)]async def get_image_by_index(user_id, index):    """    Retrieve an image URL by its 1-based index.    Returns None if index is invalid.    """    return await store.get(user_id, KIND, index)async def list_images(user_id, after=0, limit=None):    """    Return a list of tuples (index, image_url) for the user's stored images.    Pass the last index of the previous page as `after` to page through them.    """    return await store.list(user_id, KIND, after, limit)async def count_images(user_id):    """Return how many images the user has stored."""    return await store.count(user_id, KIND)
\ No newline at end of file
@@ -0,0 +1,93 @@
+# utils/inference.py
+import os
+import time
+import asyncio
+import logging
+from utils import predictions, metrics
+from utils.hedging import policy as hedging
+from utils.model_registry import registry
+from utils.tracing import recorder
+from utils.journal import journal
+
+log = logging.getLogger(__name__)
+
+# Every cog runs its predictions through this module so that no Replicate call
+# ever blocks the discord.py event loop. Each model gets its own concurrency
+# limit; models without an explicit limit share the default.
+#
+# Limits can be overridden from the environment, e.g.
+#   MODEL_CONCURRENCY="black-forest-labs/flux-1.1-pro-ultra=2,meta/meta-llama-3-70b-instruct=8"
+DEFAULT_MODEL_CONCURRENCY = int(os.environ.get("DEFAULT_MODEL_CONCURRENCY", "4"))
+
+def _parse_limits(spec):
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, value = item.rsplit("=", 1)
+        try:
+            limits[name.strip()] = max(1, int(value))
+        except ValueError:
+            log.warning("Ignoring invalid MODEL_CONCURRENCY entry: %s", item)
+    return limits
+
+_model_limits = _parse_limits(os.environ.get("MODEL_CONCURRENCY", ""))
+_semaphores = {}
+
+PREDICTION_SECONDS = metrics.histogram(
+    "bot_prediction_seconds", "Time from creating a prediction to its result.",
+    labels=("model", "outcome")
+)
+
+def model_name(ref):
+    """
+    Strip the version from a model reference ("owner/name:version" -> "owner/name").
+    """
+    return ref.split(":", 1)[0]
+
+def _semaphore(ref):
+    name = model_name(ref)
+    sem = _semaphores.get(name)
+    if sem is None:
+        sem = asyncio.Semaphore(_model_limits.get(name, DEFAULT_MODEL_CONCURRENCY))
+        _semaphores[name] = sem
+    return sem
+
+async def run_model(ref, model_input, on_update=None):
+    """
+    Run a model on Replicate and return its output once the prediction
+    completes (by webhook or polling, see utils/predictions.py).
+    Waits for a free slot under the model's concurrency limit first, so a burst
+    of commands queues here instead of piling up on Replicate. Pinned versions
+    are run from the model registry's cache. on_update(prediction) is called
+    as the prediction progresses (see utils/status.py). The prediction is
+    journaled before the wait, so it survives a restart (utils/journal.py),
+    and hedged if its model is listed in HEDGE_MODELS (utils/hedging.py).
+    """
+    target = await registry.target(ref)
+    async with _semaphore(ref):
+        start = time.perf_counter()
+        try:
+            output = await predictions.run(
+                target, model_input, on_update, on_create=journal.record, hedge=hedging.plan(model_name(ref))
+            )
+        except Exception:
+            elapsed = time.perf_counter() - start
+            PREDICTION_SECONDS.observe(elapsed, model=model_name(ref), outcome="error")
+            recorder.prediction(model_name(ref), elapsed, "error")
+            raise
+        elapsed = time.perf_counter() - start
+        PREDICTION_SECONDS.observe(elapsed, model=model_name(ref), outcome="ok")
+        recorder.prediction(model_name(ref), elapsed, "ok")
+        return output
+
+async def run_llm(ref, model_input, on_update=None):
+    """
+    Run a language model and return its output joined into a single string.
+    """
+    output = await run_model(ref, model_input, on_update)
+    if isinstance(output, str):
+        return output.strip()
+    if hasattr(output, "__aiter__"):
+        return "".join([chunk async for chunk in output]).strip()
+    return "".join(output).strip()
@@ -0,0 +1,208 @@
+# utils/journal.py
+import os
+import time
+import asyncio
+import logging
+import replicate
+from replicate.helpers import transform_output
+from utils import metrics, predictions, sharding
+from utils.storage import store
+from utils.cancellation import tracker
+from utils.downloads import download_all, as_list
+from utils.publisher import publish
+from utils.image_manager import add_images
+from utils.video_manager import add_videos
+from utils.prompt_manager import save_prompt
+
+log = logging.getLogger(__name__)
+
+# Every prediction a command starts is written to the jobs table (its id, the
+# model, and the user, channel and message of the command) before the bot
+# starts waiting on it, and removed once the command has finished. Rows left
+# behind are predictions the process died, or was restarted, in the middle of:
+# on startup bot.py hands them to resume(), which waits for each one to finish
+# on Replicate, posts its output to the command's channel for the user and
+# saves it where the command would have: the row keeps the output_kind of the
+# command's cog (image, video or prompt). Nothing is run again.
+#
+# With sharding (utils/sharding.py) each process resumes only the predictions
+# of commands from its own shards' guilds.
+#
+# Worker processes (utils/workers.py) journal the predictions of their jobs
+# under the job's key, for the command the gateway sent with it. A job handed
+# to another worker after its first one died waits for the prediction already
+# journaled for it instead of starting a new one (find()), and a gateway
+# restart does not resume predictions whose job is still on the broker.
+#
+# While the bot shuts down the journal is left as it is and in-flight
+# predictions keep running on Replicate (see predictions.shutdown()).
+# Replicate keeps API outputs for an hour, so older rows are dropped, as are
+# rows that could not be resumed after RESUME_ATTEMPTS restarts.
+JOURNAL_MAX_AGE = float(os.environ.get("JOURNAL_MAX_AGE", "3600"))
+RESUME_ATTEMPTS = 3
+
+JOBS_RESUMED = metrics.counter(
+    "bot_jobs_resumed_total", "Journaled predictions picked up again after a restart.", labels=("outcome",)
+)
+
+class JobJournal:
+    def __init__(self, max_age=JOURNAL_MAX_AGE):
+        self.max_age = max_age
+        self.closing = False
+
+    async def record(self, prediction):
+        """Journal prediction under the command running in the current task (if any)."""
+        entry = tracker.current()
+        if entry is None or entry.channel_id is None or self.closing:
+            return
+        try:
+            await store.call(
+                _journal_put, prediction.id, getattr(prediction, "model", None) or "unknown", entry.name or "unknown",
+                entry.user_id, entry.channel_id, entry.guild_id, entry.message_id, entry.kind, entry.job, time.time()
+            )
+        except Exception as e:
+            log.warning("Could not journal prediction %s: %s", prediction.id, e)
+
+    async def forget(self, ctx):
+        """Drop the predictions of ctx's command once it has finished."""
+        message = getattr(ctx, "message", None)
+        if self.closing or message is None:
+            return
+        try:
+            await store.call(_journal_forget_message, message.id)
+        except Exception as e:
+            log.warning("Could not clear journaled predictions for message %s: %s", message.id, e)
+
+    async def find(self, job):
+        """The id of the prediction journaled for the broker job keyed job, or None."""
+        try:
+            return await store.call(_journal_find, job)
+        except Exception as e:
+            log.warning("Could not look up journaled predictions for job %s: %s", job, e)
+            return None
+
+    async def forget_job(self, job):
+        """Drop the predictions of a worker's job once it has posted their outputs."""
+        if self.closing:
+            return
+        try:
+            await store.call(_journal_forget_job, job)
+        except Exception as e:
+            log.warning("Could not clear journaled predictions for job %s: %s", job, e)
+
+    def close(self):
+        """The bot is shutting down: keep the journal, and predictions running, for the next start."""
+        self.closing = True
+        predictions.shutdown()
+
+    async def resume(self, client):
+        """
+        Once client is ready, finish the predictions journaled by earlier runs
+        and post their outputs. Returns how many were resumed.
+        """
+        await client.wait_until_ready()
+        rows = await store.call(
+            _journal_take, time.time() - self.max_age, RESUME_ATTEMPTS, sharding.local_shards(client)
+        )
+        if rows:
+            log.info("Resuming %d journaled prediction(s)", len(rows))
+        await asyncio.gather(*(self._resume(client, *row) for row in rows))
+        return len(rows)
+
+    async def _resume(self, client, prediction_id, model, command, user_id, channel_id, kind):
+        try:
+            channel = client.get_channel(channel_id) or await client.fetch_channel(channel_id)
+            prediction = await replicate.predictions.async_get(prediction_id)
+            await predictions.wait(prediction)
+            outcome = await self._post(channel, prediction, model, command, user_id, kind)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Kept for the next start, up to RESUME_ATTEMPTS.
+            JOBS_RESUMED.inc(outcome="error")
+            log.warning("Could not resume prediction %s (!%s): %s", prediction_id, command, e)
+            return
+        JOBS_RESUMED.inc(outcome=outcome)
+        await store.call(_journal_forget, prediction_id)
+
+    async def _post(self, channel, prediction, model, command, user_id, kind):
+        intro = f"<@{user_id}> Your !{command} ({model}) was interrupted by a restart"
+        if prediction.status != "succeeded":
+            await channel.send(f"{intro} and did not finish: {prediction.error or prediction.status}.")
+            return "failed"
+        outputs = as_list(transform_output(prediction.output, replicate.default_client))
+        if kind == "prompt" or not any(_is_file(output) for output in outputs):
+            text = "".join(outputs).strip()
+            if kind == "prompt":
+                index = await save_prompt(user_id, text)
+                intro = f"{intro}; its prompt was saved as prompt[{index}]"
+            await channel.send(f"{intro}:\n>>> {text}"[:2000])
+            return "ok"
+        buffers = await download_all(outputs)
+        urls = await publish(
+            channel, f"{intro}; here is its output:",
+            [(f"{command}_output_{i}", buffer) for i, buffer in enumerate(buffers, start=1)]
+        )
+        if not urls:
+            raise RuntimeError("no output could be posted")
+        if kind == "image":
+            await add_images(user_id, urls)
+        elif kind == "video":
+            await add_videos(user_id, urls)
+        return "ok"
+
+def _is_file(output):
+    # transform_output only wraps https: and data: URLs; text is any other string.
+    return not isinstance(output, str) or output.startswith(("http://", "https://", "data:"))
+
+def _journal_put(conn, prediction_id, model, command, user_id, channel_id, guild_id, message_id, kind, job,
+                 created):
+    conn.execute(
+        "INSERT OR REPLACE INTO jobs "
+        "(prediction_id, model, command, user_id, channel_id, guild_id, message_id, kind, job, created) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (prediction_id, model, command, user_id, channel_id, guild_id, message_id, kind, job, created)
+    )
+
+def _journal_find(conn, job):
+    row = conn.execute(
+        "SELECT prediction_id FROM jobs WHERE job = ? ORDER BY created DESC LIMIT 1", (job,)
+    ).fetchone()
+    return row[0] if row else None
+
+def _journal_forget_job(conn, job):
+    conn.execute("DELETE FROM jobs WHERE job = ?", (job,))
+
+def _journal_forget(conn, prediction_id):
+    conn.execute("DELETE FROM jobs WHERE prediction_id = ?", (prediction_id,))
+
+def _journal_forget_message(conn, message_id):
+    conn.execute("DELETE FROM jobs WHERE message_id = ?", (message_id,))
+
+def _journal_take(conn, oldest, max_attempts, shards=None):
+    # Drop what can no longer be resumed, count an attempt on the rest (of
+    # this process's shards, if sharded; guild_id >> 22 % count is the shard).
+    # Jobs still queued or running on the broker are left to their workers.
+    where = (
+        "WHERE (job IS NULL OR job NOT IN "
+        "(SELECT json_extract(payload, '$.job') FROM broker_jobs WHERE status IN ('queued', 'running'))) "
+    )
+    params = ()
+    if shards is not None:
+        shard_count, shard_ids = shards
+        where += f"AND ((COALESCE(guild_id, 0) >> 22) % ?) IN ({','.join('?' * len(shard_ids))}) "
+        params = (shard_count, *shard_ids)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM jobs WHERE created < ? OR attempts >= ?", (oldest, max_attempts))
+        rows = conn.execute(
+            "UPDATE jobs SET attempts = attempts + 1 " + where +
+            "RETURNING prediction_id, model, command, user_id, channel_id, kind", params
+        ).fetchall()
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+journal = JobJournal()
@@ -0,0 +1,99 @@
+# utils/llm_memo.py
+import os
+import json
+import time
+import hashlib
+import logging
+from utils.storage import store
+from utils.singleflight import SingleFlight
+
+log = logging.getLogger(__name__)
+
+# !gpt and !refine run their language models at low temperature with fixed
+# system prompts, so the same request almost always produces the same text.
+# Outputs are memoised in the SQLite store (the llm_memo table) keyed on the
+# model, a hash of the system prompt and the remaining inputs. Entries older
+# than LLM_MEMO_TTL seconds are ignored and pruned, and the least recently
+# used ones are dropped beyond LLM_MEMO_SIZE entries.
+LLM_MEMO_TTL = float(os.environ.get("LLM_MEMO_TTL", str(7 * 24 * 3600)))
+LLM_MEMO_SIZE = int(os.environ.get("LLM_MEMO_SIZE", "10000"))
+
+def memo_key(ref, model_input):
+    """Stable key for an LLM call: model, system prompt hash and the other inputs."""
+    inputs = dict(model_input)
+    system_prompt = inputs.pop("system_prompt", "")
+    payload = json.dumps(
+        {
+            "model": ref,
+            "system": hashlib.sha256(system_prompt.encode()).hexdigest(),
+            "input": inputs,
+        },
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class LLMMemo:
+    """Persistent memo of LLM outputs, with single-flight for identical calls in progress."""
+
+    def __init__(self, ttl=LLM_MEMO_TTL, max_entries=LLM_MEMO_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._inflight = SingleFlight()
+
+    @property
+    def coalesced(self):
+        """Number of calls that joined an identical call already in progress."""
+        return self._inflight.coalesced
+
+    async def run(self, ref, model_input, run):
+        """
+        Return the memoised output for (ref, model_input), or await run() for it.
+        Concurrent identical calls share a single run() and it is stored once.
+        """
+        key = memo_key(ref, model_input)
+        if self.max_entries > 0:
+            output = await store.call(_memo_get, key, time.time() - self.ttl)
+            if output is not None:
+                self.hits += 1
+                return output
+        self.misses += 1
+        return await self._inflight.do(key, lambda: self._run_and_store(key, run))
+
+    async def _run_and_store(self, key, run):
+        output = await run()
+        if output and self.max_entries > 0:
+            try:
+                await store.call(_memo_put, key, output, time.time() - self.ttl, self.max_entries)
+            except Exception as e:
+                log.warning("Could not memoise LLM output: %s", e)
+        return output
+
+def _memo_get(conn, key, oldest):
+    row = conn.execute(
+        "UPDATE llm_memo SET used = ? WHERE key = ? AND created >= ? RETURNING output",
+        (time.time(), key, oldest)
+    ).fetchone()
+    return row[0] if row else None
+
+def _memo_put(conn, key, output, oldest, max_entries):
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_memo (key, output, created, used) VALUES (?, ?, ?, ?)",
+            (key, output, now, now)
+        )
+        conn.execute("DELETE FROM llm_memo WHERE created < ?", (oldest,))
+        conn.execute(
+            "DELETE FROM llm_memo WHERE key IN ("
+            "SELECT key FROM llm_memo ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (max_entries,)
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+llm_memo = LLMMemo()
@@ -0,0 +1,152 @@
+# utils/model_registry.py
+import os
+import time
+import asyncio
+import logging
+import replicate
+from utils.singleflight import SingleFlight
+
+log = logging.getLogger(__name__)
+
+# Resolved model metadata, so predictions can be created without extra lookups.
+#
+# Pinned references ("owner/name:version") resolve to their Version object.
+# Versions are immutable, so they are fetched once and kept. run_model
+# (utils/inference.py) passes the Version as the target of predictions.run,
+# and predictions.create makes the prediction from its id in one request,
+# with no lookup per command.
+#
+# Unpinned references ("owner/name") keep using the model's own predictions
+# endpoint, which always runs the latest version without resolving it first
+# (official models can only be run this way). For those the registry keeps the
+# latest version's id, refreshed in the background every MODEL_REGISTRY_TTL
+# seconds, so cached outputs are keyed by the version that produced them
+# (utils/output_cache.py).
+#
+# The models in prewarm_models are resolved in the background at startup
+# (start()); commands that arrive first resolve what they need themselves.
+MODEL_REGISTRY_TTL = float(os.environ.get("MODEL_REGISTRY_TTL", "3600"))
+
+class ModelEntry:
+    def __init__(self, ref, version, pinned):
+        self.ref = ref
+        self.version = version
+        self.pinned = pinned
+        self.resolved_at = time.monotonic()
+
+    @property
+    def version_id(self):
+        return self.version.id if self.version is not None else None
+
+class ModelRegistry:
+    def __init__(self, ttl=MODEL_REGISTRY_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._inflight = SingleFlight()
+        self._refresher = None
+
+    def get(self, ref):
+        """Return the cached ModelEntry for ref, or None."""
+        return self._entries.get(ref)
+
+    async def resolve(self, ref):
+        """
+        Return the ModelEntry for ref, fetching it on first use. A stale entry
+        is returned as-is and refreshed in the background.
+        """
+        entry = self._entries.get(ref)
+        if entry is None:
+            return await self._inflight.do(ref, lambda: self._fetch(ref))
+        if self._is_stale(entry) and ref not in self._inflight:
+            task = asyncio.create_task(self._inflight.do(ref, lambda: self._fetch(ref)))
+            task.add_done_callback(_log_refresh_error)
+        return entry
+
+    async def target(self, ref):
+        """
+        The target for predictions.run (and so predictions.create) for ref:
+        the cached Version for a pinned reference, otherwise ref itself.
+        Falls back to ref if the version cannot be resolved.
+        """
+        if ":" not in ref:
+            return ref
+        try:
+            entry = await self.resolve(ref)
+        except Exception as e:
+            log.warning("Could not resolve %s, running it by reference: %s", ref, e)
+            return ref
+        return entry.version or ref
+
+    async def warm(self, refs):
+        """Resolve refs concurrently (at startup); failures are logged and retried on first use."""
+        results = await asyncio.gather(*(self.resolve(ref) for ref in refs), return_exceptions=True)
+        for ref, result in zip(refs, results):
+            if isinstance(result, Exception):
+                log.warning("Could not pre-resolve %s: %s", ref, result)
+        log.info("Model registry warmed with %d of %d models", len(self._entries), len(refs))
+
+    def start(self, refs=()):
+        """Resolve refs (as warm() does), then keep unpinned models fresh, in the background."""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop(refs))
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    def _is_stale(self, entry):
+        return not entry.pinned and time.monotonic() - entry.resolved_at >= self.ttl
+
+    async def _refresh_loop(self, refs):
+        if refs:
+            await self.warm(refs)
+        while True:
+            await asyncio.sleep(max(1.0, self.ttl / 2))
+            for ref, entry in list(self._entries.items()):
+                if entry.pinned:
+                    continue
+                try:
+                    await self._inflight.do(ref, lambda ref=ref: self._fetch(ref))
+                except Exception as e:
+                    log.warning("Could not refresh %s: %s", ref, e)
+
+    async def _fetch(self, ref):
+        name, _, version_id = ref.partition(":")
+        model = await replicate.models.async_get(name)
+        if version_id:
+            version = await model.versions.async_get(version_id)
+        else:
+            version = model.latest_version
+        entry = ModelEntry(ref, version, pinned=bool(version_id))
+        previous = self._entries.get(ref)
+        if previous is not None and previous.version_id != entry.version_id:
+            log.info("%s now at version %s", ref, entry.version_id)
+        self._entries[ref] = entry
+        return entry
+
+def _log_refresh_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        log.warning("Model refresh failed: %s", task.exception())
+
+registry = ModelRegistry()
+
+# Models resolved at startup (bot.py, worker.py) so the first commands don't pay for the lookup
+prewarm_models = [
+    "black-forest-labs/flux-schnell",
+    "black-forest-labs/flux-redux-dev",
+    "black-forest-labs/flux-1.1-pro-ultra",
+    "stability-ai/stable-diffusion-3.5-large",
+    "stability-ai/sdxl:7762fd07cf82c948538e41f63f77d685e02b063e37e496e96eefd46c929f9bdc",
+    "google/imagen-3",
+    "recraft-ai/recraft-v3",
+    "playgroundai/playground-v2.5-1024px-aesthetic:a45f82a1382bed5c7aeb861dac7c7d191b0fdf74d8d57c4a0e6ed7d4d0bf7d24",
+    "meta/meta-llama-3-70b-instruct",
+    "anthropic/claude-3.5-sonnet",
+    "kwaivgi/kling-v1.6-standard",
+    "zsxkib/mmaudio:4b9f801a167b1f6cc2db6ba7ffdeb307630bf411841d4e8300e63ca992de0be9",
+]
@@ -0,0 +1,78 @@
+# utils/output_cache.py
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from utils.model_registry import registry
+
+log = logging.getLogger(__name__)
+
+# Re-running the same model on the same inputs (e.g. `!flux prompt[3] 2` again)
+# is served from the Discord attachments posted the first time instead of
+# paying for a new prediction. Entries expire after OUTPUT_CACHE_TTL seconds
+# (Discord attachment URLs are signed and eventually expire) and the least
+# recently used entries are evicted beyond OUTPUT_CACHE_SIZE. Keys include the
+# model's version as last resolved by the model registry, so a new version of
+# an unpinned model ("owner/name") is not served its predecessor's outputs.
+OUTPUT_CACHE_TTL = float(os.environ.get("OUTPUT_CACHE_TTL", str(12 * 3600)))
+OUTPUT_CACHE_SIZE = int(os.environ.get("OUTPUT_CACHE_SIZE", "2048"))
+
+# Input fields that carry a seed. A seed is only part of the key when it is
+# fixed; random seeds (None / negative) are dropped so reruns still match.
+SEED_FIELDS = ("seed",)
+
+def canonical_input(model_input):
+    """Return model_input with random seeds removed, for keying."""
+    canonical = dict(model_input)
+    for field in SEED_FIELDS:
+        seed = canonical.get(field)
+        if seed is None or (isinstance(seed, (int, float)) and seed < 0):
+            canonical.pop(field, None)
+    return canonical
+
+def cache_key(model, model_input):
+    """Stable key for a (model reference, input) pair, at the model's current version when known."""
+    entry = registry.get(model)
+    payload = json.dumps(
+        {"model": model, "version": entry.version_id if entry is not None else None,
+         "input": canonical_input(model_input)},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class OutputCache:
+    """In-memory TTL + LRU map from cache_key() to the attachment URLs of a generation."""
+
+    def __init__(self, ttl=OUTPUT_CACHE_TTL, max_entries=OUTPUT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, urls):
+        if not urls or self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, list(urls))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+output_cache = OutputCache()
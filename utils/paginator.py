@@ -0,0 +1,105 @@
+# utils/paginator.py
+import discord
+from collections import OrderedDict
+
+# Interactive, page-at-a-time browsing of a user's stored prompts/images/videos.
+# Only the page being shown is read from storage (a keyset range on the
+# (user_id, kind, idx) key), and rendered pages are cached per user until
+# that user saves something new. Pages are keyed on the user's item count as
+# read from the store, so a save made through another process (a different
+# shard, see utils/sharding.py) is never hidden by a stale page here.
+PAGE_CACHE_SIZE = 1024
+VIEW_TIMEOUT = 180
+
+class PageCache:
+    """LRU cache of rendered pages, invalidated per (user_id, kind) on insert."""
+
+    def __init__(self, max_entries=PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._keys = {}    # (user_id, kind) -> set of cached page keys
+
+    def get(self, key):
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+        return page
+
+    def put(self, key, page):
+        self._pages[key] = page
+        self._pages.move_to_end(key)
+        self._keys.setdefault(key[:2], set()).add(key)
+        while len(self._pages) > self.max_entries:
+            old_key, _ = self._pages.popitem(last=False)
+            self._keys.get(old_key[:2], set()).discard(old_key)
+
+    def invalidate(self, user_id, kind):
+        for key in self._keys.pop((user_id, kind), ()):
+            self._pages.pop(key, None)
+
+page_cache = PageCache()
+
+class Paginator(discord.ui.View):
+    """
+    Prev/Next buttons over one user's items of a kind.
+    fetch(user_id, after, limit) returns [(index, value), ...] for one page and
+    render(rows, page, pages) turns them into send()/edit() keyword arguments.
+    """
+
+    def __init__(self, user_id, kind, total, page_size, fetch, render):
+        super().__init__(timeout=VIEW_TIMEOUT)
+        self.user_id = user_id
+        self.kind = kind
+        self.page_size = page_size
+        self.total = total
+        self.pages = max(1, -(-total // page_size))
+        self.fetch = fetch
+        self.render = render
+        self.current = 0
+        self.message = None
+
+    async def load(self, page):
+        key = (self.user_id, self.kind, self.total, self.page_size, page)
+        rendered = page_cache.get(key)
+        if rendered is None:
+            rows = await self.fetch(self.user_id, after=page * self.page_size, limit=self.page_size)
+            rendered = self.render(rows, page + 1, self.pages)
+            page_cache.put(key, rendered)
+        self.current = page
+        self.previous_page.disabled = page == 0
+        self.next_page.disabled = page >= self.pages - 1
+        return rendered
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("Only the person who ran the command can page through this list.", ephemeral=True)
+            return False
+        return True
+
+    async def _show(self, interaction, page):
+        rendered = await self.load(page)
+        await interaction.response.edit_message(**rendered, view=self)
+
+    @discord.ui.button(label="◀ Prev", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        await self._show(interaction, max(0, self.current - 1))
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        await self._show(interaction, min(self.pages - 1, self.current + 1))
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+async def send_paginated(ctx, kind, total, page_size, fetch, render):
+    """Send the first page of ctx.author's items with Prev/Next buttons when there is more than one page."""
+    view = Paginator(ctx.author.id, kind, total, page_size, fetch, render)
+    rendered = await view.load(0)
+    if view.pages == 1:
+        await ctx.send(**rendered)
+        return
+    view.message = await ctx.send(**rendered, view=view)
@@ -0,0 +1,189 @@
+# utils/postprocess.py
+import io
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, features
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+# Outputs pass through here on their way to Discord (utils/publisher.py):
+#
+#   - The real format is sniffed from the first bytes, and the filename's
+#     extension corrected to match (models do not always return what the
+#     command expects).
+#   - Still images over the upload limit (the guild's, per message) are
+#     recompressed and, if that is not enough, downsized until they fit.
+#   - With POSTPROCESS_FORMAT=webp or avif (opt-in), still images are also
+#     recompressed to that format, when that makes them smaller. This needs
+#     a Pillow built with the format's codec; without one it is turned off
+#     with a warning.
+#
+# Image work runs in a pool of POSTPROCESS_WORKERS processes, never on the
+# event loop; outputs that need none (the usual case) are only sniffed.
+# Previews (!multigen's side-by-side outputs) take the fast path: a cheap
+# reduce() and a single encode instead of a quality search and Lanczos
+# resampling.
+POSTPROCESS_FORMAT = os.environ.get("POSTPROCESS_FORMAT", "").lower()
+POSTPROCESS_WORKERS = int(os.environ.get("POSTPROCESS_WORKERS", str(os.cpu_count() or 1)))
+SNIFF_BYTES = 32
+QUALITIES = (90, 80, 70, 60)
+PREVIEW_QUALITY = 75
+MAX_RESIZES = 6
+COPIES = 3    # bytes held per byte of output while it is processed (see process())
+
+EXTENSIONS = {"png": "png", "jpeg": "jpg", "gif": "gif", "webp": "webp", "avif": "avif", "mp4": "mp4"}
+STILL_IMAGES = ("png", "jpeg", "webp", "avif")
+LOSSLESS = ("png",)    # encoded the same at any quality: only downsizing helps
+TARGET_FORMATS = ("webp", "avif")
+
+POSTPROCESS_SECONDS = metrics.histogram(
+    "bot_postprocess_seconds", "Time to recompress or downsize one output.", labels=("outcome",)
+)
+POSTPROCESS_SAVED = metrics.counter("bot_postprocess_bytes_saved_total", "Bytes saved by post-processing.")
+
+def sniff(header):
+    """The format of a file from its first bytes, or None if it is not one we know."""
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[4:8] == b"ftyp":
+        return "avif" if header[8:12] in (b"avif", b"avis") else "mp4"
+    return None
+
+def with_extension(filename, kind):
+    """filename with the extension for kind (unchanged if kind is unknown)."""
+    if kind not in EXTENSIONS:
+        return filename
+    stem, dot, _ = filename.rpartition(".")
+    return f"{stem if dot else filename}.{EXTENSIONS[kind]}"
+
+def _target_format():
+    if POSTPROCESS_FORMAT not in TARGET_FORMATS:
+        return None
+    if not features.check(POSTPROCESS_FORMAT):
+        log.warning("Pillow cannot write %s here; not recompressing outputs", POSTPROCESS_FORMAT)
+        return None
+    return POSTPROCESS_FORMAT
+
+_target = _target_format()
+_pool = None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # Not fork: the bot has threads (the storage executor) by now.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(POSTPROCESS_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _pool
+
+def close():
+    """Shut the worker pool down (called on bot shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _encode(image, kind, quality):
+    out = io.BytesIO()
+    if kind == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    elif kind in TARGET_FORMATS and image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    if kind in LOSSLESS:
+        image.save(out, kind.upper())
+    else:
+        image.save(out, kind.upper(), quality=quality)
+    return out.getvalue()
+
+def transform(data, max_bytes, kind, preview=False):
+    """
+    Re-encode the image in data as kind, at most max_bytes long: lower the
+    quality first (unless kind is lossless), then downsize. Returns the new
+    bytes, or None to keep the original (animated, or re-encoding would not
+    help). Runs in a worker process.
+    """
+    image = Image.open(io.BytesIO(data))
+    if getattr(image, "is_animated", False):
+        return None
+    image.load()
+    if kind in LOSSLESS:
+        qualities = (None,)
+    else:
+        qualities = (PREVIEW_QUALITY,) if preview else QUALITIES
+    out = None
+    for _ in range(MAX_RESIZES + 1):
+        for quality in qualities:
+            out = _encode(image, kind, quality)
+            if len(out) <= max_bytes:
+                break
+        if len(out) <= max_bytes:
+            break
+        # Area scales roughly with bytes; aim a little under the limit.
+        scale = max(0.1, min(0.9, (max_bytes / len(out)) ** 0.5 * 0.9))
+        if preview and scale <= 0.5:
+            image = image.reduce(int(1 / scale))
+        else:
+            size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+            image = image.resize(size, Image.Resampling.BILINEAR if preview else Image.Resampling.LANCZOS)
+    if len(data) <= max_bytes and len(out) >= len(data):
+        return None
+    return out
+
+async def process(filename, buffer, max_bytes, preview=False):
+    """
+    Prepare one output (filename, OutputBuffer) for upload within max_bytes.
+    The buffer is rewritten in place if the image is re-encoded. Returns the
+    filename to post it under.
+    """
+    kind = sniff(buffer.read(SNIFF_BYTES))
+    buffer.seek(0)
+    size = buffer.size
+    if kind not in STILL_IMAGES:
+        return with_extension(filename, kind)
+    target = _target if _target and kind != _target else None
+    if size <= max_bytes and target is None:
+        return with_extension(filename, kind)
+
+    # The output read into memory, its pickled copy on the way to the pool
+    # and the (smaller) result count against the output byte budget until
+    # the buffer has been rewritten. Taken without waiting, like a download
+    # outgrowing its reservation: two outputs waiting on each other's bytes
+    # would never finish.
+    copies = COPIES * size
+    buffer.budget.take(copies)
+    try:
+        start = time.perf_counter()
+        data = await buffer.read_all()
+        try:
+            out = await asyncio.get_running_loop().run_in_executor(
+                _get_pool(), transform, data, max_bytes, target or kind, preview
+            )
+        except Exception as e:
+            POSTPROCESS_SECONDS.observe(time.perf_counter() - start, outcome="error")
+            log.warning("Could not post-process %s: %s", filename, e)
+            return with_extension(filename, kind)
+        finally:
+            del data
+        POSTPROCESS_SECONDS.observe(time.perf_counter() - start, outcome="ok" if out else "unchanged")
+        if out is None:
+            return with_extension(filename, kind)
+        await buffer.rewrite(out)
+    finally:
+        buffer.budget.release(copies)
+    POSTPROCESS_SAVED.inc(max(0, size - len(out)))
+    return with_extension(filename, target or kind)
+
+async def process_all(files, max_bytes, preview=False):
+    """Prepare (filename, OutputBuffer) pairs for upload; returns them renamed, in order."""
+    names = await asyncio.gather(*(process(name, buffer, max_bytes, preview) for name, buffer in files))
+    return [(name, buffer) for name, (_, buffer) in zip(names, files)]
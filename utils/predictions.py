@@ -0,0 +1,334 @@
+# utils/predictions.py
+import os
+import asyncio
+import datetime
+import logging
+from collections import OrderedDict
+import replicate
+from replicate.exceptions import ModelError
+from replicate.helpers import transform_output
+from replicate.version import Version
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+# Predictions are created and then waited on without holding a request (or a
+# thread) open while the model runs.
+#
+# With WEBHOOK_BASE_URL set to the bot's public URL (e.g. https://mybot.onrender.com)
+# every prediction is created with a webhook, and Replicate POSTs the finished
+# prediction to WEBHOOK_BASE_URL + WEBHOOK_PATH, served by utils/web.py on the
+# bot's own event loop. The prediction is still polled every
+# WEBHOOK_POLL_INTERVAL seconds in case a delivery is lost. If the webhook
+# signing secret cannot be loaded, deliveries could not be verified, so
+# webhooks are turned off (disable_webhooks()) and predictions are polled as
+# below.
+#
+# Without it, predictions are polled asynchronously: every POLL_MIN_INTERVAL
+# seconds at first, backing off by POLL_BACKOFF up to POLL_MAX_INTERVAL, so
+# short models are picked up quickly and long ones (video, audio) poll rarely.
+#
+# When the caller wants progress (on_update), start and log webhooks are
+# requested too, and polling backs off no further than PROGRESS_POLL_INTERVAL.
+#
+# Point REPLICATE_BASE_URL at a fake server (bench/fake_replicate.py) to run
+# all of this locally.
+WEBHOOK_BASE_URL = os.environ.get("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH = "/replicate/webhook"
+WEBHOOK_POLL_INTERVAL = float(os.environ.get("WEBHOOK_POLL_INTERVAL", "30"))
+POLL_MIN_INTERVAL = float(os.environ.get("POLL_MIN_INTERVAL", "0.5"))
+POLL_MAX_INTERVAL = float(os.environ.get("POLL_MAX_INTERVAL", "10"))
+POLL_BACKOFF = 1.5
+PROGRESS_POLL_INTERVAL = float(os.environ.get("PROGRESS_POLL_INTERVAL", "3"))
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+# Early deliveries kept for predictions nobody is waiting on yet (a fast model
+# can finish before its create request has returned).
+EARLY_DELIVERIES = 256
+
+_waiters = {}              # prediction id -> queue of webhook payloads
+_early = OrderedDict()     # prediction id -> payload
+_cancels = set()           # cancel requests in flight
+_shutting_down = False
+_webhooks = bool(WEBHOOK_BASE_URL)
+
+PREDICTIONS_CANCELED = metrics.counter(
+    "bot_predictions_canceled_total",
+    "Predictions cancelled on Replicate: their command was cancelled, or they lost a hedge.",
+    labels=("reason",)
+)
+
+def webhook_url():
+    """The URL Replicate should call when a prediction completes, or None."""
+    return f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}" if _webhooks else None
+
+def disable_webhooks():
+    """Create predictions without a webhook from now on, and poll them instead."""
+    global _webhooks
+    _webhooks = False
+
+async def create(target, model_input, progress=False):
+    """
+    Create a prediction without waiting for it. target is a Version (from the
+    model registry), "owner/name:version" or "owner/name". With progress, the
+    webhook also fires when the prediction starts and as it logs.
+    """
+    params = {"input": model_input}
+    url = webhook_url()
+    if url:
+        params["webhook"] = url
+        params["webhook_events_filter"] = ["start", "logs", "completed"] if progress else ["completed"]
+    if isinstance(target, Version):
+        return await replicate.predictions.async_create(version=target, **params)
+    name, _, version_id = target.partition(":")
+    if version_id:
+        return await replicate.predictions.async_create(version=version_id, **params)
+    return await replicate.models.predictions.async_create(model=name, **params)
+
+def deliver(payload):
+    """Hand a prediction received by webhook to whoever is waiting on it."""
+    prediction_id = payload.get("id")
+    if not prediction_id:
+        return
+    queue = _waiters.get(prediction_id)
+    if queue is not None:
+        queue.put_nowait(payload)
+    elif payload.get("status") in TERMINAL_STATUSES:
+        _early[prediction_id] = payload
+        while len(_early) > EARLY_DELIVERIES:
+            _early.popitem(last=False)
+
+def _apply(prediction, payload):
+    for name in ("status", "output", "error", "logs", "metrics", "started_at", "completed_at"):
+        if name in payload:
+            setattr(prediction, name, payload[name])
+
+async def wait(prediction, on_update=None):
+    """
+    Wait until prediction reaches a terminal status, updating it in place.
+    on_update(prediction) is called after each change while it runs.
+    """
+    early = _early.pop(prediction.id, None)
+    if early is not None:
+        _apply(prediction, early)
+    if prediction.status in TERMINAL_STATUSES:
+        return prediction
+
+    queue = asyncio.Queue()
+    _waiters[prediction.id] = queue
+    webhooks = webhook_url() is not None
+    interval = WEBHOOK_POLL_INTERVAL if webhooks else POLL_MIN_INTERVAL
+    max_interval = PROGRESS_POLL_INTERVAL if on_update is not None else POLL_MAX_INTERVAL
+    try:
+        while prediction.status not in TERMINAL_STATUSES:
+            try:
+                payload = await asyncio.wait_for(queue.get(), interval)
+            except asyncio.TimeoutError:
+                await prediction.async_reload()
+                if not webhooks:
+                    interval = min(interval * POLL_BACKOFF, max_interval)
+            else:
+                _apply(prediction, payload)
+            if on_update is not None and prediction.status not in TERMINAL_STATUSES:
+                on_update(prediction)
+    finally:
+        _waiters.pop(prediction.id, None)
+    return prediction
+
+async def _cancel(prediction, reason):
+    try:
+        await prediction.async_cancel()
+        PREDICTIONS_CANCELED.inc(reason=reason)
+    except Exception as e:
+        log.warning("Could not cancel prediction %s: %s", prediction.id, e)
+
+def cancel(prediction, reason="command"):
+    """
+    Cancel prediction on Replicate in the background, so a cancelled caller
+    does not have to wait for the request (and the GPU stops billing).
+    """
+    task = asyncio.create_task(_cancel(prediction, reason))
+    _cancels.add(task)
+    task.add_done_callback(_cancels.discard)
+
+def shutdown():
+    """
+    Leave predictions running on Replicate when their callers are cancelled
+    from now on: the bot is shutting down, and will pick them up from the job
+    journal when it starts again (utils/journal.py).
+    """
+    global _shutting_down
+    _shutting_down = True
+
+def _since_created(prediction, field):
+    """
+    Seconds from prediction's creation to its timestamp field (None: to now
+    on this clock), from Replicate's timestamps; None if one is missing.
+    """
+    try:
+        created = datetime.datetime.fromisoformat(prediction.created_at)
+        if field is None:
+            until = datetime.datetime.now(datetime.timezone.utc)
+        else:
+            until = datetime.datetime.fromisoformat(getattr(prediction, field))
+        return max(0.0, (until - created).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+async def _overdue(prediction, first, created, hedge):
+    """
+    Wait until first (the wait for prediction) finishes, returning False, or
+    until prediction should be hedged, returning True: it is still starting
+    hedge.start_after seconds after created (a loop time), or still running
+    hedge.after seconds after.
+    """
+    if hedge.after is None:
+        return False
+    loop = asyncio.get_running_loop()
+    finish_by = created + hedge.after
+    start_by = created + hedge.start_after if hedge.start_after is not None else None
+    while True:
+        deadline = finish_by if start_by is None else min(start_by, finish_by)
+        done, _ = await asyncio.wait([first], timeout=max(0, deadline - loop.time()))
+        if done:
+            return False
+        if loop.time() >= finish_by:
+            return True
+        start_by = None
+        if prediction.status == "starting":
+            # Without start webhooks (or between polls) the status seen here
+            # can be stale: check with Replicate, without touching prediction.
+            try:
+                current = await replicate.predictions.async_get(prediction.id)
+            except Exception as e:
+                log.warning("Could not check prediction %s: %s", prediction.id, e)
+                continue
+            if current.status == "starting":
+                return True
+
+def _observe(hedge, prediction, created, lost):
+    """
+    Report the first prediction's own times to hedge: Replicate's, if it
+    finished, or if it lost the race, how long it had been going since
+    created (a loop time): a lower bound, so the slow tail stays sampled.
+    """
+    if lost:
+        if prediction.status in TERMINAL_STATUSES:
+            return    # it failed, and its time says nothing about latency
+        seconds = asyncio.get_running_loop().time() - created
+        started = _since_created(prediction, "started_at")
+        if started is None and prediction.status == "starting":
+            started = seconds
+    elif prediction.status == "succeeded":
+        seconds = _since_created(prediction, "completed_at")
+        started = _since_created(prediction, "started_at")
+    else:
+        return
+    if seconds is not None:
+        hedge.observe(seconds, started)
+
+async def _hedged_wait(target, model_input, prediction, on_update, hedge, sent):
+    """
+    Wait for prediction; if it has not started hedge.start_after seconds
+    after it was created, or not finished hedge.after seconds after (and
+    hedge.start() allows it), race an identical prediction against it.
+    Returns the first to succeed (or prediction, if neither does) and cancels
+    the other. Only the first prediction's times are reported to hedge.
+    sent is the loop time its create request was sent, a bound on its age in
+    case this clock is ahead of Replicate's.
+    """
+    now = asyncio.get_running_loop().time()
+    age = _since_created(prediction, None)
+    created = sent if age is None else max(sent, now - age)
+    first = asyncio.create_task(wait(prediction, on_update))
+    racers = {first: prediction}
+    winner = None
+    try:
+        if not await _overdue(prediction, first, created, hedge) or not hedge.start():
+            await first
+            _observe(hedge, prediction, created, lost=False)
+            return prediction
+        try:
+            try:
+                second = await create(target, model_input)
+            except Exception as e:
+                log.warning("Could not hedge prediction %s: %s", prediction.id, e)
+                await first
+                _observe(hedge, prediction, created, lost=False)
+                return prediction
+            racers[asyncio.create_task(wait(second))] = second
+            pending = set(racers)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=lambda task: task is not first):
+                    if not task.cancelled() and task.exception() is None and racers[task].status == "succeeded":
+                        winner = racers[task]
+                        break
+        finally:
+            hedge.finish(winner is not None and winner is not prediction)
+        _observe(hedge, prediction, created, lost=winner is not None and winner is not prediction)
+        if winner is None:
+            # Neither succeeded: report the first prediction's outcome.
+            return await first
+        return winner
+    finally:
+        for task, racer in racers.items():
+            task.cancel()
+            if racer is winner or racer.status in TERMINAL_STATUSES:
+                continue
+            if winner is not None:
+                cancel(racer, "hedge")
+            elif racer is not prediction:
+                # The caller was cancelled; run() deals with the first prediction.
+                cancel(racer, "command")
+
+async def run(target, model_input, on_update=None, on_create=None, hedge=None):
+    """
+    Create a prediction, wait for it to finish and return its output, with
+    URLs wrapped as replicate FileOutput objects (as replicate.async_run does).
+    on_update(prediction) is called as it progresses, and on_create(prediction)
+    awaited before the wait begins. With hedge (a utils.hedging.Hedge), a
+    prediction that is late to start or finish is raced against an identical
+    one. If the caller is cancelled while waiting, the prediction is
+    cancelled on Replicate (unless the bot is shutting down).
+    Raises ModelError if the prediction fails or is canceled.
+    """
+    sent = asyncio.get_running_loop().time()
+    prediction = await create(target, model_input, progress=on_update is not None)
+    if on_update is not None and prediction.status not in TERMINAL_STATUSES:
+        on_update(prediction)
+    try:
+        if on_create is not None:
+            await on_create(prediction)
+        if hedge is not None:
+            prediction = await _hedged_wait(target, model_input, prediction, on_update, hedge, sent)
+        else:
+            await wait(prediction, on_update)
+    except asyncio.CancelledError:
+        if prediction.status not in TERMINAL_STATUSES and not _shutting_down:
+            cancel(prediction)
+        raise
+    if prediction.status != "succeeded":
+        raise ModelError(prediction)
+    return transform_output(prediction.output, replicate.default_client)
+
+async def attach(prediction_id):
+    """
+    Wait for a prediction created earlier, possibly by another process, and
+    return its output as run() does, or None if it was canceled. If the caller
+    is cancelled the prediction is cancelled too (unless the bot is shutting
+    down). Raises ModelError if the prediction fails.
+    """
+    prediction = await replicate.predictions.async_get(prediction_id)
+    try:
+        await wait(prediction)
+    except asyncio.CancelledError:
+        if prediction.status not in TERMINAL_STATUSES and not _shutting_down:
+            cancel(prediction)
+        raise
+    if prediction.status == "canceled":
+        return None
+    if prediction.status != "succeeded":
+        raise ModelError(prediction)
+    return transform_output(prediction.output, replicate.default_client)
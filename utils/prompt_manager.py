@@ -1 +1 @@
-# utils/prompt_manager.py# A simple in-memory prompt store.# This stores multiple prompts per user as a list.user_prompts = {}def save_prompt(user_id, prompt):    """Append a new prompt for the given user."""    if user_id in user_prompts:        user_prompts[user_id].append(prompt)    else:        user_prompts[user_id] = [prompt]def get_prompts(user_id):    """Return all stored prompts for a user as a list."""    return user_prompts.get(user_id, [])def get_prompt_by_index(user_id, index):    """    Return the prompt at the given index for the user.    Indexes are 1-based for user convenience.    """    prompts = get_prompts(user_id)    if index < 1 or index > len(prompts):        return None    return prompts[index - 1]def list_prompts(user_id):    """    Returns a list of (index, prompt) tuples for the user.    """    prompts = get_prompts(user_id)    return [(i + 1, prompt) for i, prompt in enumerate(prompts)]
\ No newline at end of file
+# utils/prompt_manager.pyfrom utils.storage import storefrom utils.paginator import page_cache# Prompts are kept per user in the shared SQLite store (utils/storage.py).KIND = "prompt"async def save_prompt(user_id, prompt):    """    Append a new prompt for the given user.    Returns the prompt's 1-based index, assigned atomically on insert.    """    (index,) = await store.append(user_id, KIND, [prompt])    page_cache.invalidate(user_id, KIND)    return indexasync def get_prompts(user_id):    """Return all stored prompts for a user as a list."""    return [prompt for _, prompt in await store.list(user_id, KIND)]async def get_prompt_by_index(user_id, index):    """    Return the prompt at the given index for the user.    Indexes are 1-based for user convenience.    """    return await store.get(user_id, KIND, index)async def list_prompts(user_id, after=0, limit=None):    """    Returns a list of (index, prompt) tuples for the user.    Pages through the history when given a limit: pass the last index of the    previous page as `after` to fetch the next one.    """    return await store.list(user_id, KIND, after, limit)async def count_prompts(user_id):    """Return how many prompts the user has stored."""    return await store.count(user_id, KIND)
\ No newline at end of file
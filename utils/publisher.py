@@ -0,0 +1,95 @@
+# utils/publisher.py
+import time
+import asyncio
+import logging
+import discord
+from utils import metrics
+from utils import postprocess
+from utils.buffers import nbytes
+
+log = logging.getLogger(__name__)
+
+# Generation results are posted as few messages as Discord allows: up to
+# MAX_ATTACHMENTS files per message, within the channel's upload size limit.
+# When more than one message is needed they are uploaded in parallel.
+MAX_ATTACHMENTS = 10
+DEFAULT_UPLOAD_LIMIT = 10 * 1024 * 1024    # DMs, and guilds without boosts
+
+UPLOAD_SECONDS = metrics.histogram(
+    "bot_upload_seconds", "Time to post one message of generation outputs to Discord.",
+    labels=("outcome",)
+)
+
+def upload_limit(ctx):
+    """Return the per-message upload limit in bytes for ctx's channel."""
+    guild = getattr(ctx, "guild", None)
+    return guild.filesize_limit if guild is not None else DEFAULT_UPLOAD_LIMIT
+
+def batches(files, max_bytes, max_files=MAX_ATTACHMENTS):
+    """
+    Split (filename, data) pairs into consecutive batches of at most max_files
+    files and max_bytes bytes. A file larger than max_bytes gets a batch of its own.
+    """
+    groups, current, size = [], [], 0
+    for filename, data in files:
+        if current and (len(current) >= max_files or size + nbytes(data) > max_bytes):
+            groups.append(current)
+            current, size = [], 0
+        current.append((filename, data))
+        size += nbytes(data)
+    if current:
+        groups.append(current)
+    return groups
+
+async def publish(ctx, content, files, preview=False, max_bytes=None):
+    """
+    Post files, a list of (filename, OutputBuffer), under content and return
+    the resulting attachment URLs in the same order as files. Each file is
+    first renamed to its real format and fitted to the upload limit
+    (utils/postprocess.py; the fast path if preview). Messages that fail to
+    send are logged and their files left out. Each buffer is released once
+    its message has been sent or has failed. ctx can be anything with send();
+    max_bytes overrides the upload limit of its channel.
+    """
+    limit = max_bytes or upload_limit(ctx)
+    try:
+        files = await postprocess.process_all(files, limit, preview)
+    except BaseException:
+        for _, buffer in files:
+            buffer.release()
+        raise
+    groups = batches(files, limit)
+
+    async def send(part, group):
+        text = content if part == 1 else f"{content}\n*(part {part}/{len(groups)})*"
+        start = time.perf_counter()
+        try:
+            sent = await ctx.send(
+                content=text,
+                files=[discord.File(buffer, filename) for filename, buffer in group]
+            )
+        except Exception:
+            UPLOAD_SECONDS.observe(time.perf_counter() - start, outcome="error")
+            raise
+        finally:
+            for _, buffer in group:
+                buffer.release()
+        UPLOAD_SECONDS.observe(time.perf_counter() - start, outcome="ok")
+        return sent
+
+    try:
+        results = await asyncio.gather(
+            *(send(part, group) for part, group in enumerate(groups, start=1)),
+            return_exceptions=True
+        )
+    finally:
+        # Buffers whose send never ran (the caller was cancelled first).
+        for _, buffer in files:
+            buffer.release()
+    urls = []
+    for result in results:
+        if isinstance(result, BaseException):
+            log.warning("Could not post generation output: %s", result)
+            continue
+        urls.extend(attachment.url for attachment in result.attachments)
+    return urls
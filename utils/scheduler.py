@@ -0,0 +1,204 @@
+# utils/scheduler.py
+import os
+import asyncio
+import logging
+import itertools
+import contextvars
+from collections import deque
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+# All generation work (Replicate predictions) is admitted through one scheduler:
+# a fixed pool of workers pulls jobs from per-user queues in round-robin order,
+# so one user's !multigen burst cannot starve everyone else.
+#
+#   GEN_WORKERS           number of jobs running at once
+#   GEN_QUEUE_LIMIT       total jobs allowed to wait
+#   GEN_USER_QUEUE_LIMIT  jobs a single user may have waiting
+#   GEN_QUEUE_POLICY      "reject" (raise QueueFull) or "defer" (wait for space)
+GEN_WORKERS = int(os.environ.get("GEN_WORKERS", "8"))
+GEN_QUEUE_LIMIT = int(os.environ.get("GEN_QUEUE_LIMIT", "100"))
+GEN_USER_QUEUE_LIMIT = int(os.environ.get("GEN_USER_QUEUE_LIMIT", "12"))
+GEN_QUEUE_POLICY = os.environ.get("GEN_QUEUE_POLICY", "reject")
+
+class QueueFull(Exception):
+    """Raised when a job is rejected because the generation queue is full."""
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, user_id, factory, on_position):
+        self.id = next(self._ids)
+        self.user_id = user_id
+        self.factory = factory
+        self.on_position = on_position
+        # Run the job in the submitter's context, so context variables set
+        # by the command (e.g. utils/tracing.py) reach the prediction.
+        self.context = contextvars.copy_context()
+        self.future = asyncio.get_running_loop().create_future()
+        self.task = None
+        self.position = None
+
+class JobScheduler:
+    def __init__(self, workers=GEN_WORKERS, max_queued=GEN_QUEUE_LIMIT,
+                 max_per_user=GEN_USER_QUEUE_LIMIT, policy=GEN_QUEUE_POLICY):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.policy = policy
+        self.running = 0
+        self._queues = {}        # user_id -> deque of waiting jobs
+        self._ring = deque()     # user_ids with waiting jobs, in round-robin order
+        self._queued = 0
+        self._changed = None
+        self._tasks = []
+
+    @property
+    def depth(self):
+        """Number of jobs waiting to start."""
+        return self._queued
+
+    def _ensure_started(self):
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    def _has_room(self, user_id):
+        return (self._queued < self.max_queued
+                and len(self._queues.get(user_id, ())) < self.max_per_user)
+
+    async def submit(self, user_id, factory, on_position=None):
+        """
+        Queue factory() to run on a worker and return its result.
+        on_position(job_id, position) is awaited whenever the job's place in the
+        queue changes; position 0 means the job has started.
+        Raises QueueFull under the "reject" policy when there is no room.
+        """
+        self._ensure_started()
+        async with self._changed:
+            if not self._has_room(user_id):
+                if self.policy != "defer":
+                    raise QueueFull(
+                        "The generation queue is full right now. Please try again in a moment."
+                    )
+                await self._changed.wait_for(lambda: self._has_room(user_id))
+            job = Job(user_id, factory, on_position)
+            queue = self._queues.setdefault(user_id, deque())
+            if not queue:
+                self._ring.append(user_id)
+            queue.append(job)
+            self._queued += 1
+            self._changed.notify_all()
+        self._report_positions()
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            # Drop the job if it is still queued, or stop it if it already started.
+            job.future.cancel()
+            if job.task is not None:
+                job.task.cancel()
+            elif self._remove(job):
+                # Its place is free: wake deferred submitters, move the rest up.
+                async with self._changed:
+                    self._changed.notify_all()
+                self._report_positions()
+            raise
+
+    def _remove(self, job):
+        """Take a job that has not started out of its user's queue; False if it is not there."""
+        queue = self._queues.get(job.user_id)
+        if queue is None or job not in queue:
+            return False
+        queue.remove(job)
+        self._queued -= 1
+        if not queue:
+            del self._queues[job.user_id]
+            self._ring.remove(job.user_id)
+        return True
+
+    def _next_job(self):
+        while self._ring:
+            user_id = self._ring.popleft()
+            queue = self._queues[user_id]
+            job = queue.popleft()
+            self._queued -= 1
+            if queue:
+                self._ring.append(user_id)
+            else:
+                del self._queues[user_id]
+            if not job.future.cancelled():
+                return job
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self._queued > 0)
+                job = self._next_job()
+                self._changed.notify_all()
+            if job is None:
+                continue
+            self.running += 1
+            self._report_positions()
+            self._notify(job, 0)
+            job.task = asyncio.create_task(job.factory(), context=job.context)
+            try:
+                await asyncio.wait([job.task])
+            except asyncio.CancelledError:
+                job.task.cancel()
+                raise
+            finally:
+                self.running -= 1
+            if job.future.done():
+                continue
+            if job.task.cancelled():
+                job.future.cancel()
+            elif job.task.exception() is not None:
+                job.future.set_exception(job.task.exception())
+            else:
+                job.future.set_result(job.task.result())
+
+    def _report_positions(self):
+        """
+        Work out how many jobs will start before each waiting job and notify the
+        ones whose position changed. Round k of the ring serves the k-th job of
+        every user that still has one. While a worker is idle the next job
+        starts immediately, so nothing is reported.
+        """
+        if self.running < self.workers:
+            return
+        ring = list(self._ring)
+        for ring_index, user_id in enumerate(ring):
+            for k, job in enumerate(self._queues[user_id]):
+                ahead = sum(min(len(self._queues[u]), k) for u in ring)
+                ahead += sum(1 for u in ring[:ring_index] if len(self._queues[u]) > k)
+                self._notify(job, ahead + 1)
+
+    def _notify(self, job, position):
+        if job.position == position:
+            return
+        job.position = position
+        if job.on_position is not None:
+            task = asyncio.create_task(job.on_position(job.id, position))
+            task.add_done_callback(_log_callback_error)
+
+def _log_callback_error(task):
+    if not task.cancelled() and task.exception() is not None:
+        log.debug("Queue position callback failed: %s", task.exception())
+
+scheduler = JobScheduler()
+
+metrics.gauge("bot_queue_depth", "Generation jobs waiting for a worker.", fn=lambda: scheduler.depth)
+metrics.gauge("bot_jobs_running", "Generation jobs currently running.", fn=lambda: scheduler.running)
+metrics.gauge("bot_job_workers", "Size of the generation worker pool.", fn=lambda: scheduler.workers)
+
+async def submit(user_id, factory, status=None):
+    """
+    Run factory() through the shared scheduler on behalf of user_id.
+    status is a utils.status.StatusMessage (possibly shared by several jobs)
+    that shows the job's queue position.
+    """
+    return await scheduler.submit(user_id, factory, status)
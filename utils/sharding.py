@@ -0,0 +1,86 @@
+# utils/sharding.py
+import os
+import asyncio
+import logging
+from discord.ext import commands
+from utils import metrics
+
+log = logging.getLogger(__name__)
+
+# Gateway sharding, picked with SHARD_MODE:
+#
+#   none     one gateway connection (commands.Bot), the default
+#   auto     commands.AutoShardedBot runs every shard in this process:
+#            SHARD_COUNT of them, or as many as Discord recommends if unset
+#   process  this process runs the shards in SHARD_IDS (e.g. "0,1") out of
+#            SHARD_COUNT; start one bot.py per group of shards, each with its
+#            own PORT
+#
+# Every process shares the SQLite store (DATABASE_PATH): saved prompts, images
+# and videos, the LLM memo, the job journal and the job broker are the same
+# whichever shard a command arrives on. A process only resumes the journaled
+# predictions of its own shards' guilds (utils/journal.py); DMs belong to
+# shard 0, as on Discord. What stays per process is transient: the per-user
+# queue limits (utils/scheduler.py), !cancel and the output cache only see
+# the commands that process ran.
+SHARD_MODE = os.environ.get("SHARD_MODE", "none")
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else None
+SHARD_IDS = [int(i) for i in os.environ.get("SHARD_IDS", "").replace(",", " ").split()] or None
+SHARD_EVENTS_INTERVAL = 5
+
+SHARD_EVENTS = metrics.counter(
+    "bot_gateway_events_total", "Gateway events received, per shard.", labels=("shard",)
+)
+
+def create_bot(**options):
+    """A commands.Bot, or an AutoShardedBot for the configured shards."""
+    if SHARD_MODE == "none":
+        return commands.Bot(**options)
+    if SHARD_MODE == "auto":
+        return commands.AutoShardedBot(shard_count=SHARD_COUNT, **options)
+    if SHARD_MODE == "process":
+        if SHARD_COUNT is None or SHARD_IDS is None:
+            raise ValueError("SHARD_MODE=process needs SHARD_COUNT and SHARD_IDS")
+        return commands.AutoShardedBot(shard_count=SHARD_COUNT, shard_ids=SHARD_IDS, **options)
+    raise ValueError(f"Unknown SHARD_MODE {SHARD_MODE!r} (use none, auto or process)")
+
+def local_shards(client):
+    """
+    (shard_count, shard ids run by this process) for a sharded client, or
+    None when it has a single connection and sees every guild.
+    """
+    shard_count = getattr(client, "shard_count", None)
+    if not shard_count or shard_count == 1:
+        return None
+    return shard_count, list(getattr(client, "shard_ids", None) or range(shard_count))
+
+def latencies(client):
+    """{(shard,): heartbeat latency} for this process's shards."""
+    if isinstance(client, commands.AutoShardedBot):
+        return {(str(shard_id),): latency for shard_id, latency in client.latencies}
+    return {(str(client.shard_id or 0),): client.latency}
+
+def _websockets(client):
+    if isinstance(client, commands.AutoShardedBot):
+        return [(shard_id, client._get_websocket(shard_id=shard_id)) for shard_id in client.shards]
+    return [(client.shard_id or 0, client.ws)]
+
+async def watch_events(client, interval=SHARD_EVENTS_INTERVAL):
+    """
+    Count gateway events per shard into bot_gateway_events_total. Every
+    dispatched event bumps its connection's sequence number, so sampling the
+    sequence costs nothing per event; it restarts from 1 with a new session.
+    """
+    last = {}
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            for shard_id, ws in _websockets(client):
+                sequence = getattr(ws, "sequence", None)
+                if sequence is None:
+                    continue
+                previous = last.get(shard_id, 0)
+                SHARD_EVENTS.inc(sequence - previous if sequence >= previous else sequence, shard=str(shard_id))
+                last[shard_id] = sequence
+        except Exception as e:
+            log.debug("Could not sample gateway events: %s", e)
@@ -0,0 +1,228 @@
+# utils/status.py
+import os
+import re
+import asyncio
+import logging
+import discord
+from utils.cancellation import tracker
+
+log = logging.getLogger(__name__)
+
+# A command's "Generating..." message doubles as its progress display: queue
+# position (from utils/scheduler.py) and prediction progress (from
+# utils/predictions.py) are shown under the original text. Those updates are
+# coalesced: at most one edit per STATUS_EDIT_INTERVAL seconds, always showing
+# the latest state and dropping the ones in between, so progress never eats
+# into the channel rate limit the result uploads need. Final edits and
+# deletes go out immediately.
+STATUS_EDIT_INTERVAL = float(os.environ.get("STATUS_EDIT_INTERVAL", "2.5"))
+LOG_LINE_LENGTH = 120
+
+_PERCENT = re.compile(r"(\d{1,3})%\|")
+_STEPS = re.compile(r"\|\s*(\d+)/(\d+)")
+
+def describe(prediction):
+    """One line describing a running prediction: its status and tqdm-style progress or last log line."""
+    if prediction.status == "starting":
+        return "Starting (model is booting)"
+    if prediction.status != "processing":
+        return prediction.status.capitalize()
+    lines = [line.strip() for line in (prediction.logs or "").splitlines() if line.strip()]
+    if not lines:
+        return "Processing"
+    last = lines[-1]
+    percent = _PERCENT.findall(last)
+    if percent:
+        steps = _STEPS.search(last)
+        suffix = f" ({steps.group(1)}/{steps.group(2)})" if steps else ""
+        return f"Processing: {percent[-1]}%{suffix}"
+    if len(last) > LOG_LINE_LENGTH:
+        last = last[:LOG_LINE_LENGTH - 3] + "..."
+    return f"Processing: `{last}`"
+
+class StatusMessage:
+    """
+    Wraps a status message with coalesced, rate-capped progress edits.
+    Use it in place of the message: edit() and delete() are final and
+    immediate. Several jobs may share one StatusMessage (e.g. the models of a
+    !multigen); it shows the queue position of the next one to start and one
+    progress line per label.
+    """
+
+    def __init__(self, msg, interval=STATUS_EDIT_INTERVAL, view=None):
+        self.msg = msg
+        self.view = view
+        self.text = msg.content
+        self.interval = interval
+        self._positions = {}
+        self._progress = {}
+        self._shown = self.text
+        self._last_edit = 0.0
+        self._flusher = None
+        self._editing = False
+        self._closed = False
+        self.edits = 0
+
+    @property
+    def content(self):
+        return self.text
+
+    async def __call__(self, job_id, position):
+        """Scheduler callback: job_id is at position in the queue (0 = started)."""
+        self.set_position(job_id, position)
+
+    def set_position(self, job_id, position):
+        self._positions[job_id] = position
+        self._schedule()
+
+    def set_progress(self, label, text):
+        """Show text as the progress line for label."""
+        self._progress[label] = text
+        self._schedule()
+
+    def tracker(self, label=None):
+        """Return a callback that shows a prediction's progress under label."""
+        return lambda prediction: self.set_progress(label, describe(prediction))
+
+    def render(self):
+        lines = [self.text]
+        waiting = [p for p in self._positions.values() if p]
+        if waiting:
+            lines.append(f"*Queued, position {min(waiting)}.*")
+        for label, text in self._progress.items():
+            lines.append(f"*{label}: {text}*" if label else f"*{text}*")
+        return "\n".join(lines)
+
+    def _schedule(self):
+        if self._closed or (self._flusher is not None and not self._flusher.done()):
+            return
+        self._flusher = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        while not self._closed and self.render() != self._shown:
+            delay = self._last_edit + self.interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            target = self.render()
+            self._editing = True
+            try:
+                await self.msg.edit(content=target)
+            except discord.HTTPException as e:
+                log.debug("Status edit failed: %s", e)
+                return
+            finally:
+                self._editing = False
+                self._last_edit = loop.time()
+            self._shown = target
+            self.edits += 1
+
+    async def _close(self):
+        # Let an edit already on the wire finish so it cannot land after the final one.
+        self._closed = True
+        if self.view is not None:
+            self.view.stop()
+        if self._flusher is None or self._flusher.done():
+            return
+        if not self._editing:
+            self._flusher.cancel()
+        try:
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+
+    async def edit(self, **kwargs):
+        """Final edit: stop progress updates, drop the Cancel button and edit the message now."""
+        await self._close()
+        self.text = kwargs.get("content", self.text)
+        if self.view is not None:
+            kwargs.setdefault("view", None)
+        await self.msg.edit(**kwargs)
+
+    async def delete(self):
+        """Stop progress updates and delete the message."""
+        await self._close()
+        await self.msg.delete()
+
+class SharedStatus:
+    """
+    Stands in for a StatusMessage (as the scheduler's status and a prediction's
+    on_update) for a run shared by several commands: its queue position and
+    progress go to the status message of every command that joined it, each
+    under that command's own label. A late joiner is shown the latest state.
+    """
+
+    def __init__(self):
+        self._members = []     # (StatusMessage, label)
+        self._position = None
+        self._progress = None
+
+    def join(self, status, label=None):
+        self._members.append((status, label))
+        if self._position is not None:
+            status.set_position(*self._position)
+        if self._progress is not None:
+            status.set_progress(label, self._progress)
+
+    async def __call__(self, job_id, position):
+        self._position = (job_id, position)
+        for status, _ in self._members:
+            status.set_position(job_id, position)
+
+    def update(self, prediction):
+        """on_update callback for the shared prediction."""
+        self._progress = describe(prediction)
+        for status, label in self._members:
+            status.set_progress(label, self._progress)
+
+class DeadlineStatus:
+    """
+    Stands in for a StatusMessage to start a deadline when the job starts:
+    passes position and progress on to status, and once the scheduler reports
+    position 0 reschedules scope (an asyncio.timeout) to expire after timeout
+    seconds. Time spent waiting in the queue is not counted.
+    """
+
+    def __init__(self, status, scope, timeout):
+        self.status = status
+        self.scope = scope
+        self.timeout = timeout
+
+    async def __call__(self, job_id, position):
+        self.set_position(job_id, position)
+
+    def set_position(self, job_id, position):
+        if position == 0 and self.scope.when() is None:
+            self.scope.reschedule(asyncio.get_running_loop().time() + self.timeout)
+        self.status.set_position(job_id, position)
+
+    def set_progress(self, label, text):
+        self.status.set_progress(label, text)
+
+class CancelView(discord.ui.View):
+    """A Cancel button for the command that sent the status message."""
+
+    def __init__(self, user_id, message_id):
+        super().__init__(timeout=None)
+        self.user_id = user_id
+        self.message_id = message_id
+
+    @discord.ui.button(label="Cancel", style=discord.ButtonStyle.danger)
+    async def cancel(self, interaction, button):
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("Only the person who ran the command can cancel it.", ephemeral=True)
+            return
+        await interaction.response.defer()
+        await tracker.cancel(tracker.for_message(self.message_id), reason="button")
+
+async def send_status(ctx, content):
+    """
+    Send a command's status message with a Cancel button and return it as a
+    StatusMessage, registered so that cancelling the command marks it.
+    """
+    message = getattr(ctx, "message", None)
+    view = CancelView(ctx.author.id, message.id if message is not None else None)
+    status = StatusMessage(await ctx.send(content, view=view), view=view)
+    tracker.attach_status(status)
+    return status
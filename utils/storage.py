@@ -0,0 +1,215 @@
+# utils/storage.py
+import os
+import time
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from utils import metrics
+
+# Durable storage for everything users save (prompts, images, videos).
+# One SQLite database in WAL mode; every item is keyed on (user_id, kind, idx)
+# where idx is the user's 1-based index for that kind. The table is clustered
+# on that key, so lookups and per-user listings are B-tree range scans.
+DATABASE_PATH = os.environ.get("DATABASE_PATH", "bot.db")
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS items (
+        user_id INTEGER NOT NULL,
+        kind    TEXT    NOT NULL,
+        idx     INTEGER NOT NULL,
+        value   TEXT    NOT NULL,
+        PRIMARY KEY (user_id, kind, idx)
+    ) WITHOUT ROWID;
+    """,
+    # Append-only per-user counters: the next index is assigned by bumping the
+    # counter inside the insert transaction, never by scanning existing items.
+    """
+    CREATE TABLE IF NOT EXISTS counters (
+        user_id  INTEGER NOT NULL,
+        kind     TEXT    NOT NULL,
+        last_idx INTEGER NOT NULL,
+        PRIMARY KEY (user_id, kind)
+    ) WITHOUT ROWID;
+    INSERT OR IGNORE INTO counters (user_id, kind, last_idx)
+        SELECT user_id, kind, MAX(idx) FROM items GROUP BY user_id, kind;
+    """,
+    # Memoised LLM outputs (utils/llm_memo.py), evicted by age and by last use.
+    """
+    CREATE TABLE IF NOT EXISTS llm_memo (
+        key     TEXT PRIMARY KEY,
+        output  TEXT NOT NULL,
+        created REAL NOT NULL,
+        used    REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS llm_memo_created ON llm_memo (created);
+    CREATE INDEX IF NOT EXISTS llm_memo_used ON llm_memo (used);
+    """,
+    # Predictions in flight, by the command that started them (utils/journal.py).
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        prediction_id TEXT    PRIMARY KEY,
+        model         TEXT    NOT NULL,
+        command       TEXT    NOT NULL,
+        user_id       INTEGER NOT NULL,
+        channel_id    INTEGER NOT NULL,
+        message_id    INTEGER,
+        created       REAL    NOT NULL,
+        attempts      INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS jobs_message ON jobs (message_id);
+    """,
+    # Jobs handed from the gateway to worker processes (utils/broker.py).
+    """
+    CREATE TABLE IF NOT EXISTS broker_jobs (
+        id          INTEGER PRIMARY KEY,
+        kind        TEXT    NOT NULL,
+        payload     TEXT    NOT NULL,
+        status      TEXT    NOT NULL,
+        claimed_by  TEXT,
+        lease_until REAL,
+        result      TEXT,
+        error       TEXT,
+        finished    REAL
+    );
+    CREATE INDEX IF NOT EXISTS broker_jobs_status ON broker_jobs (status, id);
+    """,
+    # The guild a journaled prediction's command came from, for sharded resumes.
+    """
+    ALTER TABLE jobs ADD COLUMN guild_id INTEGER;
+    """,
+    # What a journaled command's outputs are saved as (image, video or prompt).
+    """
+    ALTER TABLE jobs ADD COLUMN kind TEXT;
+    UPDATE jobs SET kind = 'image' WHERE command IN
+        ('flux', 'redux', 'fluxpro', 'stable35', 'sdxl', 'imagen', 'recraftv3', 'playground', 'multigen');
+    UPDATE jobs SET kind = 'video' WHERE command = 'video';
+    UPDATE jobs SET kind = 'prompt' WHERE command IN ('gpt', 'refine');
+    """,
+    # The broker job a worker process journaled a prediction for (utils/workers.py).
+    """
+    ALTER TABLE jobs ADD COLUMN job TEXT;
+    CREATE INDEX IF NOT EXISTS jobs_job ON jobs (job);
+    """,
+]
+
+class Store:
+    """
+    Async facade over a single SQLite connection.
+    All statements run on one dedicated thread (a sqlite3 connection must stay
+    on the thread that uses it), so callers on the event loop never block.
+    """
+
+    def __init__(self, path=DATABASE_PATH):
+        self.path = path
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self.pending = 0    # calls submitted to the storage thread and not yet finished
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.executescript(f"BEGIN; {script}; PRAGMA user_version = {number}; COMMIT;")
+        return conn
+
+    def _run(self, fn, args):
+        if self._conn is None:
+            self._conn = self._connect()
+        return fn(self._conn, *args)
+
+    async def call(self, fn, *args):
+        """Run fn(conn, *args) on the storage thread and return its result."""
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, self._run, fn, args)
+        finally:
+            self.pending -= 1
+            STORAGE_SECONDS.observe(time.perf_counter() - start)
+
+    async def close(self):
+        def _close(conn):
+            conn.close()
+            self._conn = None
+        if self._conn is not None:
+            await self.call(_close)
+
+    async def append(self, user_id, kind, values):
+        """
+        Append values to the user's list of kind in one transaction.
+        Returns the 1-based indexes assigned to them, in order.
+        """
+        return await self.call(_append, user_id, kind, list(values))
+
+    async def get(self, user_id, kind, index):
+        """Return the value at a 1-based index, or None."""
+        return await self.call(_get, user_id, kind, index)
+
+    async def list(self, user_id, kind, after=0, limit=None):
+        """
+        Return [(index, value), ...] for the user's items of kind, in order.
+        Pass the last index of the previous page as `after` to continue from it.
+        """
+        return await self.call(_list, user_id, kind, after, limit)
+
+    async def count(self, user_id, kind):
+        """Return how many items of kind the user has saved."""
+        return await self.call(_count, user_id, kind)
+
+def _append(conn, user_id, kind, values):
+    if not values:
+        return []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        last = conn.execute(
+            "INSERT INTO counters (user_id, kind, last_idx) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id, kind) DO UPDATE SET last_idx = last_idx + excluded.last_idx "
+            "RETURNING last_idx",
+            (user_id, kind, len(values))
+        ).fetchone()[0]
+        start = last - len(values) + 1
+        conn.executemany(
+            "INSERT INTO items (user_id, kind, idx, value) VALUES (?, ?, ?, ?)",
+            [(user_id, kind, start + i, value) for i, value in enumerate(values)]
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return list(range(start, last + 1))
+
+def _get(conn, user_id, kind, index):
+    row = conn.execute(
+        "SELECT value FROM items WHERE user_id = ? AND kind = ? AND idx = ?",
+        (user_id, kind, index)
+    ).fetchone()
+    return row[0] if row else None
+
+def _list(conn, user_id, kind, after, limit):
+    return conn.execute(
+        "SELECT idx, value FROM items WHERE user_id = ? AND kind = ? AND idx > ? ORDER BY idx LIMIT ?",
+        (user_id, kind, after, -1 if limit is None else limit)
+    ).fetchall()
+
+def _count(conn, user_id, kind):
+    row = conn.execute(
+        "SELECT last_idx FROM counters WHERE user_id = ? AND kind = ?",
+        (user_id, kind)
+    ).fetchone()
+    return row[0] if row else 0
+
+store = Store()
+
+STORAGE_SECONDS = metrics.histogram(
+    "bot_storage_call_seconds", "Time for a storage call, including waiting for the storage thread.",
+    buckets=metrics.FAST_BUCKETS
+)
+metrics.gauge(
+    "bot_storage_executor_pending", "Storage calls queued or running on the single storage thread.",
+    fn=lambda: store.pending
+)
@@ -0,0 +1,135 @@
+# utils/tracing.py
+import os
+import re
+import hmac
+import json
+import time
+import asyncio
+import logging
+import secrets
+import contextvars
+from hashlib import sha256
+
+log = logging.getLogger(__name__)
+
+# Opt-in recording of real traffic for bench/replay.py. With TRACE_PATH set,
+# every command is appended to that file as one JSON line when it finishes:
+#
+#   {"at": 12.3, "user": "3f9a0c...", "command": "flux",
+#    "args": ["<words:6>", "2"], "attachments": [], "seconds": 4.1,
+#    "outcome": "ok", "predictions": [{"model": "black-forest-labs/flux-schnell",
+#    "seconds": 3.2, "outcome": "ok"}]}
+#
+# "at" is seconds since recording started. Traces are anonymised: user ids are
+# HMACed with TRACE_SALT (random per process unless set, so traces from
+# different runs cannot be joined), and free text (prompts, instructions) is
+# reduced to its word count. Stored-item markers keep their kind but not
+# their index; numbers, flags and bracketed options are kept as they are.
+TRACE_PATH = os.environ.get("TRACE_PATH")
+TRACE_SALT = os.environ.get("TRACE_SALT") or secrets.token_hex(16)
+TRACE_FLUSH_INTERVAL = 5
+
+_MARKER = re.compile(r"^(prompt|image|video)\[\d+\]$")
+_OPTION = re.compile(r"^\w+\[[\w:.]+\]$")
+
+_current = contextvars.ContextVar("trace_record", default=None)
+
+def anonymise(user_id):
+    return hmac.new(TRACE_SALT.encode(), str(user_id).encode(), sha256).hexdigest()[:12]
+
+def shape(text):
+    """
+    The shape of a command's arguments: markers, options, numbers and flags
+    as tokens, each run of free words as "<words:N>".
+    """
+    tokens, words = [], 0
+    for word in text.split():
+        marker = _MARKER.match(word)
+        if marker or _OPTION.match(word) or word.isdigit() or word == "nocache":
+            if words:
+                tokens.append(f"<words:{words}>")
+                words = 0
+            tokens.append(f"{marker.group(1)}[]" if marker else word)
+        else:
+            words += 1
+    if words:
+        tokens.append(f"<words:{words}>")
+    return tokens
+
+def arguments(ctx):
+    """What followed "!command" in the invoking message."""
+    content = getattr(getattr(ctx, "message", None), "content", "") or ""
+    parts = content.split(None, 1)
+    return parts[1] if len(parts) > 1 else ""
+
+class TraceRecorder:
+    def __init__(self, path=TRACE_PATH):
+        self.path = path
+        self._started = time.monotonic()
+        self._records = {}       # task -> (record, start time) of the command it runs
+        self._pending = []
+        self._flusher = None
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def start(self, ctx):
+        """Begin recording the command running in the current task."""
+        if not self.enabled:
+            return
+        message = getattr(ctx, "message", None)
+        record = {
+            "at": round(time.monotonic() - self._started, 3),
+            "user": anonymise(ctx.author.id),
+            "command": ctx.command.qualified_name,
+            "args": shape(arguments(ctx)),
+            "attachments": [a.content_type for a in getattr(message, "attachments", ())],
+            "predictions": [],
+        }
+        self._records[asyncio.current_task()] = (record, time.perf_counter())
+        _current.set(record)
+
+    def finish(self, ctx):
+        entry = self._records.pop(asyncio.current_task(), None)
+        if entry is None:
+            return
+        record, start = entry
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        if asyncio.current_task().cancelling():
+            record["outcome"] = "cancelled"
+        else:
+            record["outcome"] = "error" if getattr(ctx, "command_failed", False) else "ok"
+        self._pending.append(json.dumps(record, separators=(",", ":")))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    def prediction(self, ref, seconds, outcome):
+        """Add a finished prediction to the record of the command it ran for."""
+        record = _current.get()
+        if record is not None:
+            record["predictions"].append({"model": ref, "seconds": round(seconds, 3), "outcome": outcome})
+
+    def _write(self, lines):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    async def flush(self):
+        lines, self._pending = self._pending, []
+        if not lines:
+            return
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except OSError as e:
+            log.warning("Could not write %d trace records to %s: %s", len(lines), self.path, e)
+
+    async def _flush_later(self):
+        await asyncio.sleep(TRACE_FLUSH_INTERVAL)
+        await self.flush()
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self.flush()
+
+recorder = TraceRecorder()
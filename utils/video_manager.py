@@ -1 +1 @@
-# utils/video_manager.py# In-memory storage for video URLs per user.# Each user is mapped to a list of video URLs.user_videos = {}def add_videos(user_id, videos):    """    Adds a list of video URLs to the user's stored videos.    If the user already has stored videos, we append the new ones.    """    if user_id in user_videos:        user_videos[user_id].extend(videos)    else:        user_videos[user_id] = videosdef get_videos(user_id):    """Return the list of stored video URLs for a given user."""    return user_videos.get(user_id, [])def get_video_by_index(user_id, index):    """    Retrieve a video URL by its 1-based index.    Returns None if the index is invalid.    """    videos = get_videos(user_id)    if index < 1 or index > len(videos):        return None    return videos[index - 1]def list_videos(user_id):    """    Returns a list of tuples (index, video_url) for the user's stored videos.    """    videos = get_videos(user_id)    return [(i + 1, video) for i, video in enumerate(videos)]
\ No newline at end of file
+# utils/video_manager.pyfrom utils.storage import storefrom utils.paginator import page_cache# Video URLs are kept per user in the shared SQLite store (utils/storage.py).KIND = "video"async def add_videos(user_id, videos):    """    Adds a list of video URLs to the user's stored videos.    The whole list is inserted in a single transaction.    Returns the 1-based indexes assigned to the new videos.    """    indexes = await store.append(user_id, KIND, videos)    page_cache.invalidate(user_id, KIND)    return indexesasync def get_videos(user_id):    """Return the list of stored video URLs for a given user."""    return [url for _, url in await store.list(user_id, KIND)]async def get_video_by_index(user_id, index):    """    Retrieve a video URL by its 1-based index.    Returns None if the index is invalid.    """    return await store.get(user_id, KIND, index)async def list_videos(user_id, after=0, limit=None):    """    Return a list of tuples (index, video_url) for the user's stored videos.    Pass the last index of the previous page as `after` to page through them.    """    return await store.list(user_id, KIND, after, limit)async def count_videos(user_id):    """Return how many videos the user has stored."""    return await store.count(user_id, KIND)
\ No newline at end of file
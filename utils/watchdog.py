@@ -0,0 +1,168 @@
+# utils/watchdog.py
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter
+from utils import metrics
+from utils.cancellation import tracker
+
+log = logging.getLogger(__name__)
+
+# A heartbeat task on the event loop notes the time every WATCHDOG_INTERVAL
+# seconds; a sidecar thread checks it. Once the heartbeat is more than
+# LOOP_STALL_THRESHOLD seconds late the loop is stalled (something is
+# blocking it), and the thread logs the event loop thread's stack as it is at
+# that moment together with the command the blocking task is running for
+# (name, cog and argument shape, see utils/cancellation.py). When the loop
+# catches up the stall's length is logged and counted.
+#
+# The same thread is a sampling profiler: while `!profile on` is in effect
+# (cogs/profile.py) it samples the loop thread's stack every PROFILE_INTERVAL
+# seconds and charges each sample to the command running at the time. When a
+# profiled command finishes its samples are written to PROFILE_DIR as
+# "<command>-<time>.folded", in the folded-stack format flamegraph.pl and
+# speedscope read. Only time spent on the event loop is seen; work handed to
+# threads or worker processes is not.
+LOOP_STALL_THRESHOLD = float(os.environ.get("LOOP_STALL_THRESHOLD", "0.25"))
+WATCHDOG_INTERVAL = 0.05
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+LOOP_STALLS = metrics.counter("bot_event_loop_stalls_total", "Event-loop stalls over LOOP_STALL_THRESHOLD.")
+LOOP_STALL_SECONDS = metrics.histogram("bot_event_loop_stall_seconds", "Length of event-loop stalls.")
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def folded(frame):
+    """A stack as one folded line, outermost frame first."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class LoopWatchdog:
+    def __init__(self, threshold=LOOP_STALL_THRESHOLD, profile_dir=PROFILE_DIR):
+        self.threshold = threshold
+        self.profile_dir = profile_dir
+        self.profiling = None      # None (off), or the command names to profile (empty: all)
+        self._profiles = {}        # TrackedCommand -> Counter of folded stacks
+        self._loop = None
+        self._loop_thread = None
+        self._beat = None
+        self._heartbeat = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start the heartbeat and the sidecar thread (on the running loop)."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat = asyncio.create_task(self._beat_forever())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+            self._thread = None
+
+    async def _beat_forever(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+
+    def _running(self):
+        # The task on the loop right now and the command it is running for.
+        task = asyncio.current_task(self._loop)
+        entry = tracker.for_task(task) if task is not None else None
+        return entry, task
+
+    def _watch(self):
+        stalled_since = None
+        while not self._stop.wait(PROFILE_INTERVAL if self.profiling is not None else WATCHDOG_INTERVAL):
+            now = time.monotonic()
+            late = now - self._beat - WATCHDOG_INTERVAL
+            if late > self.threshold and stalled_since is None:
+                stalled_since = self._beat + WATCHDOG_INTERVAL
+                self._report(late)
+            elif late <= self.threshold and stalled_since is not None:
+                length = self._beat - stalled_since
+                LOOP_STALLS.inc()
+                LOOP_STALL_SECONDS.observe(length)
+                log.warning("Event loop stall ended after %.2fs", length)
+                stalled_since = None
+            if self.profiling is not None and self._profiles:
+                self._sample()
+
+    def _report(self, late):
+        frame = sys._current_frames().get(self._loop_thread)
+        entry, task = self._running()
+        if entry is not None:
+            culprit = entry.describe()
+        else:
+            culprit = f"task {task.get_name()}" if task is not None else "no task (a callback)"
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "  (no stack)\n"
+        log.warning(
+            "Event loop stalled for %.2fs so far, running %s; commands in flight: %s\nEvent loop thread stack:\n%s",
+            late, culprit, ", ".join(f"!{name}" for name in tracker.running()) or "none", stack
+        )
+
+    def _sample(self):
+        entry, _ = self._running()
+        samples = self._profiles.get(entry) if entry is not None else None
+        if samples is None:
+            return
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is not None:
+            samples[folded(frame)] += 1
+
+    # Profiling, driven by the bot's before/after invoke hooks.
+
+    def profile(self, commands=()):
+        """Profile the named commands (all commands if none are named)."""
+        self.profiling = set(commands)
+
+    def stop_profiling(self):
+        self.profiling = None
+
+    def begin(self, ctx):
+        """Start collecting samples for the command running in the current task, if it is profiled."""
+        if self.profiling is None:
+            return
+        name = ctx.command.qualified_name if getattr(ctx, "command", None) else None
+        entry = tracker.for_task(asyncio.current_task())
+        if entry is not None and (not self.profiling or name in self.profiling):
+            self._profiles[entry] = Counter()
+
+    async def end(self, ctx):
+        """Write the samples collected for the command running in the current task, if any."""
+        entry = tracker.for_task(asyncio.current_task())
+        samples = self._profiles.pop(entry, None) if entry is not None else None
+        if not samples:
+            return
+        path = os.path.join(self.profile_dir, f"{entry.name}-{time.strftime('%Y%m%d-%H%M%S')}-{id(entry):x}.folded")
+        try:
+            await asyncio.to_thread(self._write, path, dict(samples))
+        except OSError as e:
+            log.warning("Could not write profile %s: %s", path, e)
+        else:
+            log.info("Wrote %d samples for !%s to %s", sum(samples.values()), entry.name, path)
+
+    def _write(self, path, samples):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in sorted(samples.items()))
+
+watchdog = LoopWatchdog()
@@ -0,0 +1,93 @@
+# utils/web.py
+import os
+import logging
+from aiohttp import web
+import replicate
+from replicate.webhook import WebhookSigningSecret, WebhookValidationError
+from utils import predictions, metrics
+
+log = logging.getLogger(__name__)
+
+# The bot's HTTP server, run on its own event loop (aiohttp ships with
+# discord.py):
+#
+#   /                         keep-alive checks from the hosting platform
+#   /healthz                  200 once the bot is connected to Discord, 503 otherwise
+#   /metrics                  Prometheus text format (utils/metrics.py)
+#   predictions.WEBHOOK_PATH  Replicate prediction webhooks
+#
+# Webhook bodies are verified against the signing secret: REPLICATE_WEBHOOK_SECRET
+# if set, otherwise the account's default secret fetched at startup. Without a
+# secret, predictions are created without webhooks and polled.
+PORT = int(os.environ.get("PORT", 5000))
+REPLICATE_WEBHOOK_SECRET = os.environ.get("REPLICATE_WEBHOOK_SECRET")
+WEBHOOK_TOLERANCE = 300
+
+routes = web.RouteTableDef()
+_secret = None
+_runner = None
+_bot = None
+
+@routes.get("/")
+async def home(request):
+    return web.Response(text="Bot is running!")
+
+@routes.get("/healthz")
+async def healthz(request):
+    if _bot is None or _bot.is_closed() or not _bot.is_ready():
+        return web.Response(status=503, text="starting")
+    return web.Response(text="ok")
+
+@routes.get("/metrics")
+async def metrics_endpoint(request):
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+@routes.post(predictions.WEBHOOK_PATH)
+async def replicate_webhook(request):
+    body = await request.text()
+    if _secret is None:
+        return web.Response(status=503, text="Webhook secret not loaded")
+    try:
+        replicate.webhooks.validate(
+            headers=dict(request.headers), body=body,
+            secret=_secret, tolerance=WEBHOOK_TOLERANCE
+        )
+    except WebhookValidationError as e:
+        log.warning("Rejected webhook: %s", e)
+        return web.Response(status=401)
+    predictions.deliver(await request.json())
+    return web.Response(status=204)
+
+async def _load_secret():
+    global _secret
+    if REPLICATE_WEBHOOK_SECRET:
+        _secret = WebhookSigningSecret(key=REPLICATE_WEBHOOK_SECRET)
+        return
+    try:
+        _secret = await replicate.webhooks.default.async_secret()
+    except Exception as e:
+        log.warning("Could not fetch the webhook signing secret, polling predictions instead: %s", e)
+        predictions.disable_webhooks()
+
+async def start(bot=None, port=PORT):
+    """
+    Start serving on port; /healthz reports on bot. Loads the webhook secret
+    first when webhooks are enabled.
+    """
+    global _runner, _bot
+    _bot = bot
+    if predictions.webhook_url():
+        await _load_secret()
+    app = web.Application()
+    app.add_routes(routes)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, "0.0.0.0", port).start()
+    log.info("HTTP server listening on port %d", port)
+
+async def stop():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,229 @@
+# utils/workers.py
+import os
+import uuid
+import asyncio
+import logging
+import tempfile
+from utils import metrics, postprocess, predictions
+from utils.broker import broker, BROKER, BROKER_LEASE
+from utils.buffers import OutputBuffer
+from utils.cancellation import tracker
+from utils.downloads import download_all
+from utils.inference import run_model
+from utils.journal import journal
+from utils.publisher import publish, upload_limit, MAX_ATTACHMENTS
+
+log = logging.getLogger(__name__)
+
+# With BOT_MODE=gateway the bot process only talks to Discord: it parses
+# commands, keeps the status messages and the per-user queue (utils/scheduler.py),
+# and hands each generation to a worker as a "generate" job on the broker
+# (utils/broker.py). Workers (worker.py, WORKER_PROCESSES processes running
+# WORKER_CONCURRENCY jobs each) run the prediction, download the outputs,
+# post-process them and post them:
+#
+#   WORKER_POST=rest     the worker posts to the command's channel itself, over
+#                        Discord's REST API (no gateway connection needed)
+#   WORKER_POST=gateway  the worker leaves the processed files in
+#                        WORKER_SPOOL_DIR and the gateway posts them (the
+#                        processes must share a filesystem)
+#
+# Either way the gateway gets the attachment URLs back, as it would have
+# locally. Each job carries the command it runs for, so the worker journals
+# its prediction (utils/journal.py) for that command's channel; a job whose
+# worker died goes to another worker once its lease runs out, which waits for
+# the journaled prediction rather than starting the model again. Predictions
+# run on a worker report no progress, only their place in the queue; set
+# GEN_WORKERS on the gateway to the workers' total capacity (WORKER_PROCESSES
+# * WORKER_CONCURRENCY per machine). With BROKER=memory the workers run as
+# tasks in the gateway process instead (bot.py starts them).
+# BOT_MODE=standalone (the default) runs everything in the bot process, as
+# before.
+BOT_MODE = os.environ.get("BOT_MODE", "standalone")
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", str(os.cpu_count() or 1)))
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", "8"))
+WORKER_POST = os.environ.get("WORKER_POST", "rest")
+WORKER_SPOOL_DIR = os.environ.get(
+    "WORKER_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "replicate-bot-spool")
+)
+CLAIM_TIMEOUT = 5
+
+remote = BOT_MODE == "gateway"
+in_process = remote and BROKER == "memory"
+
+WORKER_JOBS = metrics.counter(
+    "bot_worker_jobs_total", "Jobs run by this worker.", labels=("kind", "outcome")
+)
+
+_cancels = set()
+
+async def generate(ctx, model, model_input, caption, filename, preview=False):
+    """
+    Run model on model_input on a worker and post its outputs to ctx's channel
+    under caption (output i as filename(i)). Returns the attachment URLs.
+    If the caller is cancelled the job is cancelled on the broker too.
+    """
+    guild = getattr(ctx, "guild", None)
+    entry = tracker.current()
+    job_id = await broker.put("generate", {
+        # Work shared by several commands is already journaled under its own key.
+        "job": entry.job if entry is not None and entry.job else uuid.uuid4().hex,
+        "command": _command(entry),
+        "user_id": ctx.author.id,
+        "model": model,
+        "input": model_input,
+        "channel_id": ctx.channel.id,
+        "guild_id": guild.id if guild is not None else None,
+        "upload_limit": upload_limit(ctx),
+        "caption": caption,
+        "filenames": [filename(i) for i in range(1, MAX_ATTACHMENTS + 1)],
+        "preview": preview,
+        "post": WORKER_POST,
+    })
+    try:
+        result = await broker.result(job_id)
+    except asyncio.CancelledError:
+        task = asyncio.create_task(broker.cancel(job_id))
+        _cancels.add(task)
+        task.add_done_callback(_cancels.discard)
+        raise
+    if "urls" in result:
+        return result["urls"]
+    # WORKER_POST=gateway: post the files the worker left in the spool.
+    files = []
+    try:
+        for name, path in result["files"]:
+            files.append((name, await OutputBuffer.load(path)))
+    except BaseException:
+        for _, buffer in files:
+            buffer.release()
+        raise
+    finally:
+        for _, path in result["files"]:
+            _remove(path)
+    return await publish(ctx, caption, files, preview)
+
+def _command(entry):
+    # The fields of the command running in this task, for the worker's journal.
+    if entry is None:
+        return None
+    return {
+        "user_id": entry.user_id, "message_id": entry.message_id,
+        "name": entry.name, "cog": entry.cog, "args": list(entry.args),
+        "channel_id": entry.channel_id, "guild_id": entry.guild_id, "kind": entry.kind,
+    }
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        log.warning("Could not remove spooled output %s: %s", path, e)
+
+async def run_generate(client, payload):
+    """A "generate" job, on a worker: predict, download, post-process and post (or spool)."""
+    if payload.get("command"):
+        tracker.act_for(payload["command"], payload["job"])
+    outputs = await _predict(payload)
+    buffers = await download_all(outputs)
+    files = list(zip(payload["filenames"], buffers))
+    for buffer in buffers[len(files):]:
+        buffer.release()
+    if not files:
+        raise RuntimeError("No output generated.")
+    if payload["post"] != "gateway":
+        channel = client.get_partial_messageable(
+            payload["channel_id"], guild_id=payload["guild_id"]
+        )
+        urls = await publish(channel, payload["caption"], files, payload["preview"],
+                             max_bytes=payload["upload_limit"])
+        # Posted: nothing left for a gateway restart to resume.
+        await journal.forget_job(payload["job"])
+        return {"urls": urls}
+
+    os.makedirs(WORKER_SPOOL_DIR, exist_ok=True)
+    spooled = []
+    try:
+        files = await postprocess.process_all(
+            files, payload["upload_limit"], payload["preview"]
+        )
+        for name, buffer in files:
+            path = os.path.join(WORKER_SPOOL_DIR, f"{uuid.uuid4().hex}-{name}")
+            await buffer.save(path)
+            spooled.append((name, path))
+    except BaseException:
+        for _, path in spooled:
+            _remove(path)
+        raise
+    finally:
+        for _, buffer in files:
+            buffer.release()
+    return {"files": spooled}
+
+async def _predict(payload):
+    # A job handed over from a worker that died may have its prediction
+    # running already: wait for that one instead of paying for another.
+    prediction_id = await journal.find(payload["job"])
+    if prediction_id is not None:
+        log.info("Job %s: waiting for its journaled prediction %s",
+                 payload["job"], prediction_id)
+        output = await predictions.attach(prediction_id)
+        if output is not None:
+            return output
+    return await run_model(payload["model"], payload["input"])
+
+HANDLERS = {"generate": run_generate}
+
+class Worker:
+    """
+    Runs jobs from the broker, concurrency at a time. client is what outputs
+    are posted through: a logged-in discord.Client (REST only is enough), or
+    the bot itself for workers in the gateway process.
+    """
+
+    def __init__(self, client, name, concurrency=WORKER_CONCURRENCY, broker=broker):
+        self.client = client
+        self.name = name
+        self.concurrency = concurrency
+        self.broker = broker
+
+    async def run(self):
+        await asyncio.gather(*(self._loop() for _ in range(self.concurrency)))
+
+    async def _loop(self):
+        while True:
+            job = await self.broker.claim(self.name, CLAIM_TIMEOUT)
+            if job is not None:
+                await self._run(*job)
+
+    async def _run(self, job_id, kind, payload):
+        handler = HANDLERS.get(kind)
+        if handler is None:
+            await self.broker.complete(job_id, error=f"Unknown job kind {kind!r}")
+            return
+        task = asyncio.create_task(handler(self.client, payload))
+        renew_every = min(BROKER_LEASE / 3, 2)
+        try:
+            while True:
+                done, _ = await asyncio.wait([task], timeout=renew_every)
+                if done:
+                    break
+                if not await self.broker.renew(job_id, self.name):
+                    # Cancelled by the gateway (or handed to another worker).
+                    task.cancel()
+                    await asyncio.wait([task])
+                    WORKER_JOBS.inc(kind=kind, outcome="cancelled")
+                    return
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if task.cancelled():
+            WORKER_JOBS.inc(kind=kind, outcome="cancelled")
+            return
+        error = task.exception()
+        if error is not None:
+            log.warning("Job %s (%s) failed: %s", job_id, kind, error)
+            WORKER_JOBS.inc(kind=kind, outcome="error")
+            await self.broker.complete(job_id, error=str(error))
+        else:
+            WORKER_JOBS.inc(kind=kind, outcome="ok")
+            await self.broker.complete(job_id, result=task.result())
@@ -0,0 +1,84 @@
+# worker.py
+"""
+Worker processes for BOT_MODE=gateway (see utils/workers.py): each runs
+generation jobs from the broker (predictions, downloads, post-processing)
+and posts the outputs over Discord's REST API.
+
+    BOT_MODE=gateway python bot.py    # the gateway: commands and status messages
+    python worker.py                  # WORKER_PROCESSES workers, on this machine
+
+Workers share the gateway's SQLite store (DATABASE_PATH) and broker, so run
+them from the same directory with the same environment.
+"""
+import os
+import signal
+import socket
+import asyncio
+import logging
+import multiprocessing
+from dotenv import load_dotenv
+import discord
+from utils import downloads, postprocess, predictions
+from utils.broker import broker
+from utils.journal import journal
+from utils.storage import store
+from utils.model_registry import registry, prewarm_models
+from utils.workers import Worker, WORKER_PROCESSES, WORKER_POST
+
+log = logging.getLogger("worker")
+
+async def run(name):
+    client = discord.Client(intents=discord.Intents.none())
+    try:
+        # REST only: a worker never opens a gateway connection.
+        if WORKER_POST == "rest":
+            await client.login(os.environ["DISCORD_TOKEN"])
+        # Webhooks are delivered to the gateway's web server, which has no one
+        # waiting on a worker's predictions: poll them from here instead.
+        predictions.disable_webhooks()
+        # Only pinned versions are used here (registry.target()); cache keys are the gateway's.
+        registry.start([ref for ref in prewarm_models if ":" in ref])
+        log.info("Worker %s ready", name)
+        await Worker(client, name).run()
+    finally:
+        await client.close()
+        await broker.close()
+        await registry.close()
+        await downloads.close()
+        postprocess.close()
+        await store.close()
+
+def shutdown(signum, frame):
+    # Stop (and clean up) on SIGTERM as on Ctrl+C. Predictions are left running
+    # on Replicate: jobs cut short go back on the broker's queue when their
+    # lease runs out, and the next worker waits for the journaled prediction.
+    journal.close()
+    raise KeyboardInterrupt
+
+def work(name):
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(run(name))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    names = [f"{socket.gethostname()}-{os.getpid()}-{n}" for n in range(1, WORKER_PROCESSES + 1)]
+    if len(names) == 1:
+        work(names[0])
+    else:
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=work, args=(name,), name=name) for name in names]
+        for process in processes:
+            process.start()
+
+        def stop(signum, frame):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        for process in processes:
+            process.join()